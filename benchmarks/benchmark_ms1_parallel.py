@@ -0,0 +1,115 @@
+#!/usr/bin/env python3
+"""Compare scan generation with MS1 scans generated in a process pool.
+
+Also times the scheduling of the duty cycles alone (MS1 summaries, precursor
+selection and MS2 scans), which stays in the calling process and bounds the
+speedup.
+
+usage:
+    ./benchmark_ms1_parallel.py [number_of_molecules] [gradient_length] [max_processes]
+"""
+import sys
+import time
+
+import numpy as np
+
+from smiter.fragmentation_functions import AbstractFragmentor
+from smiter.lib import PeakTable, check_mzml_params
+from smiter.noise_functions import GaussNoiseInjector
+from smiter.synthetic_mzml import (
+    _generate_scan_cycles,
+    generate_elution_profiles,
+    generate_elution_scheduler,
+    generate_time_grid,
+    iter_scans,
+    stack_isotopologue_lib,
+)
+
+
+class BenchmarkFragmentor(AbstractFragmentor):
+    def __init__(self):
+        pass
+
+    def fragment(self, mol):
+        return np.array([(200.0, 1e5), (300.0, 5e4)])
+
+
+def isotopologue_lib(number_of_molecules, rng):
+    """Decaying isotope envelopes of 2 charge states per molecule."""
+    lib = {}
+    for n in range(number_of_molecules):
+        mass = rng.uniform(500, 4000)
+        n_peaks = 4 + int(mass / 500)
+        abundance = np.exp(-0.5 * (np.arange(n_peaks) - mass / 1800) ** 2)
+        mz = []
+        for charge in (2, 3):
+            mz.extend((mass + np.arange(n_peaks) * 1.00335 + charge) / charge)
+        lib[f"mol_{n}"] = {
+            "mz": mz,
+            "i": np.concatenate((abundance * 0.7, abundance * 0.3)),
+            "charge": [2] * n_peaks + [3] * n_peaks,
+        }
+    return lib
+
+
+def main(number_of_molecules=20000, gradient_length=600, max_processes=4):
+    number_of_molecules = int(number_of_molecules)
+    gradient_length = float(gradient_length)
+    max_processes = int(max_processes)
+    rng = np.random.default_rng(1312)
+    lib = isotopologue_lib(number_of_molecules, rng)
+    peak_properties = {
+        mol: {
+            "scan_start_time": rng.uniform(-30, gradient_length),
+            "peak_width": rng.uniform(10, 60),
+            "peak_function": "gauss",
+            "peak_params": {"sigma": 3},
+            "peak_scaling_factor": rng.lognormal(10, 2),
+        }
+        for mol in lib
+    }
+    mzml_params = check_mzml_params({"gradient_length": gradient_length})
+    print(f"{number_of_molecules} molecules, {gradient_length} s gradient")
+
+    time_grid = generate_time_grid(gradient_length, mzml_params["ms_rt_diff"])
+    peak_table = PeakTable.from_dict(peak_properties)
+    stacked_lib = stack_isotopologue_lib(lib)
+    molecules = stacked_lib["molecules"]
+    elution_profiles = generate_elution_profiles(peak_table, molecules, time_grid)
+    scheduler = generate_elution_scheduler(peak_table, molecules, time_grid)
+    t0 = time.time()
+    cycles = _generate_scan_cycles(
+        peak_table,
+        BenchmarkFragmentor(),
+        mzml_params,
+        time_grid,
+        stacked_lib,
+        elution_profiles,
+        scheduler,
+        {mol: {"ms1_scans": [], "ms2_scans": []} for mol in molecules},
+        merge_ms1=False,
+    )
+    number_of_cycles = sum(1 for _ in cycles)
+    t1 = time.time()
+    print(f"scheduling only       {t1 - t0:6.2f} s ({number_of_cycles} MS1 scans)")
+
+    n_processes = 1
+    while n_processes <= max_processes:
+        mzml_params["n_processes"] = n_processes
+        t0 = time.time()
+        for _ in iter_scans(
+            lib,
+            peak_properties,
+            None,
+            BenchmarkFragmentor(),
+            GaussNoiseInjector(variance=0.05, seed=1312),
+            mzml_params,
+        ):
+            pass
+        t1 = time.time()
+        print(f"{n_processes} processes           {t1 - t0:6.2f} s")
+        n_processes *= 2
+
+
+if __name__ == "__main__":
+    main(*sys.argv[1:])
@@ -0,0 +1,84 @@
+#!/usr/bin/env python3
+"""Compare file size and write throughput of mzML binary array settings, mzMLb
+and Parquet.
+
+usage:
+    ./benchmark_mzml_encoding.py [number_of_scans] [peaks_per_scan] [n_processes]
+"""
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+from smiter.synthetic_mzml import Scan, write_scans
+
+SETTINGS = {
+    "uncompressed 64/64": {
+        "intensity_encoding": 64,
+        "mz_compression": "none",
+        "intensity_compression": "none",
+    },
+    "uncompressed 64/32": {"mz_compression": "none", "intensity_compression": "none"},
+    "zlib 64/32 (default)": {},
+    "zlib 32/32": {"mz_encoding": 32},
+    "numpress linear/slof": {
+        "mz_compression": "numpress_linear",
+        "intensity_compression": "numpress_slof",
+    },
+    "numpress linear/pic": {
+        "mz_compression": "numpress_linear",
+        "intensity_compression": "numpress_pic",
+    },
+    "numpress linear+zlib/slof+zlib": {
+        "mz_compression": "numpress_linear_zlib",
+        "intensity_compression": "numpress_slof_zlib",
+    },
+    "mzMLb zlib 64/32": {},
+    "mzMLb zlib 32/32": {"mz_encoding": 32},
+    "parquet 64/32": {},
+}
+
+
+def main(number_of_scans=2000, peaks_per_scan=1000, n_processes=1):
+    number_of_scans = int(number_of_scans)
+    peaks_per_scan = int(peaks_per_scan)
+    n_processes = int(n_processes)
+    rng = np.random.default_rng(1312)
+    scans = [
+        (
+            Scan(
+                {
+                    "mz": np.sort(rng.uniform(100, 1600, peaks_per_scan)),
+                    "i": rng.lognormal(10, 2, peaks_per_scan),
+                    "id": n + 1,
+                    "rt": n * 0.03,
+                    "ms_level": 1,
+                }
+            ),
+            [],
+        )
+        for n in range(number_of_scans)
+    ]
+    print(
+        f"{number_of_scans} scans, {peaks_per_scan} peaks per scan, "
+        f"{n_processes} encoding processes"
+    )
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        for name, settings in SETTINGS.items():
+            extension = name.split()[0]
+            if extension not in ("mzMLb", "parquet"):
+                extension = "mzML"
+            path = os.path.join(tmp_dir, f"benchmark.{extension}")
+            t0 = time.time()
+            write_scans(path, scans, n_processes=n_processes, **settings)
+            t1 = time.time()
+            size = os.path.getsize(path) / 1024**2
+            print(
+                f"{name:<32} {size:8.1f} MB {number_of_scans / (t1 - t0):8.0f} scans/s"
+            )
+
+
+if __name__ == "__main__":
+    main(*sys.argv[1:])
@@ -0,0 +1,62 @@
+#!/usr/bin/env python3
+"""Compare IntervalTree lookups with the sweep-line ElutionScheduler.
+
+usage:
+    ./benchmark_scheduler.py [number_of_molecules] [gradient_length] [ms_rt_diff]
+"""
+import sys
+import time
+
+import numpy as np
+
+from smiter.synthetic_mzml import (
+    ElutionScheduler,
+    generate_interval_tree,
+    generate_time_grid,
+)
+
+
+def main(number_of_molecules=100000, gradient_length=7200, ms_rt_diff=0.06):
+    number_of_molecules = int(number_of_molecules)
+    gradient_length = float(gradient_length)
+    ms_rt_diff = float(ms_rt_diff)
+    rng = np.random.default_rng(1312)
+    start = rng.uniform(0, gradient_length, number_of_molecules)
+    width = rng.uniform(10, 60, number_of_molecules)
+    peak_properties = {
+        f"mol_{n}": {"scan_start_time": start[n], "peak_width": width[n]}
+        for n in range(number_of_molecules)
+    }
+    molecule_index = {mol: n for n, mol in enumerate(peak_properties)}
+    time_grid = generate_time_grid(gradient_length, ms_rt_diff)
+    time_grid = time_grid[time_grid < gradient_length]
+    print(f"{number_of_molecules} molecules, {len(time_grid)} scans")
+
+    t0 = time.time()
+    tree = generate_interval_tree(peak_properties)
+    t1 = time.time()
+    tree_candidates = 0
+    for t in time_grid:
+        tree_candidates += len(
+            np.sort(
+                np.fromiter(
+                    (molecule_index[iv.data] for iv in tree.at(t)), dtype=np.int64
+                )
+            )
+        )
+    t2 = time.time()
+    print(f"IntervalTree: build {t1 - t0:.2f} s, lookup {t2 - t1:.2f} s")
+
+    t0 = time.time()
+    scheduler = ElutionScheduler.from_windows(start, start + width, time_grid)
+    t1 = time.time()
+    scheduler_candidates = 0
+    for scan_index in range(len(time_grid)):
+        scheduler_candidates += len(scheduler.advance(scan_index))
+    t2 = time.time()
+    print(f"ElutionScheduler: build {t1 - t0:.2f} s, lookup {t2 - t1:.2f} s")
+    assert tree_candidates == scheduler_candidates
+
+
+if __name__ == "__main__":
+    main(*sys.argv[1:])
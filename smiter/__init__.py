@@ -4,13 +4,42 @@ __author__ = """Manuel Kösters"""
 __email__ = "manuel.koesters@dcb.unibe.ch"
 __version__ = "0.1.0"
 
+import importlib
 import os
 import sys
 import tempfile
 
 from loguru import logger
 
-import smiter.synthetic_mzml
+# submodules are imported on first attribute access (PEP 562), so
+# `import smiter` does not load pyqms, psims, scipy etc.
+_submodules = {
+    "cli",
+    "ext",
+    "fragment_intensity",
+    "fragmentation_functions",
+    "lib",
+    "mzmlb",
+    "noise_functions",
+    "numpress",
+    "params",
+    "parquet",
+    "peak_distribution",
+    "synthetic_mzml",
+}
+
+
+def __getattr__(name):
+    """Import submodule name on first access."""
+    if name in _submodules:
+        return importlib.import_module(f"smiter.{name}")
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+def __dir__():
+    """Return module attributes including the lazily loaded submodules."""
+    return sorted(set(globals()) | _submodules)
+
 
 config = {
     "handlers": [
@@ -0,0 +1,239 @@
+"""Models for the intensities of fragment ions.
+
+An intensity model gets the fragments of one fragmentation event as dict of
+arrays with one entry per fragment and returns all intensities at once.
+Every fragmentor provides the keys "mz" and "molecule" (name of the fragmented
+molecule), PeptideFragmentorPyteomics additionally annotates "ion_type",
+"charge", "n_residues" (number of residues in the fragment) and the residues
+left and right of the cleavage site ("n_side_residue" and "c_side_residue").
+"""
+import csv
+from abc import ABC, abstractmethod
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+from loguru import logger
+
+
+class AbstractIntensityModel(ABC):
+    """Summary."""
+
+    required_annotations: Tuple[str, ...] = ("mz", "molecule")
+
+    @abstractmethod
+    def intensities(self, fragments: Dict[str, np.ndarray]) -> np.ndarray:
+        """Calculate the intensity of every fragment.
+
+        Args:
+            fragments (Dict[str, np.ndarray]): fragment annotations
+
+        Returns:
+            np.ndarray: intensity of every fragment
+        """
+        pass  # pragma: no cover
+
+    def check_annotations(self, fragments: Dict[str, np.ndarray]):
+        """Raise an Exception if fragments lack an annotation of the model.
+
+        Args:
+            fragments (Dict[str, np.ndarray]): fragment annotations
+
+        Raises:
+            Exception: if an annotation in required_annotations is missing
+        """
+        missing = [key for key in self.required_annotations if key not in fragments]
+        if len(missing) > 0:
+            raise Exception(
+                f"{type(self).__name__} needs the fragment annotations {missing}"
+            )
+
+
+class FlatIntensityModel(AbstractIntensityModel):
+    """Same intensity for all fragments."""
+
+    def __init__(self, intensity: float = 100):
+        """Summary.
+
+        Args:
+            intensity (float, optional): intensity of every fragment
+        """
+        self.intensity = intensity
+
+    def intensities(self, fragments: Dict[str, np.ndarray]) -> np.ndarray:
+        """Calculate the intensity of every fragment.
+
+        Args:
+            fragments (Dict[str, np.ndarray]): fragment annotations
+
+        Returns:
+            np.ndarray: intensity of every fragment
+        """
+        return np.full(len(fragments["mz"]), self.intensity, dtype=float)
+
+
+class PeptideIntensityModel(AbstractIntensityModel):
+    """Residue and position heuristic for peptide fragment intensities.
+
+    Intensities are weighted by ion type and suppressed for short fragments
+    and higher charges. Cleavage N-terminal of proline and C-terminal of
+    aspartic acid is enhanced. The base peak of every molecule is scaled to
+    base_peak.
+    """
+
+    required_annotations = (
+        "mz",
+        "molecule",
+        "ion_type",
+        "charge",
+        "n_residues",
+        "n_side_residue",
+        "c_side_residue",
+    )
+
+    def __init__(
+        self,
+        ion_type_weights: Optional[Dict[str, float]] = None,
+        proline_effect: float = 5.0,
+        aspartate_effect: float = 3.0,
+        short_fragment_length: int = 3,
+        charge_decay: float = 0.5,
+        base_peak: float = 100,
+    ):
+        """Summary.
+
+        Args:
+            ion_type_weights (Dict[str, float], optional): weight of every ion
+                type, ion types not given are weighted 0.3
+            proline_effect (float, optional): enhancement of cleavage
+                N-terminal of proline
+            aspartate_effect (float, optional): enhancement of cleavage
+                C-terminal of aspartic acid
+            short_fragment_length (int, optional): fragments with fewer
+                residues are suppressed linearly
+            charge_decay (float, optional): factor per additional charge
+            base_peak (float, optional): intensity of the highest fragment of
+                every molecule
+        """
+        if ion_type_weights is None:
+            ion_type_weights = {"y": 1.0, "b": 0.6, "a": 0.2}
+        self.ion_type_weights = ion_type_weights
+        self.proline_effect = proline_effect
+        self.aspartate_effect = aspartate_effect
+        self.short_fragment_length = short_fragment_length
+        self.charge_decay = charge_decay
+        self.base_peak = base_peak
+
+    def intensities(self, fragments: Dict[str, np.ndarray]) -> np.ndarray:
+        """Calculate the intensity of every fragment.
+
+        Args:
+            fragments (Dict[str, np.ndarray]): fragment annotations
+
+        Returns:
+            np.ndarray: intensity of every fragment
+        """
+        self.check_annotations(fragments)
+        if len(fragments["mz"]) == 0:
+            return np.array([])
+        ion_types, ion_type_index = np.unique(
+            fragments["ion_type"], return_inverse=True
+        )
+        weights = np.array([self.ion_type_weights.get(t, 0.3) for t in ion_types])
+        i = weights[ion_type_index]
+        i = i * np.where(fragments["c_side_residue"] == "P", self.proline_effect, 1)
+        i = i * np.where(fragments["n_side_residue"] == "D", self.aspartate_effect, 1)
+        i = i * (
+            np.minimum(fragments["n_residues"], self.short_fragment_length)
+            / self.short_fragment_length
+        )
+        i = i * self.charge_decay ** (np.asarray(fragments["charge"]) - 1)
+
+        _, owner = np.unique(fragments["molecule"], return_inverse=True)
+        base_peak = np.zeros(owner.max() + 1)
+        np.maximum.at(base_peak, owner, i)
+        return i / base_peak[owner] * self.base_peak
+
+
+class IntensityTableModel(AbstractIntensityModel):
+    """Look up fragment intensities in a precomputed table.
+
+    Fragments are matched to the closest table entry of their molecule within
+    tolerance, unmatched fragments get default_intensity.
+    """
+
+    def __init__(
+        self,
+        table: Dict[str, Tuple[List[float], List[float]]],
+        tolerance: float = 0.005,
+        default_intensity: float = 0,
+    ):
+        """Summary.
+
+        Args:
+            table (Dict[str, Tuple[List[float], List[float]]]): fragment mz and
+                intensities of every molecule
+            tolerance (float, optional): maximal mz difference of a match
+            default_intensity (float, optional): intensity of unmatched fragments
+        """
+        self.table: Dict[str, Tuple[np.ndarray, np.ndarray]] = {}
+        for mol, (mz, i) in table.items():
+            table_mz = np.asarray(mz, dtype=float)
+            order = np.argsort(table_mz, kind="stable")
+            self.table[mol] = (table_mz[order], np.asarray(i, dtype=float)[order])
+        self.tolerance = tolerance
+        self.default_intensity = default_intensity
+
+    @classmethod
+    def from_csv(cls, file: str, **kwargs) -> "IntensityTableModel":
+        """Read table from a csv file with columns molecule, mz and intensity.
+
+        Args:
+            file (str): path to csv file
+            **kwargs: passed to IntensityTableModel
+
+        Returns:
+            IntensityTableModel: model with the fragments in file
+        """
+        table: Dict[str, Tuple[List[float], List[float]]] = {}
+        with open(file) as fin:
+            for line in csv.DictReader(fin):
+                mz, i = table.setdefault(line["molecule"], ([], []))
+                mz.append(float(line["mz"]))
+                i.append(float(line["intensity"]))
+        logger.info(f"Read fragment intensities of {len(table)} molecules")
+        return cls(table, **kwargs)
+
+    def intensities(self, fragments: Dict[str, np.ndarray]) -> np.ndarray:
+        """Calculate the intensity of every fragment.
+
+        Args:
+            fragments (Dict[str, np.ndarray]): fragment annotations
+
+        Returns:
+            np.ndarray: intensity of every fragment
+        """
+        self.check_annotations(fragments)
+        mz = np.asarray(fragments["mz"], dtype=float)
+        i = np.full(len(mz), self.default_intensity, dtype=float)
+        if len(mz) == 0:
+            return i
+        molecules, owner = np.unique(fragments["molecule"], return_inverse=True)
+        for n, mol in enumerate(molecules):
+            if mol not in self.table:
+                continue
+            table_mz, table_i = self.table[mol]
+            if len(table_mz) == 0:
+                continue
+            selected = np.flatnonzero(owner == n)
+            position = np.searchsorted(table_mz, mz[selected])
+            right = np.minimum(position, len(table_mz) - 1)
+            left = np.maximum(position - 1, 0)
+            closest = np.where(
+                np.abs(table_mz[left] - mz[selected])
+                <= np.abs(table_mz[right] - mz[selected]),
+                left,
+                right,
+            )
+            matched = np.abs(table_mz[closest] - mz[selected]) <= self.tolerance
+            i[selected[matched]] = table_i[closest[matched]]
+        return i
@@ -4,34 +4,46 @@ Upon calling the callabe, a list/np.array of mz and intensities should be return
 Arguments should be passed via *args and **kwargs
 """
 from abc import ABC, abstractmethod
-from typing import Dict, List, Tuple, Union
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List, Optional, Tuple, Union
 import sys
 import shutil
 import subprocess
 import os
 import csv
+import hashlib
+import importlib.metadata
+import importlib.util
+import pathlib
+import tempfile
 
 import numpy as np
-import pandas as pd
-import pyqms
 from loguru import logger
-from pyteomics import mass
 
 import smiter
-from peptide_fragmentor import PeptideFragment0r
-from smiter.ext.nucleoside_fragment_kb import (
-    KB_FRAGMENTATION_INFO as pyrnams_nucleoside_fragment_kb,
-)
+from smiter.fragment_intensity import AbstractIntensityModel
 from smiter.lib import calc_mz
 
-try:
-    from smiter.ext.nucleoside_fragment_kb import KB_FRAGMENTATION_INFO
-except ImportError:  # pragma: no cover
-    print("Nucleoside fragmentation KB not available")  # pragma: no cover
+_nucleoside_fragment_tables: Dict[str, Dict[str, np.ndarray]] = {}
 
 
 class AbstractFragmentor(ABC):
-    """Summary."""
+    """Summary.
+
+    fragment_cached keeps the last fragment_cache_size fragment spectra of a
+    fragmentor in a LRU cache, keyed by the sorted tuple of fragmented
+    molecules. Set fragment_cache_size to 0 to disable the cache.
+
+    Fragment intensities are calculated by intensity_model, see
+    smiter.fragment_intensity. Without model every fragmentor uses a constant
+    intensity.
+    """
+
+    fragment_cache_size: int = 1024
+    fragment_cache_hits: int = 0
+    fragment_cache_misses: int = 0
+    intensity_model: AbstractIntensityModel = None
 
     @abstractmethod
     def __init__(self):
@@ -47,16 +59,160 @@ class AbstractFragmentor(ABC):
         """
         pass  # pragma: no cover
 
+    def precompute(self, entities: List[str], n_processes: int = 1):
+        """Prepare the fragment spectra of all entities before scans are generated.
+
+        Fragmentors without precomputation ignore this.
+
+        Args:
+            entities (List[str]): all molecules that might be fragmented
+            n_processes (int, optional): number of processes to use
+        """
+        pass
+
+    def fragment_cached(self, entities: Union[list, str]) -> np.ndarray:
+        """Fragment entities, reusing the spectrum of an earlier call if possible.
+
+        Args:
+            entities (Union[list, str]): molecules fragmented together
+
+        Returns:
+            np.ndarray: copy of the mz and intensity array returned by fragment
+        """
+        if isinstance(entities, str):
+            entities = [entities]
+        if self.fragment_cache_size <= 0:
+            self.fragment_cache_misses += 1
+            return self.fragment(entities)
+        cache = self.__dict__.setdefault("_fragment_cache", OrderedDict())
+        key = tuple(sorted(entities))
+        peaks = cache.get(key, None)
+        if peaks is None:
+            self.fragment_cache_misses += 1
+            peaks = np.array(self.fragment(entities))
+            cache[key] = peaks
+            while len(cache) > self.fragment_cache_size:
+                cache.popitem(last=False)
+        else:
+            self.fragment_cache_hits += 1
+            cache.move_to_end(key)
+        return peaks.copy()
+
+    def clear_fragment_cache(self):
+        """Remove all cached fragment spectra."""
+        self.__dict__.pop("_fragment_cache", None)
+
+    def _fragment_intensities(
+        self, fragments: Dict[str, np.ndarray], default_intensity: float
+    ) -> np.ndarray:
+        """Intensities of fragments according to intensity_model.
+
+        Args:
+            fragments (Dict[str, np.ndarray]): fragment annotations, see
+                smiter.fragment_intensity
+            default_intensity (float): intensity of all fragments without model
+
+        Returns:
+            np.ndarray: intensity of every fragment
+        """
+        if self.intensity_model is None:
+            return np.full(len(fragments["mz"]), default_intensity)
+        return self.intensity_model.intensities(fragments)
+
+
+def _unique_fragments(fragments: Dict[str, np.ndarray], i: np.ndarray) -> np.ndarray:
+    """Merge fragments with the same mz, keeping the highest intensity.
+
+    Args:
+        fragments (Dict[str, np.ndarray]): fragment annotations
+        i (np.ndarray): intensity of every fragment
+
+    Returns:
+        np.ndarray: mz and intensity of the unique fragments, sorted by mz
+    """
+    mz, index = np.unique(fragments["mz"], return_inverse=True)
+    unique_i = np.zeros(len(mz))
+    np.maximum.at(unique_i, index, i)
+    return np.stack((mz, unique_i), axis=1)
+
+
+def _fragment_peptides(peptides: List[str], kwargs: dict) -> Dict[str, np.ndarray]:
+    """Fragment mz of peptides, used by PeptideFragmentor.precompute.
+
+    Args:
+        peptides (List[str]): peptide sequences
+        kwargs (dict): keyword arguments of PeptideFragment0r.fragment
+
+    Returns:
+        Dict[str, np.ndarray]: fragment mz of every peptide
+    """
+    from peptide_fragmentor import PeptideFragment0r
+
+    fragger = PeptideFragment0r()
+    return {
+        peptide: fragger.fragment(peptide, **kwargs)["mz"].to_numpy(dtype=float)
+        for peptide in peptides
+    }
+
 
 class PeptideFragmentor(AbstractFragmentor):
-    """Summary."""
+    """Summary.
+
+    The fragment mz of all peptides can be computed up front with precompute,
+    fragment then only slices the stored mz arrays.
+    """
+
+    def __init__(self, *args, intensity_model: AbstractIntensityModel = None, **kwargs):
+        """Summary.
+
+        Args:
+            *args: Description
+            intensity_model (AbstractIntensityModel, optional): fragment
+                intensity model, all fragments have intensity 100 if None
+            **kwargs: passed to PeptideFragment0r.fragment
+        """
+        from peptide_fragmentor import PeptideFragment0r
 
-    def __init__(self, *args, **kwargs):
-        """Summary."""
         logger.info("Initialize PeptideFragmentor")
         self.args = args
         self.kwargs = kwargs
+        self.intensity_model = intensity_model
         self.fragger = PeptideFragment0r()
+        self._precomputed_index: Dict[str, int] = {}
+        self._precomputed_offsets = np.zeros(1, dtype=np.int64)
+        self._precomputed_mz = np.array([])
+
+    def precompute(self, entities: List[str], n_processes: int = 1):
+        """Fragment all peptides and store the fragment mz in one array.
+
+        The fragment mz of peptide n are stored in mz[offsets[n]:offsets[n + 1]].
+
+        Args:
+            entities (List[str]): peptide sequences
+            n_processes (int, optional): number of processes to use
+        """
+        peptides = list(dict.fromkeys(entities))
+        logger.info(f"Precompute fragments of {len(peptides)} peptides")
+        if n_processes > 1 and len(peptides) > 1:
+            n_shards = min(len(peptides), 4 * n_processes)
+            shards = [peptides[n::n_shards] for n in range(n_shards)]
+            fragments: Dict[str, np.ndarray] = {}
+            with ProcessPoolExecutor(max_workers=n_processes) as executor:
+                for shard_fragments in executor.map(
+                    _fragment_peptides, shards, [self.kwargs] * n_shards
+                ):
+                    fragments.update(shard_fragments)
+        else:
+            fragments = _fragment_peptides(peptides, self.kwargs)
+        offsets = np.zeros(len(peptides) + 1, dtype=np.int64)
+        np.cumsum([len(fragments[peptide]) for peptide in peptides], out=offsets[1:])
+        self._precomputed_index = {peptide: n for n, peptide in enumerate(peptides)}
+        self._precomputed_offsets = offsets
+        self._precomputed_mz = (
+            np.concatenate([fragments[peptide] for peptide in peptides])
+            if len(peptides) > 0
+            else np.array([])
+        )
 
     # @profile
     def fragment(self, entities):
@@ -67,73 +223,350 @@ class PeptideFragmentor(AbstractFragmentor):
         """
         if isinstance(entities, str):
             entities = [entities]
-        frames = []
+        mz_arrays = []
         for entity in entities:
-            # logger.debug(f"Fragment {entity}")
-            results_table = self.fragger.fragment(entity, **self.kwargs)
-            frames.append(results_table)
-        final_table = pd.concat(frames)
-        i = np.array([100 for i in range(len(final_table))])
-        mz_i = np.stack((final_table["mz"], i), axis=1)
+            n = self._precomputed_index.get(entity, None)
+            if n is None:
+                # logger.debug(f"Fragment {entity}")
+                results_table = self.fragger.fragment(entity, **self.kwargs)
+                mz_arrays.append(results_table["mz"].to_numpy(dtype=float))
+            else:
+                start, end = self._precomputed_offsets[n : n + 2]
+                mz_arrays.append(self._precomputed_mz[start:end])
+        fragments = {
+            "mz": np.concatenate(mz_arrays) if len(mz_arrays) > 0 else np.array([]),
+            "molecule": np.repeat(
+                np.array(entities, dtype=object), [len(a) for a in mz_arrays]
+            ),
+        }
+        i = self._fragment_intensities(fragments, 100)
+        mz_i = np.stack((fragments["mz"], i), axis=1)
         return mz_i
 
 
 class PeptideFragmentorPyteomics(AbstractFragmentor):
-    def __init__(self, *args, **kwargs):
-        pass
+    """Fragment peptides into ion ladders using pyteomics masses.
 
-    # @profile
-    def _fragments(self, peptide, types=("b", "y"), maxcharge=1):
-        for i in range(1, len(peptide) - 1):
-            for ion_type in types:
-                for charge in range(1, maxcharge + 1):
-                    if ion_type[0] in "abc":
-                        yield mass.fast_mass(
-                            peptide[:i], ion_type=ion_type, charge=charge
-                        )
-                    else:
-                        yield mass.fast_mass(
-                            peptide[i:], ion_type=ion_type, charge=charge
-                        )
+    Fragment mz are computed as cumulative sums over the residue masses of a
+    peptide, like pyteomics.mass.fast_mass does for a single fragment. Ladders
+    start at the second and end at the second to last residue. The ladders of
+    known peptides can be computed up front into one CSR-style array, see
+    precompute. Fragments are annotated with ion type, charge, length and the
+    residues at the cleavage site for the intensity model.
+    """
 
-    # @profile
-    def fragment(self, entities):
+    def __init__(
+        self,
+        types: Tuple[str, ...] = ("b", "y"),
+        maxcharge: int = 1,
+        intensity_model: AbstractIntensityModel = None,
+    ):
+        """Summary.
+
+        Args:
+            types (Tuple[str, ...], optional): ion types, a, b and c ions are
+                N-terminal, all other C-terminal fragments
+            maxcharge (int, optional): fragments are charged from 1 to maxcharge
+            intensity_model (AbstractIntensityModel, optional): fragment
+                intensity model, all fragments have intensity 100 if None
+        """
+        from pyteomics import mass
+
+        logger.info("Initialize PeptideFragmentorPyteomics")
+        self.types = tuple(types)
+        self.maxcharge = maxcharge
+        self.intensity_model = intensity_model
+        self._charges = np.arange(1, maxcharge + 1)
+        self._residue_mass = np.full(256, np.nan)
+        for aa, aa_mass in mass.std_aa_mass.items():
+            if len(aa) == 1:
+                self._residue_mass[ord(aa)] = aa_mass
+        self._water = mass.nist_mass["H"][0][0] * 2 + mass.nist_mass["O"][0][0]
+        self._proton = mass.nist_mass["H+"][0][0]
+        self._ion_shift = np.array(
+            [
+                sum(
+                    mass.nist_mass[element][0][0] * num
+                    for element, num in mass.std_ion_comp[ion_type].items()
+                )
+                for ion_type in self.types
+            ]
+        )
+        self._n_terminal = np.array([ion_type[0] in "abc" for ion_type in self.types])
+        self._precomputed_index: Dict[str, int] = {}
+        self._precomputed_offsets = np.zeros(1, dtype=np.int64)
+        self._precomputed_mz = np.array([])
+        self._precomputed_i = np.array([])
+
+    def _ladder(self, peptide: str) -> np.ndarray:
+        """Fragment mz of a peptide.
+
+        Args:
+            peptide (str): peptide sequence in one letter code
+
+        Returns:
+            np.ndarray: mz ordered by fragmentation site, ion type and charge
+
+        Raises:
+            PyteomicsError: if a residue has no mass
+        """
+        residues = self._residue_mass[
+            np.frombuffer(peptide.encode("latin-1"), dtype=np.uint8)
+        ]
+        if np.isnan(residues).any():
+            from pyteomics.auxiliary import PyteomicsError
+
+            raise PyteomicsError(f"No mass data for a residue of {peptide}")
+        sites = np.arange(1, len(peptide) - 1)
+        prefix = np.cumsum(residues)[sites - 1]
+        suffix = np.cumsum(residues[::-1])[::-1][sites]
+        ion_mass = (
+            np.where(self._n_terminal, prefix[:, None], suffix[:, None])
+            + self._water
+            + self._ion_shift
+        )
+        mz = (ion_mass[:, :, None] + self._proton * self._charges) / self._charges
+        return mz.ravel()
+
+    def _fragments(self, peptides: List[str]) -> Dict[str, np.ndarray]:
+        """Fragments of all peptides, annotated if there is an intensity model.
+
+        Args:
+            peptides (List[str]): peptide sequences
+
+        Returns:
+            Dict[str, np.ndarray]: fragment annotations, see
+                smiter.fragment_intensity
+        """
+        ladders = [self._ladder(peptide) for peptide in peptides]
+        lengths = [len(ladder) for ladder in ladders]
+        fragments = {
+            "mz": np.concatenate(ladders) if len(ladders) > 0 else np.array([]),
+            "molecule": np.repeat(np.array(peptides, dtype=object), lengths),
+        }
+        if self.intensity_model is None:
+            return fragments
+        shape = (len(self.types), self.maxcharge)
+        annotations: Dict[str, list] = {
+            "ion_type": [],
+            "charge": [],
+            "n_residues": [],
+            "n_side_residue": [],
+            "c_side_residue": [],
+        }
+        for peptide in peptides:
+            sites = np.arange(1, len(peptide) - 1)[:, None, None]
+            residues = np.array(list(peptide))
+            size = len(sites) * len(self.types) * self.maxcharge
+            annotations["ion_type"].append(
+                np.broadcast_to(np.array(self.types)[:, None], shape)
+            )
+            annotations["charge"].append(np.broadcast_to(self._charges, shape))
+            annotations["n_residues"].append(
+                np.where(self._n_terminal[:, None], sites, len(peptide) - sites)
+            )
+            annotations["n_side_residue"].append(residues[sites - 1])
+            annotations["c_side_residue"].append(residues[sites])
+            for key in annotations:
+                annotations[key][-1] = np.broadcast_to(
+                    annotations[key][-1], (len(sites),) + shape
+                ).reshape(size)
+        for key, arrays in annotations.items():
+            fragments[key] = np.concatenate(arrays) if len(arrays) > 0 else np.array([])
+        return fragments
+
+    def precompute(self, entities: List[str], n_processes: int = 1):
+        """Compute the fragment ladders of all peptides into one array.
+
+        Ladder n is stored in mz[offsets[n]:offsets[n + 1]], fragment uses the
+        stored ladders for all known peptides.
+
+        Args:
+            entities (List[str]): peptide sequences
+            n_processes (int, optional): ignored, ladders are cheap to compute
+        """
+        peptides = list(dict.fromkeys(entities))
+        logger.info(f"Precompute fragment ladders of {len(peptides)} peptides")
+        fragments = self._fragments(peptides)
+        offsets = np.zeros(len(peptides) + 1, dtype=np.int64)
+        np.cumsum(
+            [
+                max(len(peptide) - 2, 0) * len(self.types) * self.maxcharge
+                for peptide in peptides
+            ],
+            out=offsets[1:],
+        )
+        self._precomputed_index = {peptide: n for n, peptide in enumerate(peptides)}
+        self._precomputed_offsets = offsets
+        self._precomputed_mz = fragments["mz"]
+        self._precomputed_i = self._fragment_intensities(fragments, 100)
+
+    def fragment(self, entities: Union[list, str]) -> np.ndarray:
+        """Summary.
+
+        Args:
+            entities (Union[list, str]): peptide sequences
+
+        Returns:
+            np.ndarray: mz and intensity of all fragments
+        """
+        if isinstance(entities, str):
+            entities = [entities]
+        if all(entity in self._precomputed_index for entity in entities):
+            mz_arrays = []
+            i_arrays = []
+            for entity in entities:
+                n = self._precomputed_index[entity]
+                start, end = self._precomputed_offsets[n : n + 2]
+                mz_arrays.append(self._precomputed_mz[start:end])
+                i_arrays.append(self._precomputed_i[start:end])
+            mz = np.concatenate(mz_arrays) if len(mz_arrays) > 0 else np.array([])
+            i = np.concatenate(i_arrays) if len(i_arrays) > 0 else np.array([])
+        else:
+            fragments = self._fragments(entities)
+            mz = fragments["mz"]
+            i = self._fragment_intensities(fragments, 100)
+        return np.stack((mz, i), axis=1)
+
+
+def compile_nucleoside_fragment_kb(
+    nucleoside_fragment_kb: Dict[str, dict],
+) -> Dict[str, np.ndarray]:
+    """Calculate the singly charged fragment mz of every nucleoside.
+
+    Args:
+        nucleoside_fragment_kb (Dict[str, dict]): fragment formulas per
+            nucleoside, see smiter.ext.nucleoside_fragment_kb
+
+    Returns:
+        Dict[str, np.ndarray]: fragment mz of every nucleoside
+    """
+    import pyqms
+
+    cc = pyqms.chemical_composition.ChemicalComposition()
+    table = {}
+    for nuc_name, nuc_dict in nucleoside_fragment_kb.items():
         mz = []
-        for e in entities:
-            a = list(self._fragments(e))
-            mz.extend(a)
-        i = np.array([100 for x in range(len(mz))])
-        mz = np.array(mz)
-        mz_i = np.stack((mz, i), axis=1)
-        return mz_i
+        for frag_name, frag_cc_dict in nuc_dict["fragments"].items():
+            cc.use(f"+{frag_cc_dict['formula']}")
+            m = cc._mass()
+            mz.append(calc_mz(m, 1))
+        table[nuc_name] = np.array(mz, dtype=float)
+    return table
+
+
+def user_cache_dir() -> pathlib.Path:
+    """Per-user cache directory of smiter.
+
+    Returns:
+        pathlib.Path: SMITER_CACHE_DIR if set, otherwise smiter in
+            XDG_CACHE_HOME (defaults to ~/.cache)
+    """
+    cache_dir = os.environ.get("SMITER_CACHE_DIR", None)
+    if cache_dir:
+        return pathlib.Path(cache_dir)
+    cache_home = os.environ.get("XDG_CACHE_HOME", None)
+    if not cache_home:
+        cache_home = os.path.join(os.path.expanduser("~"), ".cache")
+    return pathlib.Path(cache_home) / "smiter"
+
+
+def load_nucleoside_fragment_table(
+    cache_dir: Optional[Union[str, pathlib.Path]] = None,
+) -> Dict[str, np.ndarray]:
+    """Fragment mz of the nucleosides in smiter.ext.nucleoside_fragment_kb.
+
+    The knowledge base is only imported and compiled if there is no compiled
+    table yet. Compiled tables are stored as npz in cache_dir, named by the
+    sha1 of the knowledge base source and the pyqms version, and kept in
+    memory for later calls. The cache directory is created readable and
+    writable by the current user only.
+
+    Args:
+        cache_dir (Union[str, pathlib.Path], optional): directory of the
+            compiled tables, defaults to nucleoside_fragments in
+            user_cache_dir()
+
+    Returns:
+        Dict[str, np.ndarray]: fragment mz of every nucleoside
+    """
+    if cache_dir is None:
+        cache_dir = user_cache_dir() / "nucleoside_fragments"
+    cache_dir = pathlib.Path(cache_dir)
+    kb_source = importlib.util.find_spec("smiter.ext.nucleoside_fragment_kb").origin
+    with open(kb_source, "rb") as fin:
+        key = hashlib.sha1(
+            fin.read() + importlib.metadata.version("pyqms").encode()
+        ).hexdigest()
+    if key in _nucleoside_fragment_tables:
+        return _nucleoside_fragment_tables[key]
+    path = cache_dir / f"{key}.npz"
+    try:
+        with np.load(path) as data:
+            names, offsets, mz = data["names"], data["offsets"], data["mz"]
+        table = {
+            str(name): mz[offsets[n] : offsets[n + 1]] for n, name in enumerate(names)
+        }
+    except (OSError, KeyError, ValueError):
+        logger.info("Compile nucleoside fragment knowledge base")
+        from smiter.ext.nucleoside_fragment_kb import KB_FRAGMENTATION_INFO
+
+        table = compile_nucleoside_fragment_kb(KB_FRAGMENTATION_INFO)
+        offsets = np.zeros(len(table) + 1, dtype=np.int64)
+        np.cumsum([len(mz) for mz in table.values()], out=offsets[1:])
+        try:
+            cache_dir.mkdir(mode=0o700, parents=True, exist_ok=True)
+            tmp_path = path.with_suffix(f".{os.getpid()}.tmp.npz")
+            np.savez(
+                tmp_path,
+                names=np.array(list(table)),
+                offsets=offsets,
+                mz=np.concatenate(list(table.values())),
+            )
+            os.replace(tmp_path, path)
+        except OSError as e:
+            logger.warning(f"Could not store compiled nucleoside fragments: {e}")
+    _nucleoside_fragment_tables[key] = table
+    return table
 
 
 class NucleosideFragmentor(AbstractFragmentor):
-    """Summary."""
+    """Summary.
+
+    The fragments of the default knowledge base are loaded from a compiled
+    table, see load_nucleoside_fragment_table.
+    """
 
     def __init__(
         self,
         nucleotide_fragment_kb: Dict[str, dict] = None,
         raise_error_for_non_existing_fragments=True,
+        intensity_model: AbstractIntensityModel = None,
+        cache_dir: Optional[Union[str, pathlib.Path]] = None,
     ):
-        """Summary."""
+        """Summary.
+
+        Args:
+            nucleotide_fragment_kb (Dict[str, dict], optional): fragment formulas
+                per nucleoside, defaults to smiter.ext.nucleoside_fragment_kb
+            raise_error_for_non_existing_fragments (bool, optional): Description
+            intensity_model (AbstractIntensityModel, optional): fragment
+                intensity model, all fragments have intensity 1 if None
+            cache_dir (Union[str, pathlib.Path], optional): directory of the
+                compiled default knowledge base, see
+                load_nucleoside_fragment_table
+        """
         logger.info("Initialize NucleosideFragmentor")
-        if nucleotide_fragment_kb is None:
-            nucleoside_fragment_kb = pyrnams_nucleoside_fragment_kb
+        self.intensity_model = intensity_model
         self.raise_error_for_non_existing_fragments = (
             raise_error_for_non_existing_fragments
         )
-        nuc_to_fragments: Dict[str, List[float]] = {}
-        cc = pyqms.chemical_composition.ChemicalComposition()
-        for nuc_name, nuc_dict in nucleoside_fragment_kb.items():
-            nuc_to_fragments[nuc_name] = []
-            for frag_name, frag_cc_dict in nucleoside_fragment_kb[nuc_name][
-                "fragments"
-            ].items():
-                cc.use(f"+{frag_cc_dict['formula']}")
-                m = cc._mass()
-                nuc_to_fragments[nuc_name].append(calc_mz(m, 1))
-        self.nuc_to_fragments = nuc_to_fragments
+        if nucleotide_fragment_kb is None:
+            self.nuc_to_fragments = load_nucleoside_fragment_table(cache_dir)
+        else:
+            self.nuc_to_fragments = compile_nucleoside_fragment_kb(
+                nucleotide_fragment_kb
+            )
 
     def fragment(
         self, entities: Union[list, str], raise_error_for_non_existing_fragments=False
@@ -146,49 +579,160 @@ class NucleosideFragmentor(AbstractFragmentor):
         if isinstance(entities, str):
             entities = [entities]
         m = []
+        molecules = []
         for entity in entities:
             if raise_error_for_non_existing_fragments is True:
                 masses = self.nuc_to_fragments[entity]
             else:
                 masses = self.nuc_to_fragments.get(entity, [])
             m.extend(masses)
+            molecules.extend([entity] * len(masses))
             # logger.debug(masses)
-            # should overlapping peaks be divided into two very similar ones?
-        m = sorted(list(set(m)))
-        # logger.debug(m)
-        return np.array([(mass, 1) for mass in m])
+        # overlapping peaks are merged
+        fragments = {
+            "mz": np.array(m, dtype=float),
+            "molecule": np.array(molecules, dtype=object),
+        }
+        return _unique_fragments(fragments, self._fragment_intensities(fragments, 1))
 
 
 class LipidFragmentor(AbstractFragmentor):
-    """Summary."""
+    """Fragment lipids with the transition lists of LipidCreator.
+
+    LipidCreator is run once per input csv (or once per precompute call) and
+    writes to a unique temporary file. With cache_dir, the parsed transition
+    lists are stored as csv named by the sha1 of the LipidCreator input and
+    reused by later runs. A transition table written before (e.g. a cache
+    file) can be loaded directly with transition_table.
+    """
 
     def __init__(
         self,
         lipid_input_csv: str = None,
         raise_error_for_non_existing_fragments=True,
+        intensity_model: AbstractIntensityModel = None,
+        transition_table: str = None,
+        cache_dir: Union[str, pathlib.Path] = None,
+        lipid_creator_command: List[str] = None,
     ):
-        """Use LipidCreator to calculate precursor transitions of lipids."""
-        self.lip_to_fragments = {}
-        # TODO run lipid fragmenter here, read output file and collect results in dict
-        commands: List[str] = []
-        if sys.platform == "linux" or sys.platform == "darwin":
-            commands.append("mono")
-            lipid_creator_path = shutil.which("LipidCreator.exe")
-        else:
-            # will this work under windows?
-            lipid_creator_path = "LipidCreator"
-        commands.extend(
-            [lipid_creator_path, "transitionlist", lipid_input_csv, "lipid_output.csv"]
-        )
-        proc = subprocess.run(commands)
-        with open("lipid_output.csv") as fin:
+        """Use LipidCreator to calculate precursor transitions of lipids.
+
+        Args:
+            lipid_input_csv (str, optional): LipidCreator input, one lipid per line
+            raise_error_for_non_existing_fragments (bool, optional): Description
+            intensity_model (AbstractIntensityModel, optional): fragment
+                intensity model, all fragments have intensity 1 if None
+            transition_table (str, optional): csv with columns PrecursorName and
+                ProductMz, loaded instead of running LipidCreator
+            cache_dir (Union[str, pathlib.Path], optional): directory of the
+                cached transition tables
+            lipid_creator_command (List[str], optional): command to run
+                LipidCreator, defaults to mono LipidCreator.exe on linux and mac
+        """
+        self.intensity_model = intensity_model
+        self.cache_dir = None if cache_dir is None else pathlib.Path(cache_dir)
+        if lipid_creator_command is None:
+            if sys.platform == "linux" or sys.platform == "darwin":
+                lipid_creator_command = ["mono", shutil.which("LipidCreator.exe")]
+            else:
+                # will this work under windows?
+                lipid_creator_command = ["LipidCreator"]
+        self.lipid_creator_command = lipid_creator_command
+        self.lip_to_fragments: Dict[str, List[float]] = {}
+        if transition_table is not None:
+            self.lip_to_fragments.update(self._read_transition_table(transition_table))
+        if lipid_input_csv is not None:
+            with open(lipid_input_csv, "rb") as fin:
+                self.lip_to_fragments.update(self._transitions(fin.read()))
+
+    @staticmethod
+    def _read_transition_table(file: str) -> Dict[str, List[float]]:
+        """Read product mz per precursor from a LipidCreator transition list.
+
+        Args:
+            file (str): csv with columns PrecursorName and ProductMz
+
+        Returns:
+            Dict[str, List[float]]: product mz of every lipid
+        """
+        lip_to_fragments: Dict[str, List[float]] = {}
+        with open(file) as fin:
             for line in csv.DictReader(fin):
-                if line["PrecursorName"] not in self.lip_to_fragments:
-                    self.lip_to_fragments[line["PrecursorName"]] = []
-                self.lip_to_fragments[line["PrecursorName"]].append(
-                    float(line["ProductMz"])
-                )
-        os.remove("lipid_output.csv")
+                if line["PrecursorName"] not in lip_to_fragments:
+                    lip_to_fragments[line["PrecursorName"]] = []
+                lip_to_fragments[line["PrecursorName"]].append(float(line["ProductMz"]))
+        return lip_to_fragments
+
+    @staticmethod
+    def _write_transition_table(
+        file: Union[str, pathlib.Path], lip_to_fragments: Dict[str, List[float]]
+    ):
+        """Write product mz per precursor as csv, see _read_transition_table.
+
+        Args:
+            file (Union[str, pathlib.Path]): output file
+            lip_to_fragments (Dict[str, List[float]]): product mz of every lipid
+        """
+        with open(file, "w", newline="") as fout:
+            writer = csv.writer(fout)
+            writer.writerow(["PrecursorName", "ProductMz"])
+            for lipid, product_mzs in lip_to_fragments.items():
+                for product_mz in product_mzs:
+                    writer.writerow([lipid, repr(product_mz)])
+
+    def _transitions(self, lipid_input: bytes) -> Dict[str, List[float]]:
+        """Product mz of the lipids in lipid_input, cached by input hash.
+
+        Args:
+            lipid_input (bytes): LipidCreator input, one lipid per line
+
+        Returns:
+            Dict[str, List[float]]: product mz of every lipid
+        """
+        key = hashlib.sha1(lipid_input).hexdigest()
+        cache_file = None
+        if self.cache_dir is not None:
+            cache_file = self.cache_dir / f"{key}.csv"
+            if cache_file.exists():
+                logger.info(f"Load lipid transitions from {cache_file}")
+                return self._read_transition_table(cache_file)
+        with tempfile.TemporaryDirectory(prefix="smiter_lipids_") as tmp_dir:
+            input_file = os.path.join(tmp_dir, "lipid_input.csv")
+            output_file = os.path.join(tmp_dir, "lipid_output.csv")
+            with open(input_file, "wb") as fout:
+                fout.write(lipid_input)
+            commands = self.lipid_creator_command + [
+                "transitionlist",
+                input_file,
+                output_file,
+            ]
+            logger.info(f"Run {' '.join(commands)}")
+            subprocess.run(commands, check=True)
+            lip_to_fragments = self._read_transition_table(output_file)
+        if cache_file is not None:
+            self.cache_dir.mkdir(parents=True, exist_ok=True)
+            tmp_file = cache_file.with_suffix(f".{os.getpid()}.tmp")
+            self._write_transition_table(tmp_file, lip_to_fragments)
+            os.replace(tmp_file, cache_file)
+        return lip_to_fragments
+
+    def precompute(self, entities: List[str], n_processes: int = 1):
+        """Run LipidCreator once for all lipids without transitions.
+
+        Args:
+            entities (List[str]): lipid names
+            n_processes (int, optional): ignored, LipidCreator runs once
+        """
+        lipids = [
+            lipid
+            for lipid in dict.fromkeys(entities)
+            if lipid not in self.lip_to_fragments
+        ]
+        if len(lipids) == 0:
+            return
+        logger.info(f"Calculate transitions of {len(lipids)} lipids")
+        lipid_input = "\n".join(lipids).encode()
+        self.lip_to_fragments.update(self._transitions(lipid_input))
 
     def fragment(
         self, entities: Union[list, str], raise_error_for_non_existing_fragments=False
@@ -201,14 +745,18 @@ class LipidFragmentor(AbstractFragmentor):
         if isinstance(entities, str):
             entities = [entities]
         m = []
+        molecules = []
         for entity in entities:
             if raise_error_for_non_existing_fragments is True:
                 masses = self.lip_to_fragments[entity]
             else:
                 masses = self.lip_to_fragments.get(entity, [])
             m.extend(masses)
+            molecules.extend([entity] * len(masses))
             # logger.debug(masses)
-            # should overlapping peaks be divided into two very similar ones?
-        m = sorted(list(set(m)))
-        # logger.debug(m)
-        return np.array([(mass, 1) for mass in m])
+        # overlapping peaks are merged
+        fragments = {
+            "mz": np.array(m, dtype=float),
+            "molecule": np.array(molecules, dtype=object),
+        }
+        return _unique_fragments(fragments, self._fragment_intensities(fragments, 1))
@@ -1,13 +1,17 @@
 """Core functionality."""
 import csv
+from collections.abc import Mapping
 from io import TextIOWrapper
 from tempfile import _TemporaryFileWrapper
+from typing import Any, Dict, List, Optional, Union
 
+import numpy as np
 from loguru import logger
 
 from smiter.params.default_params import default_mzml_params, default_peak_properties
 
 PROTON = 1.00727646677
+PEAK_FUNCTIONS = (None, "gauss", "gamma", "gauss_tail")
 
 
 def calc_mz(mass: float, charge: int):
@@ -45,19 +49,24 @@ def check_mzml_params(mzml_params: dict) -> dict:
     return mzml_params
 
 
-def check_peak_properties(peak_properties: dict) -> dict:
+def check_peak_properties(
+    peak_properties: Union["PeakTable", dict],
+) -> Union["PeakTable", dict]:
     """Summary.
 
     Args:
-        peak_properties (dict): Description
+        peak_properties (Union[PeakTable, dict]): Description
 
     Returns:
-        dict: Description
+        Union[PeakTable, dict]: Description
 
     Raises:
         Exception: Description
     """
     logger.info("Checking peak properties")
+    if isinstance(peak_properties, PeakTable):
+        # checked on construction
+        return peak_properties
     for mol, properties in peak_properties.items():
         for default_param, default_value in default_peak_properties.items():
             if (properties.get(default_param, None) is None) and (
@@ -71,6 +80,228 @@ def check_peak_properties(peak_properties: dict) -> dict:
     return peak_properties
 
 
+class PeakTable(Mapping):
+    """Columnar store of the peak properties of many molecules.
+
+    Every property is a numpy array with one entry per molecule and molecules
+    are identified by their position in the table (molecule id). Peak functions
+    are stored as index into PEAK_FUNCTIONS and unset peak params as nan.
+    Properties without column (e.g. charge_distribution) are kept in extra.
+
+    The table is a read only mapping of molecule name to peak properties dict,
+    so it can be used wherever a peak_properties dict is expected.
+    """
+
+    param_columns = ("sigma", "a", "scale")
+    known_properties = {
+        "chemical_formula",
+        "trivial_name",
+        "charge",
+        "scan_start_time",
+        "peak_width",
+        "peak_function",
+        "peak_params",
+        "peak_scaling_factor",
+        "ionization_effiency",
+    }
+
+    def __init__(
+        self,
+        molecules: List[str],
+        chemical_formula: List[str],
+        scan_start_time: np.ndarray,
+        peak_width: np.ndarray,
+        charge: Optional[np.ndarray] = None,
+        peak_function: Optional[np.ndarray] = None,
+        peak_scaling_factor: Optional[np.ndarray] = None,
+        ionization_effiency: Optional[np.ndarray] = None,
+        sigma: Optional[np.ndarray] = None,
+        a: Optional[np.ndarray] = None,
+        scale: Optional[np.ndarray] = None,
+        extra: Optional[Dict[int, dict]] = None,
+    ):
+        """Initialize table, omitted columns are filled with default values.
+
+        Args:
+            molecules (List[str]): molecule names (trivial names)
+            chemical_formula (List[str]): chemical formula of every molecule
+            scan_start_time (np.ndarray): start of the elution in seconds
+            peak_width (np.ndarray): width of the elution peak in seconds
+            charge (np.ndarray, optional): charge, defaults to 2
+            peak_function (np.ndarray, optional): index into PEAK_FUNCTIONS,
+                defaults to 0 (no peak function)
+            peak_scaling_factor (np.ndarray, optional): defaults to 1e3
+            ionization_effiency (np.ndarray, optional): defaults to 1
+            sigma (np.ndarray, optional): peak param sigma, defaults to nan
+            a (np.ndarray, optional): peak param a, defaults to nan
+            scale (np.ndarray, optional): peak param scale, defaults to nan
+            extra (Dict[int, dict], optional): additional properties per molecule id
+        """
+        n = len(molecules)
+
+        def column(values, default, dtype):
+            if values is None:
+                return np.full(n, default, dtype=dtype)
+            return np.asarray(values, dtype=dtype)
+
+        self.molecules = list(molecules)
+        self.index = {mol: n for n, mol in enumerate(self.molecules)}
+        self.chemical_formula = np.asarray(chemical_formula, dtype=object)
+        self.scan_start_time = np.asarray(scan_start_time, dtype=float)
+        self.peak_width = np.asarray(peak_width, dtype=float)
+        self.charge = column(charge, default_peak_properties["charge"], np.int64)
+        self.peak_function = column(peak_function, 0, np.int8)
+        self.peak_scaling_factor = column(peak_scaling_factor, 1e3, float)
+        self.ionization_effiency = column(ionization_effiency, 1, float)
+        self.sigma = column(sigma, np.nan, float)
+        self.a = column(a, np.nan, float)
+        self.scale = column(scale, np.nan, float)
+        self.extra = {} if extra is None else extra
+
+    @classmethod
+    def from_dict(
+        cls, peak_properties: Union["PeakTable", Dict[str, dict]]
+    ) -> "PeakTable":
+        """Convert peak_properties dict into a table.
+
+        Args:
+            peak_properties (Union[PeakTable, Dict[str, dict]]): peak properties
+                per molecule, tables are returned unchanged
+
+        Returns:
+            PeakTable: table with the molecules in the order of peak_properties
+
+        Raises:
+            Exception: if a required property is missing or the peak function is
+                unknown
+        """
+        if isinstance(peak_properties, PeakTable):
+            return peak_properties
+        columns: Dict[str, Any] = {
+            "chemical_formula": [],
+            "scan_start_time": [],
+            "peak_width": [],
+            "charge": [],
+            "peak_function": [],
+            "peak_scaling_factor": [],
+            "ionization_effiency": [],
+            "sigma": [],
+            "a": [],
+            "scale": [],
+        }
+        extra = {}
+        for n, (mol, properties) in enumerate(peak_properties.items()):
+            for default_param, default_value in default_peak_properties.items():
+                if (properties.get(default_param, None) is None) and (
+                    default_value is None
+                ):
+                    raise Exception(
+                        f"peak property {default_param} of {mol} is required but not set!"
+                    )
+            peak_function = properties.get("peak_function", None)
+            if peak_function not in PEAK_FUNCTIONS:
+                raise Exception(f"Unknown peak function {peak_function} of {mol}")
+            params = properties.get("peak_params", None) or {}
+            columns["chemical_formula"].append(properties.get("chemical_formula", ""))
+            columns["scan_start_time"].append(properties["scan_start_time"])
+            columns["peak_width"].append(properties["peak_width"])
+            columns["charge"].append(
+                properties.get("charge", None) or default_peak_properties["charge"]
+            )
+            columns["peak_function"].append(PEAK_FUNCTIONS.index(peak_function))
+            columns["peak_scaling_factor"].append(
+                properties.get("peak_scaling_factor", 1e3)
+            )
+            columns["ionization_effiency"].append(
+                properties.get("ionization_effiency", 1)
+            )
+            for param in cls.param_columns:
+                columns[param].append(params.get(param, np.nan))
+
+            mol_extra = {
+                key: val
+                for key, val in properties.items()
+                if key not in cls.known_properties
+            }
+            other_params = {
+                key: val for key, val in params.items() if key not in cls.param_columns
+            }
+            if len(other_params) > 0:
+                mol_extra["peak_params"] = other_params
+            if properties.get("trivial_name", mol) != mol:
+                mol_extra["trivial_name"] = properties["trivial_name"]
+            if len(mol_extra) > 0:
+                extra[n] = mol_extra
+        return cls(list(peak_properties), extra=extra, **columns)
+
+    def to_dict(self) -> Dict[str, dict]:
+        """Convert table into a peak_properties dict.
+
+        Returns:
+            Dict[str, dict]: peak properties per molecule
+        """
+        return {mol: self.row(n) for n, mol in enumerate(self.molecules)}
+
+    def row(self, n: int) -> dict:
+        """Peak properties of molecule id n.
+
+        Args:
+            n (int): molecule id
+
+        Returns:
+            dict: peak properties
+        """
+        params = {}
+        for param in self.param_columns:
+            value = getattr(self, param)[n]
+            if not np.isnan(value):
+                params[param] = float(value)
+        properties = {
+            "chemical_formula": self.chemical_formula[n],
+            "trivial_name": self.molecules[n],
+            "charge": int(self.charge[n]),
+            "scan_start_time": float(self.scan_start_time[n]),
+            "peak_width": float(self.peak_width[n]),
+            "peak_function": PEAK_FUNCTIONS[self.peak_function[n]],
+            "peak_params": params,
+            "peak_scaling_factor": float(self.peak_scaling_factor[n]),
+            "ionization_effiency": float(self.ionization_effiency[n]),
+        }
+        for key, val in self.extra.get(n, {}).items():
+            if key == "peak_params":
+                params.update(val)
+            else:
+                properties[key] = val
+        return properties
+
+    def ids(self, molecules: List[str]) -> np.ndarray:
+        """Molecule ids of the given molecules.
+
+        Args:
+            molecules (List[str]): molecule names
+
+        Returns:
+            np.ndarray: molecule ids
+        """
+        return np.array([self.index[mol] for mol in molecules], dtype=np.int64)
+
+    def __getitem__(self, mol: str) -> dict:
+        """Peak properties of molecule mol."""
+        return self.row(self.index[mol])
+
+    def __contains__(self, mol) -> bool:
+        """Check if molecule mol is in the table."""
+        return mol in self.index
+
+    def __iter__(self):
+        """Iterate over the molecule names."""
+        return iter(self.molecules)
+
+    def __len__(self) -> int:
+        """Return the number of molecules."""
+        return len(self.molecules)
+
+
 def csv_to_peak_properties(csv_file):
     logger.info(f"Read peak properties from {csv_file}")
     peak_properties = {}
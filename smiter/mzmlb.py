@@ -0,0 +1,258 @@
+"""mzMLb output.
+
+mzMLb (Bhamber et al., 2021, doi:10.1021/acs.jproteome.0c00192) stores the
+mzML XML without binary data in the byte dataset "mzML" of a HDF5 file. Data
+arrays are appended to chunked, compressed numeric datasets and referenced
+from the XML by dataset name, offset and length. Spectrum and chromatogram
+offsets replace the index of indexedmzML.
+
+h5py is an optional dependency of smiter and only needed for this module.
+"""
+from typing import Dict, List, Optional, Tuple
+
+import h5py
+import numpy as np
+from psims.mzml.binary_encoding import encoding_map
+from psims.mzml.index import IndexingStream
+from psims.mzml.writer import PlainMzMLWriter
+
+MZMLB_VERSION = "mzMLb 1.0"
+
+ARRAY_ACCESSIONS = {
+    "m/z array": "MS_1000514",
+    "intensity array": "MS_1000515",
+    "time array": "MS_1000595",
+}
+
+
+class MzMLbStore(object):
+    """Appendable datasets of a mzMLb file.
+
+    Appended data is buffered and written to HDF5 in blocks of at least
+    buffer_size values. The store is file-like, bytes written to it are appended to the
+    mzML dataset, so it can be passed to the XML writer.
+    """
+
+    def __init__(self, path: str, chunk_size: int = 2**16, buffer_size: int = 2**20):
+        """Initialize store.
+
+        Args:
+            path (str): path of the mzMLb file, overwritten if it exists
+            chunk_size (int, optional): number of values per HDF5 chunk, the
+                unit of compression and reading
+            buffer_size (int, optional): number of values buffered per dataset
+        """
+        self.h5 = h5py.File(path, "w")
+        self.chunk_size = chunk_size
+        self.buffer_size = buffer_size
+        self.datasets: Dict[str, h5py.Dataset] = {}
+        self.buffers: Dict[str, List[np.ndarray]] = {}
+        self.buffered: Dict[str, int] = {}
+        self.lengths: Dict[str, int] = {}
+        self._create_dataset("mzML", np.dtype(np.uint8), "zlib")
+        self.datasets["mzML"].attrs["version"] = MZMLB_VERSION
+
+    def _create_dataset(self, name: str, dtype: np.dtype, compression: str):
+        if compression not in ("none", "zlib"):
+            raise ValueError(f"Compression {compression} is not supported for mzMLb")
+        self.datasets[name] = self.h5.create_dataset(
+            name,
+            shape=(0,),
+            maxshape=(None,),
+            dtype=dtype,
+            chunks=(self.chunk_size,),
+            compression="gzip" if compression == "zlib" else None,
+        )
+        self.buffers[name] = []
+        self.buffered[name] = 0
+        self.lengths[name] = 0
+
+    def _append(self, name: str, data: np.ndarray) -> int:
+        offset = self.lengths[name]
+        self.buffers[name].append(data)
+        self.buffered[name] += len(data)
+        self.lengths[name] += len(data)
+        if self.buffered[name] >= self.buffer_size:
+            self._flush_buffer(name)
+        return offset
+
+    def _flush_buffer(self, name: str):
+        if self.buffered[name] == 0:
+            return
+        dataset = self.datasets[name]
+        start = dataset.shape[0]
+        dataset.resize((self.lengths[name],))
+        dataset[start:] = np.concatenate(self.buffers[name])
+        self.buffers[name] = []
+        self.buffered[name] = 0
+
+    def write(self, data: bytes) -> int:
+        """Append XML to the mzML dataset.
+
+        Args:
+            data (bytes): XML
+
+        Returns:
+            int: number of bytes written
+        """
+        self._append("mzML", np.frombuffer(data, dtype=np.uint8))
+        return len(data)
+
+    def flush(self):
+        """Write all buffered data to the HDF5 file."""
+        for name in self.datasets:
+            self._flush_buffer(name)
+        self.h5.flush()
+
+    def writable(self) -> bool:
+        """Return True, the store is writable.
+
+        Returns:
+            bool: True
+        """
+        return True
+
+    def add_array(
+        self, name: str, array: np.ndarray, dtype: np.dtype, compression: str
+    ) -> int:
+        """Append array to dataset name, the dataset is created if necessary.
+
+        Args:
+            name (str): dataset name
+            array (np.ndarray): data to append
+            dtype (np.dtype): dtype of the dataset
+            compression (str): "none" or "zlib", used for new datasets
+
+        Returns:
+            int: offset of array in the dataset
+        """
+        if name not in self.datasets:
+            self._create_dataset(name, dtype, compression)
+        return self._append(name, np.asarray(array, dtype=dtype))
+
+    def write_index(self, label: str, offsets: List[Tuple[bytes, int]], end: int):
+        """Write element offsets and ids.
+
+        Args:
+            label (str): spectrum or chromatogram
+            offsets (List[Tuple[bytes, int]]): id and XML offset of every element
+            end (int): XML offset after the last element
+        """
+        self.h5.create_dataset(
+            f"mzML_{label}Index",
+            data=np.array([offset for _, offset in offsets] + [end], dtype=np.int64),
+        )
+        ids = b"".join(xid + b"\x00" for xid, _ in offsets)
+        self.h5.create_dataset(
+            f"mzML_{label}Index_idRef", data=np.frombuffer(ids, dtype=np.uint8)
+        )
+
+    def close(self):
+        """Write buffered data and close HDF5 file."""
+        self.flush()
+        self.h5.close()
+
+
+class _ElementEndIndexer(object):
+    """Record the XML offset after the last closing tag of an element."""
+
+    def __init__(self, tag: str):
+        self.closing_tag = f"</{tag}>".encode()
+        self.end: Optional[int] = None
+
+    def __len__(self):
+        return 0
+
+    def __call__(self, data: bytes, distance: int) -> bool:
+        if data.startswith(self.closing_tag):
+            self.end = distance + len(self.closing_tag)
+        return False
+
+
+class MzMLbWriter(PlainMzMLWriter):
+    """psims mzML writer storing data arrays and offsets in a mzMLb file.
+
+    Array precision is taken from the encoding, zlib compression is done by
+    HDF5. MS-Numpress is not supported.
+    """
+
+    def __init__(self, path: str, **kwargs):
+        """Initialize writer.
+
+        Args:
+            path (str): path of the mzMLb file
+            **kwargs: passed to PlainMzMLWriter
+        """
+        self.store = MzMLbStore(path)
+        self.index_builder = IndexingStream(self.store)
+        self.element_ends = {
+            tag: _ElementEndIndexer(tag) for tag in ("spectrum", "chromatogram")
+        }
+        for indexer in self.element_ends.values():
+            self.index_builder.indices.add(indexer)
+        self.array_prefix = "spectrum"
+        super().__init__(self.index_builder, close=True, **kwargs)
+
+    def _prepare_array(
+        self,
+        array,
+        encoding=32,
+        compression="zlib",
+        array_type=None,
+        default_array_length=None,
+    ):
+        # intensity arrays come with their unit as dict
+        name = array_type["name"] if isinstance(array_type, dict) else array_type
+        if isinstance(compression, dict):
+            compression = compression.get(name, "zlib")
+        if compression is None or compression is False:
+            compression = "none"
+        dtype = np.dtype(encoding_map[encoding])
+        dataset = "{0}_{1}_{2}".format(
+            self.array_prefix,
+            ARRAY_ACCESSIONS.get(name, name.replace(" ", "_")),
+            dtype.name,
+        )
+        offset = self.store.add_array(dataset, array, dtype, compression)
+        override_length = (
+            default_array_length is not None and len(array) != default_array_length
+        )
+        return self.BinaryDataArray(
+            self.Binary(b""),
+            0,
+            array_length=len(array) if override_length else None,
+            params=[
+                array_type,
+                "no compression",
+                f"{dtype.itemsize * 8}-bit float",
+                {"external HDF5 dataset": dataset},
+                {"external offset": offset},
+                {"external array length": len(array)},
+            ],
+        )
+
+    def write_chromatogram(self, *args, **kwargs):
+        """Write chromatogram, arrays are stored in chromatogram datasets.
+
+        Args:
+            *args: passed to PlainMzMLWriter.write_chromatogram
+            **kwargs: passed to PlainMzMLWriter.write_chromatogram
+        """
+        self.array_prefix = "chromatogram"
+        try:
+            super().write_chromatogram(*args, **kwargs)
+        finally:
+            self.array_prefix = "spectrum"
+
+    def close(self):
+        """Write spectrum and chromatogram offsets and close the file."""
+        for indexer in self.index_builder.indices:
+            if isinstance(indexer, _ElementEndIndexer):
+                continue
+            end = self.element_ends[indexer.name].end
+            self.store.write_index(
+                indexer.name,
+                [(xid, int(offset)) for xid, offset in indexer],
+                end if end is not None else self.index_builder.accumulator,
+            )
+        super().close()
@@ -8,7 +8,6 @@ from abc import ABC, abstractmethod
 from typing import Dict, List, Tuple
 
 import numpy as np
-import pyqms
 from loguru import logger
 
 import smiter
@@ -18,6 +17,28 @@ from smiter.lib import calc_mz
 # import smiter.synthetic_mzml
 
 
+def _segment_max(values: np.ndarray, offsets: np.ndarray) -> np.ndarray:
+    """Maximum of every segment values[offsets[k]:offsets[k + 1]], 0 if empty."""
+    lengths = np.diff(offsets)
+    result = np.zeros(len(lengths))
+    non_empty = lengths > 0
+    if non_empty.any():
+        result[non_empty] = np.maximum.reduceat(values, offsets[:-1][non_empty])
+    return result
+
+
+def _segment_sum(values: np.ndarray, offsets: np.ndarray) -> np.ndarray:
+    """Sum of every segment values[offsets[k]:offsets[k + 1]].
+
+    np.add.reduceat does not always sum in the same order as ndarray.sum, so
+    every segment is summed on its own to get the same results as for a
+    single scan.
+    """
+    return np.array(
+        [values[start:end].sum() for start, end in zip(offsets[:-1], offsets[1:])]
+    )
+
+
 class AbstractNoiseInjector(ABC):
     """Summary."""
 
@@ -25,6 +46,31 @@ class AbstractNoiseInjector(ABC):
         """Initialize noise injector."""
         pass  # pragma: no cover
 
+    def _get_rng(self, scan_id):
+        """Random number generator for a scan.
+
+        If the injector was initialized with a seed, every scan id gets its own
+        independent stream, spawned from the seed via a SeedSequence. Hence the
+        noise of a scan does not depend on the order scans are generated in.
+        Without a seed the global numpy random state is used.
+
+        Args:
+            scan_id (int): scan id, scans without id share one stream
+
+        Returns:
+            Union[np.random.Generator, module]: random number generator
+        """
+        seed = getattr(self, "seed", None)
+        if seed is None:
+            return np.random
+        if scan_id is None:
+            if getattr(self, "_rng", None) is None:
+                self._rng = np.random.default_rng(seed)
+            return self._rng
+        return np.random.default_rng(
+            np.random.SeedSequence(entropy=seed, spawn_key=(scan_id,))
+        )
+
     @abstractmethod
     def inject_noise(self, scan, *args, **kwargs):
         """Main noise injection method.
@@ -37,6 +83,128 @@ class AbstractNoiseInjector(ABC):
         """
         pass  # pragma: no cover
 
+    def inject_noise_batch(self, mz, i, offsets, ms_levels, scan_ids=None, **kwargs):
+        """Inject noise into a block of scans.
+
+        The peaks of all scans are passed as concatenated arrays, scan k spans
+        mz[offsets[k]:offsets[k + 1]]. This implementation calls inject_noise for
+        every scan, injectors can override it with a vectorized version.
+
+        Args:
+            mz (np.ndarray): concatenated mz arrays of all scans
+            i (np.ndarray): concatenated intensity arrays of all scans
+            offsets (np.ndarray): start of every scan in mz and i plus the total
+                number of peaks
+            ms_levels (np.ndarray): ms level of every scan
+            scan_ids (np.ndarray, optional): id of every scan, used to pick the
+                random number generator of seeded injectors
+            **kwargs: Description
+
+        Returns:
+            Tuple[np.ndarray, np.ndarray, np.ndarray]: noisy mz, i and offsets
+        """
+        from smiter.synthetic_mzml import Scan
+
+        mz_arrays = []
+        i_arrays = []
+        for k in range(len(offsets) - 1):
+            scan = Scan(
+                {
+                    "mz": mz[offsets[k] : offsets[k + 1]].copy(),
+                    "i": i[offsets[k] : offsets[k + 1]].copy(),
+                    "id": None if scan_ids is None else scan_ids[k],
+                    "ms_level": ms_levels[k],
+                }
+            )
+            scan = self.inject_noise(scan, **kwargs)
+            mz_arrays.append(scan.mz)
+            i_arrays.append(scan.i)
+        lengths = [len(a) for a in mz_arrays]
+        if len(lengths) == 0:
+            return mz.copy(), i.copy(), np.zeros(1, dtype=int)
+        return (
+            np.concatenate(mz_arrays),
+            np.concatenate(i_arrays),
+            np.r_[0, np.cumsum(lengths)],
+        )
+
+    def _get_batch_rngs(self, scan_ids, n_scans):
+        """Random number generators for every scan of a batch.
+
+        Args:
+            scan_ids (np.ndarray): scan ids or None
+            n_scans (int): number of scans in the batch
+
+        Returns:
+            list: generator for every scan, None if the injector is not seeded
+        """
+        if getattr(self, "seed", None) is None:
+            return None
+        if scan_ids is None:
+            scan_ids = [None] * n_scans
+        return [self._get_rng(scan_id) for scan_id in scan_ids]
+
+    @staticmethod
+    def _draw_batch(rngs, lengths, distribution, *params):
+        """Draw lengths[k] samples of distribution for every scan k of a batch.
+
+        Without seed all samples are drawn from the global random state in one
+        call, otherwise every scan draws from its own generator.
+
+        Args:
+            rngs (list): generator for every scan or None
+            lengths (np.ndarray): number of samples for every scan
+            distribution (str): name of the distribution, e.g. normal
+            *params: parameters of the distribution, scalars or arrays with one
+                entry per sample
+
+        Returns:
+            np.ndarray: concatenated samples
+        """
+        if rngs is None:
+            return getattr(np.random, distribution)(*params, size=int(lengths.sum()))
+        bounds = np.r_[0, np.cumsum(lengths)]
+        samples = [
+            getattr(rng, distribution)(
+                *[
+                    p[bounds[k] : bounds[k + 1]] if isinstance(p, np.ndarray) else p
+                    for p in params
+                ],
+                size=lengths[k],
+            )
+            for k, rng in enumerate(rngs)
+        ]
+        if len(samples) == 0:
+            return np.zeros(0)
+        return np.concatenate(samples)
+
+    @classmethod
+    def _dropout_batch(cls, mz, i, offsets, ms_levels, rngs, dropout):
+        """Randomly remove peaks from the MSn scans of a batch.
+
+        Args:
+            mz (np.ndarray): concatenated mz arrays of all scans
+            i (np.ndarray): concatenated intensity arrays of all scans
+            offsets (np.ndarray): start of every scan plus the total number of peaks
+            ms_levels (np.ndarray): ms level of every scan
+            rngs (list): generator for every scan or None
+            dropout (float): probability to remove a peak
+
+        Returns:
+            Tuple[np.ndarray, np.ndarray, np.ndarray]: remaining mz, i and offsets
+        """
+        lengths = np.diff(offsets)
+        msn = np.asarray(ms_levels) > 1
+        if rngs is not None:
+            rngs = [rng for rng, is_msn in zip(rngs, msn) if is_msn]
+        keep = np.ones(len(mz), dtype=bool)
+        keep[np.repeat(msn, lengths)] = (
+            cls._draw_batch(rngs, lengths[msn], "random") >= dropout
+        )
+        owner = np.repeat(np.arange(len(lengths)), lengths)
+        lengths = np.bincount(owner[keep], minlength=len(lengths))
+        return mz[keep], i[keep], np.r_[0, np.cumsum(lengths)]
+
     @abstractmethod
     def _ms1_noise(self, scan, *args, **kwargs):
         pass  # pragma: no cover
@@ -48,7 +216,7 @@ class AbstractNoiseInjector(ABC):
 
 class GaussNoiseInjector(AbstractNoiseInjector):
     def __init__(self, *args, **kwargs):
-        # np.random.seed(1312)
+        self.seed = kwargs.pop("seed", None)
         logger.info("Initialize GaussNoiseInjector")
         self.args = args
         self.kwargs = kwargs
@@ -64,13 +232,41 @@ class GaussNoiseInjector(AbstractNoiseInjector):
         """
         self.kwargs.update(kwargs)
         # self.args += args
+        rng = self._get_rng(scan.id)
         if scan.ms_level == 1:
-            scan = self._ms1_noise(scan, *self.args, **self.kwargs)
+            scan = self._ms1_noise(scan, *self.args, rng=rng, **self.kwargs)
         elif scan.ms_level > 1:
-            scan = self._msn_noise(scan, *args, **kwargs)
+            scan = self._msn_noise(scan, *args, rng=rng, **kwargs)
         return scan
 
-    def _ms1_noise(self, scan, *args, **kwargs):
+    def inject_noise_batch(self, mz, i, offsets, ms_levels, scan_ids=None, **kwargs):
+        """Vectorized inject_noise for a block of scans.
+
+        See AbstractNoiseInjector.inject_noise_batch for the arguments.
+        """
+        self.kwargs.update(kwargs)
+        lengths = np.diff(offsets)
+        rngs = self._get_batch_rngs(scan_ids, len(lengths))
+        # like in inject_noise, MSn scans only use the kwargs of this call
+        msn_peaks = np.repeat(np.asarray(ms_levels) > 1, lengths)
+        ppm_var = np.where(
+            msn_peaks, kwargs.get("ppm_var", 1), self.kwargs.get("ppm_var", 1)
+        )
+        variance = np.where(
+            msn_peaks, kwargs.get("variance", 0.02), self.kwargs.get("variance", 0.02)
+        )
+        mz = mz.copy()
+        i = i.copy()
+        mz_noise = mz * self._draw_batch(rngs, lengths, "normal", 0, ppm_var * 1e-6)
+        intensity_noise = self._draw_batch(rngs, lengths, "normal", i, i * variance) - i
+        mz += mz_noise
+        i += intensity_noise
+        i[i < 0] = 0
+        return self._dropout_batch(
+            mz, i, offsets, ms_levels, rngs, kwargs.get("dropout", 0.1)
+        )
+
+    def _ms1_noise(self, scan, *args, rng=np.random, **kwargs):
         """Generate ms1 noise.
 
         Args:
@@ -78,14 +274,14 @@ class GaussNoiseInjector(AbstractNoiseInjector):
             *args: Description
             **kwargs: Description
         """
-        mz_noise = self._generate_mz_noise(scan, *args, **kwargs)
-        intensity_noise = self._generate_intensity_noise(scan, *args, **kwargs)
+        mz_noise = self._generate_mz_noise(scan, *args, rng=rng, **kwargs)
+        intensity_noise = self._generate_intensity_noise(scan, *args, rng=rng, **kwargs)
         scan.mz += mz_noise
         scan.i += intensity_noise
         scan.i[scan.i < 0] = 0
         return scan
 
-    def _msn_noise(self, scan, *args, **kwargs):
+    def _msn_noise(self, scan, *args, rng=np.random, **kwargs):
         """Generate msn noise.
 
         Args:
@@ -93,21 +289,21 @@ class GaussNoiseInjector(AbstractNoiseInjector):
             *args: Description
             **kwargs: Description
         """
-        mz_noise = self._generate_mz_noise(scan, *args, **kwargs)
-        intensity_noise = self._generate_intensity_noise(scan, *args, **kwargs)
+        mz_noise = self._generate_mz_noise(scan, *args, rng=rng, **kwargs)
+        intensity_noise = self._generate_intensity_noise(scan, *args, rng=rng, **kwargs)
         scan.mz += mz_noise
         scan.i += intensity_noise
         scan.i[scan.i < 0] = 0
         # remove some mz values
         dropout = kwargs.get("dropout", 0.1)
         dropout_mask = [
-            False if c < dropout else True for c in np.random.random(len(scan.mz))
+            False if c < dropout else True for c in rng.random(len(scan.mz))
         ]
         scan.mz = scan.mz[dropout_mask]
         scan.i = scan.i[dropout_mask]
         return scan
 
-    def _generate_mz_noise(self, scan, *args, **kwargs):
+    def _generate_mz_noise(self, scan, *args, rng=np.random, **kwargs):
         """Generate noise for mz_array.
 
         Args:
@@ -117,13 +313,13 @@ class GaussNoiseInjector(AbstractNoiseInjector):
         """
         ppm_offset = kwargs.get("ppm_offset", 0)
         ppm_var = kwargs.get("ppm_var", 1)
-        noise_level = np.random.normal(0, ppm_var * 1e-6, len(scan.mz))
+        noise_level = rng.normal(0, ppm_var * 1e-6, len(scan.mz))
         # noise_level = np.zeros(len(scan.mz))
         noise = scan.mz * noise_level
         # noise = np.zeros(len(scan.mz))
         return noise
 
-    def _generate_intensity_noise(self, scan, *args, **kwargs):
+    def _generate_intensity_noise(self, scan, *args, rng=np.random, **kwargs):
         """Generate intensity noise.
 
         Args:
@@ -131,7 +327,7 @@ class GaussNoiseInjector(AbstractNoiseInjector):
             *args: Description
             **kwargs: Description
         """
-        noise = np.random.normal(
+        noise = rng.normal(
             # np.array(np.zeros(len(scan.i))),
             np.array(scan.i),
             np.array(scan.i) * kwargs.get("variance", 0.02),
@@ -142,7 +338,7 @@ class GaussNoiseInjector(AbstractNoiseInjector):
 
 class UniformNoiseInjector(AbstractNoiseInjector):
     def __init__(self, *args, **kwargs):
-        # np.random.seed(1312)
+        self.seed = kwargs.pop("seed", None)
         logger.info("Initialize UniformNoiseInjector")
         self.args = args
         self.kwargs = kwargs
@@ -158,13 +354,39 @@ class UniformNoiseInjector(AbstractNoiseInjector):
         """
         self.kwargs.update(kwargs)
         # self.args += args
+        rng = self._get_rng(scan.id)
         if scan.ms_level == 1:
-            scan = self._ms1_noise(scan, *self.args, **self.kwargs)
+            scan = self._ms1_noise(scan, *self.args, rng=rng, **self.kwargs)
         elif scan.ms_level > 1:
-            scan = self._msn_noise(scan, *self.args, **self.kwargs)
+            scan = self._msn_noise(scan, *self.args, rng=rng, **self.kwargs)
         return scan
 
-    def _ms1_noise(self, scan, *args, **kwargs):
+    def inject_noise_batch(self, mz, i, offsets, ms_levels, scan_ids=None, **kwargs):
+        """Vectorized inject_noise for a block of scans.
+
+        See AbstractNoiseInjector.inject_noise_batch for the arguments.
+        """
+        self.kwargs.update(kwargs)
+        lengths = np.diff(offsets)
+        rngs = self._get_batch_rngs(scan_ids, len(lengths))
+        ppm_noise = self.kwargs.get("ppm_noise", 5e-6)
+        intensity_scale = self.kwargs.get("intensity_noise", 0.2)
+        mz = mz.copy()
+        i = i.copy()
+        mz_noise = self._draw_batch(
+            rngs, lengths, "uniform", (mz * ppm_noise) * -1, mz * ppm_noise
+        )
+        intensity_noise = self._draw_batch(
+            rngs, lengths, "uniform", (i * intensity_scale) * -1, i * intensity_scale
+        )
+        mz += mz_noise
+        i += intensity_noise
+        i[i < 0] = 0
+        return self._dropout_batch(
+            mz, i, offsets, ms_levels, rngs, self.kwargs.get("dropout", 0.1)
+        )
+
+    def _ms1_noise(self, scan, *args, rng=np.random, **kwargs):
         """Generate ms1 noise.
 
         Args:
@@ -172,14 +394,14 @@ class UniformNoiseInjector(AbstractNoiseInjector):
             *args: Description
             **kwargs: Description
         """
-        mz_noise = self._generate_mz_noise(scan, *args, **kwargs)
-        intensity_noise = self._generate_intensity_noise(scan, *args, **kwargs)
+        mz_noise = self._generate_mz_noise(scan, *args, rng=rng, **kwargs)
+        intensity_noise = self._generate_intensity_noise(scan, *args, rng=rng, **kwargs)
         scan.mz += mz_noise
         scan.i += intensity_noise
         scan.i[scan.i < 0] = 0
         return scan
 
-    def _msn_noise(self, scan, *args, **kwargs):
+    def _msn_noise(self, scan, *args, rng=np.random, **kwargs):
         """Generate msn noise.
 
         Args:
@@ -187,21 +409,21 @@ class UniformNoiseInjector(AbstractNoiseInjector):
             *args: Description
             **kwargs: Description
         """
-        mz_noise = self._generate_mz_noise(scan, *args, **kwargs)
-        intensity_noise = self._generate_intensity_noise(scan, *args, **kwargs)
+        mz_noise = self._generate_mz_noise(scan, *args, rng=rng, **kwargs)
+        intensity_noise = self._generate_intensity_noise(scan, *args, rng=rng, **kwargs)
         scan.mz += mz_noise
         scan.i += intensity_noise
         scan.i[scan.i < 0] = 0
         # scan.mz[scan.mz < 0] = 0
         dropout = kwargs.get("dropout", 0.1)
         dropout_mask = [
-            False if c < dropout else True for c in np.random.random(len(scan.mz))
+            False if c < dropout else True for c in rng.random(len(scan.mz))
         ]
         scan.mz = scan.mz[dropout_mask]
         scan.i = scan.i[dropout_mask]
         return scan
 
-    def _generate_mz_noise(self, scan, *args, **kwargs):
+    def _generate_mz_noise(self, scan, *args, rng=np.random, **kwargs):
         """Generate noise for mz_array.
 
         Args:
@@ -211,14 +433,14 @@ class UniformNoiseInjector(AbstractNoiseInjector):
         """
         # noise_level = np.random.normal(ppm_offset * 5e-6, ppm_var * 5e-6, len(scan.mz))
         # get scaling from kwargs
-        noise = np.random.uniform(
+        noise = rng.uniform(
             (scan.mz * kwargs.get("ppm_noise", 5e-6)) * -1,
             scan.mz * kwargs.get("ppm_noise", 5e-6),
         )
         # noise = scan.mz * noise_level
         return noise
 
-    def _generate_intensity_noise(self, scan, *args, **kwargs):
+    def _generate_intensity_noise(self, scan, *args, rng=np.random, **kwargs):
         """Generate intensity noise.
 
         Args:
@@ -227,7 +449,7 @@ class UniformNoiseInjector(AbstractNoiseInjector):
             **kwargs: Description
         """
         # get scaling from kwargs
-        noise = np.random.uniform(
+        noise = rng.uniform(
             (scan.i * kwargs.get("intensity_noise", 0.2)) * -1,
             scan.i * kwargs.get("intensity_noise", 0.2),
         )
@@ -236,7 +458,7 @@ class UniformNoiseInjector(AbstractNoiseInjector):
 
 class PPMShiftInjector(AbstractNoiseInjector):
     def __init__(self, *args, **kwargs):
-        # np.random.seed(1312)
+        self.seed = kwargs.pop("seed", None)
         logger.info("Initialize PPMShiftInjector")
         self.args = args
         self.kwargs = kwargs
@@ -252,13 +474,35 @@ class PPMShiftInjector(AbstractNoiseInjector):
         """
         self.kwargs.update(kwargs)
         # self.args += args
+        rng = self._get_rng(scan.id)
         if scan.ms_level == 1:
-            scan = self._ms1_noise(scan, *self.args, **self.kwargs)
+            scan = self._ms1_noise(scan, *self.args, rng=rng, **self.kwargs)
         elif scan.ms_level > 1:
-            scan = self._msn_noise(scan, *self.args, **self.kwargs)
+            scan = self._msn_noise(scan, *self.args, rng=rng, **self.kwargs)
         return scan
 
-    def _ms1_noise(self, scan, *args, **kwargs):
+    def inject_noise_batch(self, mz, i, offsets, ms_levels, scan_ids=None, **kwargs):
+        """Vectorized inject_noise for a block of scans.
+
+        See AbstractNoiseInjector.inject_noise_batch for the arguments.
+        """
+        self.kwargs.update(kwargs)
+        lengths = np.diff(offsets)
+        rngs = self._get_batch_rngs(scan_ids, len(lengths))
+        mz = mz.copy()
+        i = i.copy()
+        mz += (
+            self._draw_batch(
+                rngs, lengths, "normal", self.kwargs["offset"], self.kwargs["sigma"]
+            )
+            * mz
+        )
+        i[i < 0] = 0
+        return self._dropout_batch(
+            mz, i, offsets, ms_levels, rngs, self.kwargs.get("dropout", 0.1)
+        )
+
+    def _ms1_noise(self, scan, *args, rng=np.random, **kwargs):
         """Generate ms1 noise.
 
         Args:
@@ -266,14 +510,14 @@ class PPMShiftInjector(AbstractNoiseInjector):
             *args: Description
             **kwargs: Description
         """
-        mz_noise = self._generate_mz_noise(scan, *args, **kwargs)
-        intensity_noise = self._generate_intensity_noise(scan, *args, **kwargs)
+        mz_noise = self._generate_mz_noise(scan, *args, rng=rng, **kwargs)
+        intensity_noise = self._generate_intensity_noise(scan, *args, rng=rng, **kwargs)
         scan.mz += mz_noise
         scan.i += intensity_noise
         scan.i[scan.i < 0] = 0
         return scan
 
-    def _msn_noise(self, scan, *args, **kwargs):
+    def _msn_noise(self, scan, *args, rng=np.random, **kwargs):
         """Generate msn noise.
 
         Args:
@@ -281,21 +525,21 @@ class PPMShiftInjector(AbstractNoiseInjector):
             *args: Description
             **kwargs: Description
         """
-        mz_noise = self._generate_mz_noise(scan, *args, **kwargs)
-        intensity_noise = self._generate_intensity_noise(scan, *args, **kwargs)
+        mz_noise = self._generate_mz_noise(scan, *args, rng=rng, **kwargs)
+        intensity_noise = self._generate_intensity_noise(scan, *args, rng=rng, **kwargs)
         scan.mz += mz_noise
         scan.i += intensity_noise
         scan.i[scan.i < 0] = 0
         # scan.mz[scan.mz < 0] = 0
         dropout = kwargs.get("dropout", 0.1)
         dropout_mask = [
-            False if c < dropout else True for c in np.random.random(len(scan.mz))
+            False if c < dropout else True for c in rng.random(len(scan.mz))
         ]
         scan.mz = scan.mz[dropout_mask]
         scan.i = scan.i[dropout_mask]
         return scan
 
-    def _generate_mz_noise(self, scan, *args, **kwargs):
+    def _generate_mz_noise(self, scan, *args, rng=np.random, **kwargs):
         """Generate noise for mz_array.
 
         Args:
@@ -307,11 +551,11 @@ class PPMShiftInjector(AbstractNoiseInjector):
         # get scaling from kwargs
         offset = self.kwargs["offset"]
         sigma = self.kwargs["sigma"]
-        noise = np.random.normal(offset, sigma, len(scan.mz))
+        noise = rng.normal(offset, sigma, len(scan.mz))
         noise = noise * scan.mz
         return noise
 
-    def _generate_intensity_noise(self, scan, *args, **kwargs):
+    def _generate_intensity_noise(self, scan, *args, rng=np.random, **kwargs):
         """Generate intensity noise.
 
         Args:
@@ -338,42 +582,119 @@ class JamssNoiseInjector(AbstractNoiseInjector):
                 - a: scale intensity sigma by this
                 - b: controll falling of intensity sigma with higher intensities with this
                 - c: constant to add to intensity sigma
+                - seed: seed for reproducible noise per scan id
         """
-        # np.random.seed(1312)
+        self.seed = kwargs.pop("seed", None)
         logger.info("Initialize JamssNoiseInjector")
         self.args = args
         self.kwargs = kwargs
 
     def inject_noise(self, scan, *args, **kwargs):
         self.kwargs.update(kwargs)
+        rng = self._get_rng(scan.id)
         if scan.ms_level == 1:
-            scan = self._ms1_noise(scan, *self.args, **self.kwargs)
+            scan = self._ms1_noise(scan, *self.args, rng=rng, **self.kwargs)
         elif scan.ms_level > 1:
-            scan = self._msn_noise(scan, *self.args, **self.kwargs)
+            scan = self._msn_noise(scan, *self.args, rng=rng, **self.kwargs)
         return scan
 
-    def _add_white_noise(self, scan):
-        n = int(np.random.uniform(100, 500))
+    def inject_noise_batch(self, mz, i, offsets, ms_levels, scan_ids=None, **kwargs):
+        """Vectorized inject_noise for a block of scans.
+
+        See AbstractNoiseInjector.inject_noise_batch for the arguments.
+        """
+        self.kwargs.update(kwargs)
+        ms_levels = np.asarray(ms_levels)
+        rngs = self._get_batch_rngs(scan_ids, len(ms_levels))
+        mz, i, offsets = self._add_white_noise_batch(
+            mz, i, offsets, ms_levels == 1, rngs
+        )
+        lengths = np.diff(offsets)
+        max_i = np.repeat(_segment_max(i, offsets), lengths)
+        norm_int = i / max_i * 100
+        # same parameters as _generate_mz_noise and _generate_intensity_noise
+        sigma = 0.001701 * norm_int ** (-0.2)
+        mz_noise = self._draw_batch(rngs, lengths, "normal", mz, sigma) - mz
+        sigma = 10.34 * (1 - math.e ** (-0.00712 * norm_int)) + 0.12
+        intensity_noise = self._draw_batch(rngs, lengths, "normal", 0, sigma)
+        intensity_noise *= max_i / 100
+        mz = mz + mz_noise
+        i = i + intensity_noise
+        i[i < 0] = 0
+        mz, i, offsets = self._dropout_batch(
+            mz, i, offsets, ms_levels, rngs, self.kwargs.get("dropout", 0.1)
+        )
+        return self._add_white_noise_batch(mz, i, offsets, ms_levels > 1, rngs)
+
+    def _add_white_noise_batch(self, mz, i, offsets, selected, rngs):
+        """Vectorized _add_white_noise for the selected scans of a block.
+
+        Args:
+            mz (np.ndarray): concatenated mz arrays of all scans
+            i (np.ndarray): concatenated intensity arrays of all scans
+            offsets (np.ndarray): start of every scan plus the total number of peaks
+            selected (np.ndarray): mask of the scans to add white noise to
+            rngs (list): generator for every scan or None
+
+        Returns:
+            Tuple[np.ndarray, np.ndarray, np.ndarray]: mz, i and offsets
+        """
+        if rngs is not None:
+            rngs = [rng for rng, is_selected in zip(rngs, selected) if is_selected]
+        once = np.ones(selected.sum(), dtype=int)
+        n = self._draw_batch(rngs, once, "uniform", 100, 500).astype(int)
+        white_noise_i = self._draw_batch(rngs, n, "uniform", 1, 100)
+        white_noise_offsets = np.r_[0, np.cumsum(n)]
+        max_perc_noise = 0.75
+        min_perc_noise = 0.5
+        total_tic = 5e6
+        white_noise_i = (
+            white_noise_i
+            / np.repeat(_segment_sum(white_noise_i, white_noise_offsets), n)
+            * np.repeat(
+                self._draw_batch(rngs, once, "uniform", min_perc_noise, max_perc_noise),
+                n,
+            )
+            * total_tic
+        )
+        white_noise_mz = self._draw_batch(rngs, n, "uniform", 0, 1200)
+
+        lengths = np.diff(offsets)
+        owner = np.concatenate(
+            (
+                np.repeat(np.arange(len(lengths)), lengths),
+                np.repeat(np.flatnonzero(selected), n),
+            )
+        )
+        new_mz = np.concatenate((mz, white_noise_mz))
+        new_i = np.concatenate((i, white_noise_i))
+        # only scans with white noise are sorted, lexsort is stable
+        sort = np.lexsort((np.where(selected[owner], new_mz, 0), owner))
+        lengths = np.bincount(owner, minlength=len(lengths))
+        return new_mz[sort], new_i[sort], np.r_[0, np.cumsum(lengths)]
+
+    def _add_white_noise(self, scan, rng=np.random):
+        n = int(rng.uniform(100, 500))
         if sum(scan.i) == 0:
             total_tic = 5e6
         else:
             total_tic = sum(scan.i)
             total_tic = 5e6
         # logger.info(f"Total TIC: {sum(scan.i)}")
-        white_noise_i = np.random.uniform(1, 100, n)
+        white_noise_i = rng.uniform(1, 100, n)
         max_perc_noise = 0.75
         min_perc_noise = 0.5
         white_noise_i = (
             white_noise_i
             / white_noise_i.sum()
-            * np.random.uniform(min_perc_noise, max_perc_noise)
+            * rng.uniform(min_perc_noise, max_perc_noise)
             * total_tic
         )
         # logger.info(f'Add white noise intensity: {white_noise_i}')
-        # scale = np.random.uniform(1e5, 1e8) / n
+        # scale = rng.uniform(1e5, 1e8) / n
         # white_noise_i *= scale
         # logger.info(f"Noise: {sum(white_noise_i)}")
-        white_noise_mz = np.random.uniform(0, 1200, n)
+        white_noise_mz = rng.uniform(0, 1200, n)
         new_i = np.concatenate((scan.i, white_noise_i))
         new_mz = np.concatenate((scan.mz, white_noise_mz))
         # logger.info(f'Add new white noise {new_i}')
@@ -382,12 +703,12 @@ class JamssNoiseInjector(AbstractNoiseInjector):
         scan.i = new_i[sort]
         return scan
 
-    def _ms1_noise(self, scan, *args, **kwargs):
+    def _ms1_noise(self, scan, *args, rng=np.random, **kwargs):
         # i_b = sum(scan.i)
-        scan = self._add_white_noise(scan)
-        mz_noise = self._generate_mz_noise(scan, *args, **kwargs)
+        scan = self._add_white_noise(scan, rng=rng)
+        mz_noise = self._generate_mz_noise(scan, *args, rng=rng, **kwargs)
         # logger.debug(f"MS1 mz noise: {mz_noise}")
-        intensity_noise = self._generate_intensity_noise(scan, *args, **kwargs)
+        intensity_noise = self._generate_intensity_noise(scan, *args, rng=rng, **kwargs)
         scan.mz += mz_noise
         scan.i += intensity_noise
 
@@ -396,10 +717,10 @@ class JamssNoiseInjector(AbstractNoiseInjector):
         scan.i[scan.i < 0] = 0
         return scan
 
-    def _msn_noise(self, scan, *args, **kwargs):
-        mz_noise = self._generate_mz_noise(scan, *args, **kwargs)
+    def _msn_noise(self, scan, *args, rng=np.random, **kwargs):
+        mz_noise = self._generate_mz_noise(scan, *args, rng=rng, **kwargs)
         # logger.debug(f"MSn mz noise: {mz_noise}")
-        intensity_noise = self._generate_intensity_noise(scan, *args, **kwargs)
+        intensity_noise = self._generate_intensity_noise(scan, *args, rng=rng, **kwargs)
         scan.mz += mz_noise
         scan.i += intensity_noise
         scan.i[scan.i < 0] = 0
@@ -407,14 +728,14 @@ class JamssNoiseInjector(AbstractNoiseInjector):
         dropout = kwargs.get("dropout", 0.1)
         # logger.debug(f"Dropout: {dropout}")
         dropout_mask = [
-            False if c < dropout else True for c in np.random.random(len(scan.mz))
+            False if c < dropout else True for c in rng.random(len(scan.mz))
         ]
         scan.mz = scan.mz[dropout_mask]
         scan.i = scan.i[dropout_mask]
-        scan = self._add_white_noise(scan)
+        scan = self._add_white_noise(scan, rng=rng)
         return scan
 
-    def _generate_mz_noise(self, scan, *args, **kwargs):
+    def _generate_mz_noise(self, scan, *args, rng=np.random, **kwargs):
         try:
             norm_int = scan.i / max(scan.i) * 100
         except ValueError:
@@ -427,12 +748,12 @@ class JamssNoiseInjector(AbstractNoiseInjector):
         y = 0.543
         y = 0.2
         sigma = m * norm_int ** (-y)
-        noise = np.random.normal(loc=scan.mz, scale=sigma)
+        noise = rng.normal(loc=scan.mz, scale=sigma)
         noise -= scan.mz
         noise_mock = np.zeros(len(scan.mz))
         return noise
 
-    def _generate_intensity_noise(self, scan, *args, **kwargs):
+    def _generate_intensity_noise(self, scan, *args, rng=np.random, **kwargs):
         try:
             norm_int = scan.i / max(scan.i) * 100
         except ValueError:
@@ -445,7 +766,7 @@ class JamssNoiseInjector(AbstractNoiseInjector):
         c = 0.00712
         d = 0.12
         sigma = m * (1 - math.e ** (-c * norm_int)) + d
-        noise = np.random.normal(loc=0, scale=sigma)
+        noise = rng.normal(loc=0, scale=sigma)
         if len(scan.i) > 0:
             noise *= max(scan.i) / 100
         else:
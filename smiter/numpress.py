@@ -0,0 +1,230 @@
+"""MS-Numpress compression of binary data arrays.
+
+Vectorized implementation of the linear prediction (m/z), short logged float
+and positive integer (intensity) codecs of MS-Numpress
+(Teleman et al., 2014, doi:10.1074/mcp.O114.037879), byte compatible with the
+reference implementation. Decoding is only needed for verification and is
+therefore implemented as a plain loop.
+
+Attributes:
+    NUMPRESS_CODECS (dict): mapping codec name to encoding function
+"""
+import math
+from typing import Callable, Dict, List, Optional
+
+import numpy as np
+
+
+def optimal_linear_fixed_point(data: np.ndarray) -> float:
+    """Calculate the largest fixed point keeping prediction residuals in 32 bit.
+
+    Args:
+        data (np.ndarray): data to encode
+
+    Returns:
+        float: fixed point
+    """
+    data = np.asarray(data, dtype=np.float64)
+    if len(data) == 0:
+        return 0.0
+    if len(data) == 1:
+        return float(math.floor(0x7FFFFFFF / data[0]))
+    max_double = max(data[0], data[1])
+    if len(data) > 2:
+        extrapolation = 2 * data[1:-1] - data[:-2]
+        max_double = max(
+            max_double, np.ceil(np.abs(data[2:] - extrapolation) + 1).max()
+        )
+    return float(math.floor(0x7FFFFFFF / max_double))
+
+
+def optimal_slof_fixed_point(data: np.ndarray) -> float:
+    """Calculate the largest fixed point at which logged values fit in 16 bit.
+
+    Args:
+        data (np.ndarray): data to encode
+
+    Returns:
+        float: fixed point
+    """
+    data = np.asarray(data, dtype=np.float64)
+    if len(data) == 0:
+        return 0.0
+    max_double = max(1.0, np.log(data + 1).max())
+    return float(math.floor(0xFFFF / max_double))
+
+
+def _encode_ints(values: np.ndarray) -> np.ndarray:
+    """Encode 32 bit integers as half bytes without leading 0 or f half bytes.
+
+    Every integer is stored as a half byte with the number of truncated
+    leading half bytes (+8 if they are f) followed by the remaining half bytes,
+    least significant first.
+
+    Args:
+        values (np.ndarray): integers
+
+    Returns:
+        np.ndarray: half bytes
+    """
+    values = np.asarray(values, dtype=np.int64).astype(np.uint32)
+    half_bytes = (values[:, None] >> (4 * np.arange(8, dtype=np.uint32))) & 0xF
+    # most significant half byte first, count run of leading 0 or f
+    leading = half_bytes[:, ::-1]
+    is_negative = leading[:, 0] == 0xF
+    fill = np.where(is_negative, 0xF, 0)
+    run = np.cumprod(leading == fill[:, None], axis=1).sum(axis=1)
+    truncated = np.where(is_negative, np.minimum(run, 7), run)
+    header = np.where(is_negative, truncated + 8, truncated)
+    encoded = np.concatenate([header[:, None], half_bytes], axis=1)
+    keep = np.arange(9) < (9 - truncated)[:, None]
+    return encoded[keep].astype(np.uint8)
+
+
+def _pack_half_bytes(half_bytes: np.ndarray) -> bytes:
+    """Pack half bytes into bytes, high half byte first.
+
+    Args:
+        half_bytes (np.ndarray): half bytes
+
+    Returns:
+        bytes: packed half bytes, padded with 0
+    """
+    if len(half_bytes) % 2 == 1:
+        half_bytes = np.append(half_bytes, np.uint8(0))
+    return ((half_bytes[0::2] << 4) | half_bytes[1::2]).astype(np.uint8).tobytes()
+
+
+def _decode_ints(data: bytes) -> List[int]:
+    """Decode integers encoded with _encode_ints.
+
+    Args:
+        data (bytes): packed half bytes
+
+    Returns:
+        List[int]: integers
+    """
+    array = np.frombuffer(data, dtype=np.uint8)
+    half_bytes = np.empty(2 * len(array), dtype=np.uint8)
+    half_bytes[0::2] = array >> 4
+    half_bytes[1::2] = array & 0xF
+    values = []
+    pos = 0
+    while pos < len(half_bytes):
+        header = int(half_bytes[pos])
+        truncated = header - 8 if header > 8 else header
+        if pos + 9 - truncated > len(half_bytes):
+            # padding
+            break
+        value = 0
+        for n, half_byte in enumerate(half_bytes[pos + 1 : pos + 9 - truncated]):
+            value |= int(half_byte) << (4 * n)
+        if header > 8:
+            value |= (0xFFFFFFFF << (4 * (8 - truncated))) & 0xFFFFFFFF
+        if value > 0x7FFFFFFF:
+            value -= 0x100000000
+        values.append(value)
+        pos += 9 - truncated
+    return values
+
+
+def encode_linear(data: np.ndarray, fixed_point: Optional[float] = None) -> bytes:
+    """Encode smooth data like m/z arrays by linear prediction.
+
+    Args:
+        data (np.ndarray): data to encode
+        fixed_point (float, optional): scaling factor, optimal if not given
+
+    Returns:
+        bytes: encoded data
+    """
+    data = np.asarray(data, dtype=np.float64)
+    if fixed_point is None:
+        fixed_point = optimal_linear_fixed_point(data)
+    encoded = np.array([fixed_point], dtype=">f8").tobytes()
+    ints = np.floor(data * fixed_point + 0.5).astype(np.int64)
+    encoded += ints[:2].astype("<u4").tobytes()
+    if len(data) > 2:
+        residuals = ints[2:] - (2 * ints[1:-1] - ints[:-2])
+        encoded += _pack_half_bytes(_encode_ints(residuals))
+    return encoded
+
+
+def decode_linear(data: bytes) -> np.ndarray:
+    """Decode data encoded with encode_linear.
+
+    Args:
+        data (bytes): encoded data
+
+    Returns:
+        np.ndarray: decoded data
+    """
+    fixed_point = np.frombuffer(data[:8], dtype=">f8")[0]
+    ints = np.frombuffer(data[8:16], dtype="<u4").astype(np.int64).tolist()
+    for residual in _decode_ints(data[16:]):
+        ints.append(2 * ints[-1] - ints[-2] + residual)
+    return np.array(ints, dtype=np.float64) / fixed_point
+
+
+def encode_slof(data: np.ndarray, fixed_point: Optional[float] = None) -> bytes:
+    """Encode intensities as 16 bit fixed point logarithms.
+
+    Args:
+        data (np.ndarray): non-negative data to encode
+        fixed_point (float, optional): scaling factor, optimal if not given
+
+    Returns:
+        bytes: encoded data
+    """
+    data = np.asarray(data, dtype=np.float64)
+    if fixed_point is None:
+        fixed_point = optimal_slof_fixed_point(data)
+    encoded = np.array([fixed_point], dtype=">f8").tobytes()
+    ints = np.floor(np.log(data + 1) * fixed_point + 0.5).astype("<u2")
+    return encoded + ints.tobytes()
+
+
+def decode_slof(data: bytes) -> np.ndarray:
+    """Decode data encoded with encode_slof.
+
+    Args:
+        data (bytes): encoded data
+
+    Returns:
+        np.ndarray: decoded data
+    """
+    fixed_point = np.frombuffer(data[:8], dtype=">f8")[0]
+    ints = np.frombuffer(data[8:], dtype="<u2")
+    return np.exp(ints / fixed_point) - 1
+
+
+def encode_pic(data: np.ndarray) -> bytes:
+    """Encode intensities as rounded positive integers.
+
+    Args:
+        data (np.ndarray): non-negative data to encode
+
+    Returns:
+        bytes: encoded data
+    """
+    data = np.asarray(data, dtype=np.float64)
+    return _pack_half_bytes(_encode_ints(np.floor(data + 0.5)))
+
+
+def decode_pic(data: bytes) -> np.ndarray:
+    """Decode data encoded with encode_pic.
+
+    Args:
+        data (bytes): encoded data
+
+    Returns:
+        np.ndarray: decoded data
+    """
+    return np.array(_decode_ints(data), dtype=np.float64)
+
+
+NUMPRESS_CODECS: Dict[str, Callable[[np.ndarray], bytes]] = {
+    "linear": encode_linear,
+    "slof": encode_slof,
+    "pic": encode_pic,
+}
@@ -19,4 +19,16 @@ default_mzml_params = {
     "max_ms2_spectra": 10,
     "mz_lower_limit": 100,
     "mz_upper_limit": 1600,
+    "n_processes": 1,  # > 1 generates MS1 scans in a process pool
+    "rt_chunk_length": 60,  # in seconds, gradient chunk per worker task
+    "precompute_fragments": False,  # fragment all molecules before scan generation
+    "indexed_mzml": True,  # write spectrum and chromatogram offsets
+    "mz_encoding": 64,  # float precision in bits
+    "intensity_encoding": 32,
+    "mz_compression": "zlib",  # none, zlib or numpress_linear(_zlib)
+    "intensity_compression": "zlib",  # none, zlib, numpress_slof/pic(_zlib)
+    "n_encoding_processes": 1,  # > 1 encodes binary arrays in a process pool
+    # "isotopologue_cache_dir": "cache",  # reuse isotope envelopes across runs
+    # "parquet_file": "spectra.parquet",  # write spectra as Parquet alongside mzML
+    "parquet_row_group_size": 1024,  # spectra per Parquet row group
 }
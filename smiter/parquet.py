@@ -0,0 +1,226 @@
+"""Columnar Parquet export of simulated spectra and ground truth.
+
+Spectra are written with one row per spectrum and m/z and intensities as
+list columns, so they can be loaded as arrays (e.g. for machine learning)
+without parsing mzML. Rows are buffered and written in row groups while
+scans are generated. The peak properties of all molecules (the ground truth
+of the simulation) can be exported the same way.
+
+pyarrow is an optional dependency of smiter and only needed for this module.
+"""
+import pathlib
+from typing import Iterable, Iterator, List, Tuple, Union
+
+import numpy as np
+import pyarrow as pa
+import pyarrow.parquet as pq
+from loguru import logger
+
+from smiter.lib import PEAK_FUNCTIONS, PeakTable, check_peak_properties
+from smiter.synthetic_mzml import Scan
+
+
+def spectrum_schema(mz_encoding: int = 64, intensity_encoding: int = 32) -> pa.Schema:
+    """Arrow schema of the spectrum table.
+
+    Args:
+        mz_encoding (int, optional): float precision of m/z values, 32 or 64
+        intensity_encoding (int, optional): float precision of intensities,
+            32 or 64
+
+    Returns:
+        pa.Schema: spectrum schema, precursor columns are null for MS1 spectra
+    """
+    floats = {32: pa.float32(), 64: pa.float64()}
+    return pa.schema(
+        [
+            ("id", pa.int64()),
+            ("rt", pa.float64()),
+            ("ms_level", pa.int8()),
+            ("mz", pa.list_(floats[mz_encoding])),
+            ("i", pa.list_(floats[intensity_encoding])),
+            ("precursor_mz", pa.float64()),
+            ("precursor_i", pa.float64()),
+            ("precursor_charge", pa.int32()),
+            ("precursor_scan_id", pa.int64()),
+        ]
+    )
+
+
+class ParquetScanWriter(object):
+    """Write scans to a Parquet file in row groups."""
+
+    def __init__(
+        self,
+        file: str,
+        row_group_size: int = 1024,
+        mz_encoding: int = 64,
+        intensity_encoding: int = 32,
+        compression: str = "zstd",
+    ):
+        """Initialize writer.
+
+        Args:
+            file (str): path of the Parquet file
+            row_group_size (int, optional): number of spectra per row group
+            mz_encoding (int, optional): float precision of m/z values
+            intensity_encoding (int, optional): float precision of intensities
+            compression (str, optional): Parquet compression codec
+        """
+        self.schema = spectrum_schema(mz_encoding, intensity_encoding)
+        self.row_group_size = row_group_size
+        self.writer = pq.ParquetWriter(file, self.schema, compression=compression)
+        self.rows: List[Scan] = []
+        self.spectrum_count = 0
+
+    def write(self, scan: Scan):
+        """Add scan, a row group is written if row_group_size scans are buffered.
+
+        Args:
+            scan (Scan): scan to write
+        """
+        self.rows.append(scan)
+        if len(self.rows) >= self.row_group_size:
+            self.flush()
+
+    def write_cycle(self, scan: Scan, products: List[Scan]):
+        """Add a MS1 scan and its MS2 scans.
+
+        Args:
+            scan (Scan): MS1 scan
+            products (List[Scan]): MS2 scans
+        """
+        self.write(scan)
+        for product in products:
+            self.write(product)
+
+    def iter_write(
+        self, scans: Iterable[Tuple[Scan, List[Scan]]]
+    ) -> Iterator[Tuple[Scan, List[Scan]]]:
+        """Write scans while passing them on, e.g. to write_scans.
+
+        Args:
+            scans (Iterable[Tuple[Scan, List[Scan]]]): MS1 scans and their MS2 scans
+
+        Yields:
+            Tuple[Scan, List[Scan]]: MS1 scan and its MS2 scans
+        """
+        for scan, products in scans:
+            self.write_cycle(scan, products)
+            yield scan, products
+
+    def _list_column(self, arrays: List[np.ndarray], value_type: pa.DataType):
+        lengths = np.fromiter(
+            (len(a) for a in arrays), dtype=np.int32, count=len(arrays)
+        )
+        offsets = np.zeros(len(arrays) + 1, dtype=np.int32)
+        np.cumsum(lengths, out=offsets[1:])
+        if len(arrays) > 0:
+            values = np.concatenate(arrays).astype(value_type.to_pandas_dtype())
+        else:
+            values = np.array([], dtype=value_type.to_pandas_dtype())
+        return pa.ListArray.from_arrays(pa.array(offsets), pa.array(values))
+
+    def flush(self):
+        """Write buffered scans as row group."""
+        if len(self.rows) == 0:
+            return
+        rows = self.rows
+        columns = [
+            pa.array([s.id for s in rows], type=pa.int64()),
+            pa.array([s.retention_time for s in rows], type=pa.float64()),
+            pa.array([s.ms_level for s in rows], type=pa.int8()),
+            self._list_column(
+                [np.asarray(s.mz) for s in rows],
+                self.schema.field("mz").type.value_type,
+            ),
+            self._list_column(
+                [np.asarray(s.i) for s in rows], self.schema.field("i").type.value_type
+            ),
+            pa.array([s.precursor_mz for s in rows], type=pa.float64()),
+            pa.array([s.precursor_i for s in rows], type=pa.float64()),
+            pa.array([s.precursor_charge for s in rows], type=pa.int32()),
+            pa.array([s.precursor_scan_id for s in rows], type=pa.int64()),
+        ]
+        self.writer.write_table(pa.Table.from_arrays(columns, schema=self.schema))
+        self.spectrum_count += len(rows)
+        self.rows = []
+
+    def close(self):
+        """Write remaining scans and close the file."""
+        self.flush()
+        self.writer.close()
+        logger.info(f"Wrote {self.spectrum_count} spectra to Parquet")
+
+    def __enter__(self) -> "ParquetScanWriter":
+        """Return writer.
+
+        Returns:
+            ParquetScanWriter: writer
+        """
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        """Close writer."""
+        self.close()
+
+
+def write_scans_parquet(
+    file: str,
+    scans: Iterable[Tuple[Scan, List[Scan]]],
+    row_group_size: int = 1024,
+    mz_encoding: int = 64,
+    intensity_encoding: int = 32,
+):
+    """Write scans to a Parquet file.
+
+    Args:
+        file (str): path of the Parquet file
+        scans (Iterable[Tuple[Scan, List[Scan]]]): MS1 scans and their MS2 scans
+        row_group_size (int, optional): number of spectra per row group
+        mz_encoding (int, optional): float precision of m/z values
+        intensity_encoding (int, optional): float precision of intensities
+    """
+    with ParquetScanWriter(
+        file,
+        row_group_size=row_group_size,
+        mz_encoding=mz_encoding,
+        intensity_encoding=intensity_encoding,
+    ) as writer:
+        for scan, products in scans:
+            writer.write_cycle(scan, products)
+
+
+def peak_properties_to_parquet(
+    peak_properties, parquet_file: Union[str, pathlib.Path]
+) -> Union[str, pathlib.Path]:
+    """Write peak properties of all molecules to a Parquet file.
+
+    Args:
+        peak_properties (Union[PeakTable, Dict[str, dict]]): peak properties
+        parquet_file (Union[str, pathlib.Path]): path of the Parquet file
+
+    Returns:
+        Union[str, pathlib.Path]: path of the Parquet file
+    """
+    logger.info(f"Write peak properties to {parquet_file}")
+    if isinstance(peak_properties, PeakTable):
+        table = peak_properties
+    else:
+        table = PeakTable.from_dict(check_peak_properties(peak_properties))
+    columns = {
+        "trivial_name": pa.array(table.molecules, type=pa.string()),
+        "chemical_formula": pa.array(list(table.chemical_formula), type=pa.string()),
+        "charge": pa.array(table.charge),
+        "scan_start_time": pa.array(table.scan_start_time),
+        "peak_width": pa.array(table.peak_width),
+        "peak_function": pa.array(
+            [PEAK_FUNCTIONS[f] for f in table.peak_function], type=pa.string()
+        ),
+        "peak_scaling_factor": pa.array(table.peak_scaling_factor),
+        "ionization_effiency": pa.array(table.ionization_effiency),
+    }
+    for param in PeakTable.param_columns:
+        columns[param] = pa.array(getattr(table, param), from_pandas=True)
+    pq.write_table(pa.table(columns), parquet_file)
+    return parquet_file
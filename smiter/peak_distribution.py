@@ -3,12 +3,14 @@
 
 Attributes:
     distributions (dict): mapping distribution name to distribution function
+    vectorized_distributions (dict): mapping distribution name to array-native
+        distribution function
 """
 import math
-from typing import Callable, Dict
+from typing import Callable, Dict, Union
 
+import numpy as np
 from loguru import logger
-from scipy.stats import gamma
 
 
 def gauss_dist(x: float, sigma: float = 1, mu: float = 0):
@@ -64,11 +66,97 @@ def gamma_dist(x: float, a: float = 5, scale: float = 0.33):
     Returns:
         float: y
     """
+    from scipy.stats import gamma
+
     return gamma.pdf(x, a=a, scale=scale)
 
 
+def gauss_dist_vectorized(
+    x: np.ndarray,
+    sigma: Union[float, np.ndarray] = 1,
+    mu: Union[float, np.ndarray] = 0,
+) -> np.ndarray:
+    """Calc Gauss distribution for arrays of x and parameters.
+
+    Args:
+        x (np.ndarray): x
+        sigma (Union[float, np.ndarray], optional): standard deviation(s)
+        mu (Union[float, np.ndarray], optional): mean(s)
+
+    Returns:
+        np.ndarray: y
+    """
+    x = np.asarray(x, dtype=float)
+    return (
+        (1 / (sigma * np.sqrt(2 * np.pi)) * np.exp(-0.5 * ((x - mu) / sigma) ** 2))
+        / 0.3989422804014327
+        * sigma
+    )
+
+
+def gauss_tail_vectorized(
+    x: np.ndarray,
+    mu: Union[float, np.ndarray],
+    sigma: Union[float, np.ndarray],
+    scan_start_time: Union[float, np.ndarray],
+    h: float = 1,
+    t: float = 0.2,
+    f: float = 0.01,
+) -> np.ndarray:
+    """Calc tailing Gauss distribution for arrays of x and parameters.
+
+    Like gauss_tail, sigma is derived from the distance to scan_start_time.
+
+    Args:
+        x (np.ndarray): x
+        mu (Union[float, np.ndarray]): mean(s)
+        sigma (Union[float, np.ndarray]): ignored, see gauss_tail
+        scan_start_time (Union[float, np.ndarray]): start of the peak(s)
+        h (float, optional): height
+        t (float, optional): increase of sigma with x
+        f (float, optional): sigma at scan_start_time
+
+    Returns:
+        np.ndarray: y
+    """
+    x = np.asarray(x, dtype=float)
+    sigma = t * (x - scan_start_time) + f
+    return h * np.exp(-0.5 * ((x - mu) / sigma) ** 2)
+
+
+def gamma_dist_vectorized(
+    x: np.ndarray,
+    a: Union[float, np.ndarray] = 5,
+    scale: Union[float, np.ndarray] = 0.33,
+) -> np.ndarray:
+    """Calc gamma distribution for arrays of x and parameters.
+
+    Evaluates the gamma pdf in log space with scipy.special ufuncs.
+
+    Args:
+        x (np.ndarray): x
+        a (Union[float, np.ndarray], optional): shape parameter(s)
+        scale (Union[float, np.ndarray], optional): scale parameter(s)
+
+    Returns:
+        np.ndarray: y
+    """
+    from scipy.special import gammaln, xlogy
+
+    z = np.asarray(x, dtype=float) / scale
+    with np.errstate(divide="ignore", invalid="ignore"):
+        log_pdf = xlogy(np.subtract(a, 1), z) - z - gammaln(a) - np.log(scale)
+        return np.where(z >= 0, np.exp(log_pdf), 0.0)
+
+
 distributions = {
     "gauss": gauss_dist,
     "gamma": gamma_dist,
     "gauss_tail": gauss_tail,
 }  # type: Dict[str, Callable]
+
+vectorized_distributions = {
+    "gauss": gauss_dist_vectorized,
+    "gamma": gamma_dist_vectorized,
+    "gauss_tail": gauss_tail_vectorized,
+}  # type: Dict[str, Callable]
@@ -1,116 +1,309 @@
 """Main module."""
+import base64
+import functools
+import hashlib
 import io
+import os
 import pathlib
 import time
 import warnings
+import zlib
 from pprint import pformat
-from typing import Callable, Dict, List, Tuple, Union
-from collections import Counter
+from typing import (
+    TYPE_CHECKING,
+    Callable,
+    Deque,
+    Dict,
+    Iterable,
+    Iterator,
+    List,
+    Optional,
+    Tuple,
+    Union,
+)
+from collections import Counter, deque
+from concurrent.futures import Future, ProcessPoolExecutor
 
 import numpy as np
-import pyqms
-import scipy as sci
-from intervaltree import IntervalTree
 from loguru import logger
-from psims.mzml import MzMLWriter
 from tqdm import tqdm
 
 import smiter
 from smiter.fragmentation_functions import AbstractFragmentor
 from smiter.lib import (
+    PEAK_FUNCTIONS,
+    PROTON,
+    PeakTable,
     calc_mz,
     check_mzml_params,
     check_peak_properties,
     peak_properties_to_csv,
 )
 from smiter.noise_functions import AbstractNoiseInjector
-from smiter.peak_distribution import distributions
+from smiter.peak_distribution import distributions, vectorized_distributions
+
+if TYPE_CHECKING:
+    from intervaltree import IntervalTree
+
+# pyqms, psims and intervaltree are imported where they are needed, so
+# importing smiter stays fast
 
 warnings.filterwarnings("ignore")
 
 
-class Scan(dict):
-    """Summary."""
+class Scan(object):
+    """Single MS1 or MS2 scan.
+
+    Scan properties are stored in slots. Dict-style access (scan["rt"],
+    scan.get("mz")) on the slot names is kept for backwards compatibility,
+    unset properties are None and missing for dict-style access.
+    """
+
+    __slots__ = (
+        "mz",
+        "i",
+        "id",
+        "rt",
+        "ms_level",
+        "precursor_mz",
+        "precursor_i",
+        "precursor_charge",
+        "precursor_scan_id",
+    )
+    mz: np.ndarray
+    i: np.ndarray
+    id: Optional[int]
+    rt: Optional[float]
+    ms_level: Optional[int]
+    precursor_mz: Optional[float]
+    precursor_i: Optional[float]
+    precursor_charge: Optional[int]
+    precursor_scan_id: Optional[int]
 
-    def __init__(self, data: dict = None):
+    def __init__(self, data: Optional[dict] = None):
         """Summary.
 
         Args:
-            dict (TYPE): Description
+            data (dict, optional): scan properties
+
+        Raises:
+            KeyError: if data contains an unknown scan property
         """
+        for key in self.__slots__:
+            setattr(self, key, None)
         if data is not None:
             self.update(data)
 
     @property
-    def mz(self):
+    def retention_time(self):
         """Summary."""
-        v = self.get("mz", None)
-        return v
+        return self.rt
 
-    @mz.setter
-    def mz(self, mz):
+    @retention_time.setter
+    def retention_time(self, rt):
         """Summary."""
-        self["mz"] = mz
+        self.rt = rt
 
-    @property
-    def i(self):
-        """Summary."""
-        v = self.get("i", None)
-        return v
+    def __getitem__(self, key: str):
+        """Get a set scan property, raises KeyError if it is not set."""
+        value = self.get(key, None)
+        if value is None:
+            raise KeyError(key)
+        return value
 
-    @i.setter
-    def i(self, i):
-        """Summary."""
-        self["i"] = i
+    def __setitem__(self, key: str, value):
+        """Set a scan property, raises KeyError for unknown properties."""
+        if key not in self.__slots__:
+            raise KeyError(f"Unknown scan property {key}")
+        setattr(self, key, value)
 
-    @property
-    def id(self):
-        """Summary."""
-        v = self.get("id", None)
-        return v
+    def __contains__(self, key: str) -> bool:
+        """Check if a scan property is set."""
+        return self.get(key, None) is not None
 
-    @property
-    def precursor_mz(self):
-        """Summary."""
-        v = self.get("precursor_mz", None)
-        return v
+    def __iter__(self):
+        """Iterate over the names of the set scan properties."""
+        return iter(self.keys())
 
-    @property
-    def precursor_i(self):
-        """Summary."""
-        v = self.get("precursor_i", None)
-        return v
+    def __len__(self) -> int:
+        """Return the number of set scan properties."""
+        return len(self.keys())
 
-    @property
-    def precursor_charge(self):
-        """Summary."""
-        v = self.get("precursor_charge", None)
-        return v
+    def __repr__(self) -> str:
+        """Representation with the set scan properties."""
+        return f"Scan({dict(self.items())})"
 
-    # @property
-    # def precursor_scan_id(self):
-    #     """Summary."""
-    #     v = self.get("precursor_scan_id", None)
-    #     return v
+    def get(self, key: str, default=None):
+        """Get scan property like dict.get.
 
-    @property
-    def retention_time(self):
-        """Summary."""
-        v = self.get("rt", None)
-        return v
+        Args:
+            key (str): property name
+            default (optional): returned if the property is not set
+
+        Returns:
+            property value or default
+        """
+        if key not in self.__slots__:
+            return default
+        value = getattr(self, key)
+        return default if value is None else value
+
+    def keys(self) -> List[str]:
+        """Names of the set scan properties."""
+        return [key for key in self.__slots__ if getattr(self, key) is not None]
+
+    def items(self) -> List[Tuple[str, object]]:
+        """Names and values of the set scan properties."""
+        return [(key, getattr(self, key)) for key in self.keys()]
+
+    def update(self, data: dict):
+        """Set scan properties like dict.update.
+
+        Args:
+            data (dict): scan properties
+
+        Raises:
+            KeyError: if data contains an unknown scan property
+        """
+        for key, value in data.items():
+            self[key] = value
+
+
+class ScanBlock(object):
+    """Peaks and properties of many scans in contiguous arrays.
+
+    The peaks of scan k are mz[offsets[k]:offsets[k + 1]] and
+    i[offsets[k]:offsets[k + 1]], all other scan properties are stored as one
+    array per property with one entry per scan (nan or -1 if not set). Scans
+    are only created on access and share the peak buffers.
+    """
+
+    float_properties = ("rt", "precursor_mz", "precursor_i")
+    int_properties = ("id", "ms_level", "precursor_charge", "precursor_scan_id")
+    rt: np.ndarray
+    precursor_mz: np.ndarray
+    precursor_i: np.ndarray
+    id: np.ndarray
+    ms_level: np.ndarray
+    precursor_charge: np.ndarray
+    precursor_scan_id: np.ndarray
+
+    def __init__(
+        self, mz: np.ndarray, i: np.ndarray, offsets: np.ndarray, **properties
+    ):
+        """Initialize block.
+
+        Args:
+            mz (np.ndarray): concatenated mz values of all scans
+            i (np.ndarray): concatenated intensities of all scans
+            offsets (np.ndarray): start of every scan in mz and i, followed by
+                the total number of peaks
+            **properties: one array per scan property, see Scan
+        """
+        self.mz = np.asarray(mz)
+        self.i = np.asarray(i)
+        self.offsets = np.asarray(offsets, dtype=np.int64)
+        n_scans = len(self.offsets) - 1
+        for key in self.float_properties:
+            value = properties.pop(key, None)
+            if value is None:
+                value = np.full(n_scans, np.nan)
+            setattr(self, key, np.asarray(value, dtype=float))
+        for key in self.int_properties:
+            value = properties.pop(key, None)
+            if value is None:
+                value = np.full(n_scans, -1)
+            setattr(self, key, np.asarray(value, dtype=np.int64))
+        if len(properties) > 0:
+            raise KeyError(f"Unknown scan properties {list(properties)}")
+
+    @classmethod
+    def from_scans(cls, scans: Iterable[Scan]) -> "ScanBlock":
+        """Pack scans into a block.
+
+        Args:
+            scans (Iterable[Scan]): scans
+
+        Returns:
+            ScanBlock: block with the scans in the given order
+        """
+        scans = list(scans)
+        offsets = np.zeros(len(scans) + 1, dtype=np.int64)
+        np.cumsum([len(scan.mz) for scan in scans], out=offsets[1:])
+        properties = {}
+        for key, missing in [(key, np.nan) for key in cls.float_properties] + [
+            (key, -1) for key in cls.int_properties
+        ]:
+            properties[key] = [
+                missing if scan.get(key) is None else scan.get(key) for scan in scans
+            ]
+        if len(scans) > 0:
+            mz = np.concatenate([scan.mz for scan in scans])
+            i = np.concatenate([scan.i for scan in scans])
+        else:
+            mz = np.array([])
+            i = np.array([])
+        return cls(mz, i, offsets, **properties)
+
+    def __len__(self) -> int:
+        """Return the number of scans in the block."""
+        return len(self.offsets) - 1
+
+    def __getitem__(self, k: int) -> Scan:
+        """Get scan k, the peaks are views of the block arrays."""
+        if k < 0:
+            k += len(self)
+        if not 0 <= k < len(self):
+            raise IndexError(k)
+        scan = Scan()
+        scan.mz = self.mz[self.offsets[k] : self.offsets[k + 1]]
+        scan.i = self.i[self.offsets[k] : self.offsets[k + 1]]
+        for key in self.float_properties:
+            value = getattr(self, key)[k]
+            if not np.isnan(value):
+                setattr(scan, key, float(value))
+        for key in self.int_properties:
+            value = getattr(self, key)[k]
+            if value != -1:
+                setattr(scan, key, int(value))
+        return scan
+
+    def __iter__(self) -> Iterator[Scan]:
+        """Iterate over the scans of the block."""
+        for k in range(len(self)):
+            yield self[k]
 
     @property
-    def ms_level(self):
-        """Summary.
+    def nbytes(self) -> int:
+        """Memory used by the arrays of the block."""
+        return sum(
+            getattr(self, key).nbytes
+            for key in ("mz", "i", "offsets")
+            + self.float_properties
+            + self.int_properties
+        )
+
+    def inject_noise(self, noise_injector: AbstractNoiseInjector) -> "ScanBlock":
+        """Add noise to all scans, see AbstractNoiseInjector.inject_noise_batch.
+
+        Args:
+            noise_injector (AbstractNoiseInjector): Description
 
         Returns:
-            TYPE: Description
+            ScanBlock: block with noisy peaks and the same scan properties
         """
-        v = self.get("ms_level", None)
-        return v
+        scan_ids = None if (self.id == -1).any() else self.id
+        mz, i, offsets = noise_injector.inject_noise_batch(
+            self.mz, self.i, self.offsets, self.ms_level, scan_ids=scan_ids
+        )
+        properties = {
+            key: getattr(self, key)
+            for key in self.float_properties + self.int_properties
+        }
+        return ScanBlock(mz, i, offsets, **properties)
 
 
-def generate_interval_tree(peak_properties):
+def generate_interval_tree(peak_properties) -> "IntervalTree":
     """Conctruct an interval tree containing the elution windows of the analytes.
 
     Args:
@@ -119,6 +312,8 @@ def generate_interval_tree(peak_properties):
     Returns:
         IntervalTree: Description
     """
+    from intervaltree import IntervalTree
+
     tree = IntervalTree()
     for key, data in peak_properties.items():
         start = data["scan_start_time"]
@@ -127,10 +322,146 @@ def generate_interval_tree(peak_properties):
     return tree
 
 
+class ElutionScheduler:
+    """Sweep-line scheduler of the molecules eluting in each scan.
+
+    Elution windows are given as half-open scan index ranges [first, stop).
+    Windows are sorted by first and stop scan once, the set of active
+    molecules is then updated incrementally while the scan index advances.
+    The active molecules are kept as sorted array, starting and stopping
+    molecules are inserted and deleted at their sorted positions, so every
+    step only sorts the molecules that change.
+    """
+
+    def __init__(self, first_scan: np.ndarray, stop_scan: np.ndarray):
+        """Initialize scheduler.
+
+        Args:
+            first_scan (np.ndarray): first scan index of every molecule
+            stop_scan (np.ndarray): first scan index after every molecule's window
+        """
+        self.first_scan = np.asarray(first_scan, dtype=np.int64)
+        self.stop_scan = np.asarray(stop_scan, dtype=np.int64)
+        # molecules with empty windows never elute
+        scheduled = np.flatnonzero(self.stop_scan > self.first_scan)
+        self._start_order = scheduled[
+            np.argsort(self.first_scan[scheduled], kind="stable")
+        ]
+        self._stop_order = scheduled[
+            np.argsort(self.stop_scan[scheduled], kind="stable")
+        ]
+        self._sorted_first = self.first_scan[self._start_order]
+        self._sorted_stop = self.stop_scan[self._stop_order]
+        self._next_start = 0
+        self._next_stop = 0
+        self._active = np.empty(0, dtype=np.int64)
+        self.scan_index = -1
+
+    @classmethod
+    def from_windows(
+        cls, start: np.ndarray, end: np.ndarray, time_grid: np.ndarray
+    ) -> "ElutionScheduler":
+        """Create scheduler from elution windows [start, end) in seconds.
+
+        Args:
+            start (np.ndarray): elution start of every molecule
+            end (np.ndarray): elution end of every molecule
+            time_grid (np.ndarray): retention time of every scan
+
+        Returns:
+            ElutionScheduler: scheduler on the scan indices of time_grid
+        """
+        return cls(
+            np.searchsorted(time_grid, start, side="left"),
+            np.searchsorted(time_grid, end, side="left"),
+        )
+
+    @classmethod
+    def from_interval_tree(
+        cls,
+        interval_tree: "IntervalTree",
+        molecule_index: Dict[str, int],
+        time_grid: np.ndarray,
+    ) -> "ElutionScheduler":
+        """Create scheduler from the elution windows of an interval tree.
+
+        Args:
+            interval_tree (IntervalTree): elution windows, see generate_interval_tree
+            molecule_index (Dict[str, int]): molecule name to molecule index
+            time_grid (np.ndarray): retention time of every scan
+
+        Returns:
+            ElutionScheduler: scheduler on the scan indices of time_grid
+        """
+        start = np.zeros(len(molecule_index))
+        end = np.zeros(len(molecule_index))
+        for interval in interval_tree:
+            start[molecule_index[interval.data]] = interval.begin
+            end[molecule_index[interval.data]] = interval.end
+        return cls.from_windows(start, end, time_grid)
+
+    def advance(self, scan_index: int) -> np.ndarray:
+        """Move the sweep line to scan_index.
+
+        Args:
+            scan_index (int): scan index, must not decrease between calls
+
+        Returns:
+            np.ndarray: sorted indices of all molecules eluting in this scan,
+                shared with the scheduler and must not be modified
+
+        Raises:
+            ValueError: if scan_index is smaller than in the previous call
+        """
+        if scan_index < self.scan_index:
+            raise ValueError(
+                f"Cannot move back from scan {self.scan_index} to {scan_index}"
+            )
+        self.scan_index = scan_index
+        next_start = np.searchsorted(self._sorted_first, scan_index, side="right")
+        if next_start > self._next_start:
+            started = np.sort(self._start_order[self._next_start : next_start])
+            self._active = np.insert(
+                self._active, np.searchsorted(self._active, started), started
+            )
+            self._next_start = next_start
+        next_stop = np.searchsorted(self._sorted_stop, scan_index, side="right")
+        if next_stop > self._next_stop:
+            stopped = self._stop_order[self._next_stop : next_stop]
+            self._active = np.delete(
+                self._active, np.searchsorted(self._active, stopped)
+            )
+            self._next_stop = next_stop
+        return self._active
+
+
+def generate_elution_scheduler(
+    peak_properties: Union[PeakTable, Dict[str, dict]],
+    molecules: List[str],
+    time_grid: np.ndarray,
+) -> ElutionScheduler:
+    """Construct a sweep-line scheduler of the elution windows of the analytes.
+
+    Args:
+        peak_properties (Union[PeakTable, Dict[str, dict]]): peak properties of
+            all molecules
+        molecules (List[str]): molecule order of the scheduler
+        time_grid (np.ndarray): retention time of every scan
+
+    Returns:
+        ElutionScheduler: scheduler on the scan indices of time_grid
+    """
+    peak_table = PeakTable.from_dict(peak_properties)
+    ids = peak_table.ids(molecules)
+    start = peak_table.scan_start_time[ids]
+    end = start + peak_table.peak_width[ids]
+    return ElutionScheduler.from_windows(start, end, time_grid)
+
+
 # @profile
 def write_mzml(
     file: Union[str, io.TextIOWrapper],
-    peak_properties: Dict[str, dict],
+    peak_properties: Union[PeakTable, Dict[str, dict]],
     fragmentor: AbstractFragmentor,
     noise_injector: AbstractNoiseInjector,
     mzml_params: Dict[str, Union[int, float, str]],
@@ -138,45 +469,73 @@ def write_mzml(
     """Write mzML file with chromatographic peaks and fragment spectra for the given molecules.
 
     Args:
-        file (Union[str, io.TextIOWrapper]): Description
+        file (Union[str, io.TextIOWrapper]): output file, paths ending with
+            .mzMLb are written as mzMLb and paths ending with .parquet as
+            Parquet spectrum table
         molecules (List[str]): Description
         fragmentation_function (Callable[[str], List[Tuple[float, float]]], optional): Description
-        peak_properties (Dict[str, dict], optional): Description
+        peak_properties (Union[PeakTable, Dict[str, dict]]): peak properties
+            per molecule, either as dict or as columnar PeakTable
     """
     # check params and raise Exception(s) if necessary
     logger.info("Start generating mzML")
     mzml_params = check_mzml_params(mzml_params)
     peak_properties = check_peak_properties(peak_properties)
 
-    interval_tree = generate_interval_tree(peak_properties)
-
     filename = file if isinstance(file, str) else file.name
-    scans = []
-
-    trivial_names = {}
-    charges = set()
-    for key, val in peak_properties.items():
-        trivial_names[val["chemical_formula"]] = key
-        charges.add(val["charge"])
-    # trivial_names = {
-    # val["chemical_formula"]: key for key, val in peak_properties.items()
-    # }
-    # dicts are sorted, language specification since python 3.7+
 
+    # dicts are sorted, language specification since python 3.7+
     isotopologue_lib = generate_molecule_isotopologue_lib(
-        peak_properties, trivial_names=trivial_names, charges=charges
+        peak_properties,
+        cache_dir=mzml_params.get("isotopologue_cache_dir", None),
+        n_processes=mzml_params.get("n_processes", 1),
     )
-    scans, scan_dict = generate_scans(
+    if mzml_params.get("precompute_fragments", False):
+        fragmentor.precompute(
+            list(peak_properties), n_processes=mzml_params.get("n_processes", 1)
+        )
+    scans = iter_scans(
         isotopologue_lib,
         peak_properties,
-        interval_tree,
+        None,
         fragmentor,
         noise_injector,
         mzml_params,
     )
-    logger.info("Delete interval tree")
-    del interval_tree
-    write_scans(file, scans)
+    time_grid = generate_time_grid(
+        mzml_params["gradient_length"], mzml_params["ms_rt_diff"]
+    )
+    spectrum_count = int((time_grid < mzml_params["gradient_length"]).sum())
+    parquet_file = mzml_params.get("parquet_file", None)
+    parquet_writer = None
+    if parquet_file is not None:
+        # write scans to Parquet alongside mzML while they are streamed
+        from smiter.parquet import ParquetScanWriter
+
+        parquet_writer = ParquetScanWriter(
+            str(parquet_file),
+            row_group_size=int(mzml_params.get("parquet_row_group_size", 1024)),
+            mz_encoding=int(mzml_params.get("mz_encoding", 64)),
+            intensity_encoding=int(mzml_params.get("intensity_encoding", 32)),
+        )
+        scans = parquet_writer.iter_write(scans)
+    try:
+        write_scans(
+            file,
+            scans,
+            spectrum_count=spectrum_count,
+            indexed=bool(mzml_params.get("indexed_mzml", True)),
+            mz_encoding=int(mzml_params.get("mz_encoding", 64)),
+            intensity_encoding=int(mzml_params.get("intensity_encoding", 32)),
+            mz_compression=str(mzml_params.get("mz_compression", "zlib")),
+            intensity_compression=str(mzml_params.get("intensity_compression", "zlib")),
+            n_processes=int(mzml_params.get("n_encoding_processes", 1)),
+            parquet_row_group_size=int(mzml_params.get("parquet_row_group_size", 1024)),
+        )
+    finally:
+        # the Parquet footer is written on close, also if generating scans fails
+        if parquet_writer is not None:
+            parquet_writer.close()
     if not isinstance(file, str):
         file_path = file.name
     else:
@@ -184,107 +543,674 @@ def write_mzml(
     path = pathlib.Path(file_path)
     summary_path = path.parent.resolve() / "molecule_summary.csv"
     peak_properties_to_csv(peak_properties, summary_path)
+    if parquet_writer is not None or file_path.lower().endswith(".parquet"):
+        from smiter.parquet import peak_properties_to_parquet
+
+        peak_properties_to_parquet(
+            peak_properties, path.parent.resolve() / "molecule_summary.parquet"
+        )
     return filename
 
 
-# @profile
-def rescale_intensity(
-    i: float, rt: float, molecule: str, peak_properties: dict, isotopologue_lib: dict
-):
-    """Rescale intensity value for a given molecule according to scale factor and distribution function.
+def elution_profile(rt: Union[float, np.ndarray], properties: dict):
+    """Calculate the intensity scale factor of a molecule at the given retention time(s).
 
     Args:
-        i (TYPE): Description
-        rt (TYPE): Description
-        molecule (TYPE): Description
-        peak_properties (TYPE): Description
-        isotopologue_lib (TYPE): Description
+        rt (Union[float, np.ndarray]): retention time or array of retention times
+        properties (dict): peak properties of the molecule
 
     Returns:
-        TYPE: Description
+        Union[float, np.ndarray]: scale factor(s) for rt
     """
-    scale_func = peak_properties[f"{molecule}"]["peak_function"]
-    rt_max = (
-        peak_properties[f"{molecule}"]["scan_start_time"]
-        + peak_properties[f"{molecule}"]["peak_width"]
-    )
+    scale_func = properties["peak_function"]
+    scan_start_time = properties["scan_start_time"]
+    peak_width = properties["peak_width"]
 
     if scale_func == "gauss":
-        mu = (
-            peak_properties[f"{molecule}"]["scan_start_time"]
-            + 0.5 * peak_properties[f"{molecule}"]["peak_width"]
-        )
+        mu = scan_start_time + 0.5 * peak_width
         dist_scale_factor = distributions[scale_func](
             rt,
             mu=mu,
-            sigma=peak_properties[f"{molecule}"]["peak_params"].get(
-                "sigma", peak_properties[f"{molecule}"]["peak_width"] / 10
-            ),
+            sigma=properties["peak_params"].get("sigma", peak_width / 10),
         )
     elif scale_func == "gamma":
         dist_scale_factor = distributions[scale_func](
             rt,
-            a=peak_properties[f"{molecule}"]["peak_params"]["a"],
-            scale=peak_properties[f"{molecule}"]["peak_params"]["scale"],
+            a=properties["peak_params"]["a"],
+            scale=properties["peak_params"]["scale"],
         )
     elif scale_func == "gauss_tail":
-        mu = (
-            peak_properties[f"{molecule}"]["scan_start_time"]
-            + 0.3 * peak_properties[f"{molecule}"]["peak_width"]
-        )
+        mu = scan_start_time + 0.3 * peak_width
         dist_scale_factor = distributions[scale_func](
             rt,
             mu=mu,
-            sigma=0.12 * (rt - peak_properties[f"{molecule}"]["scan_start_time"]) + 2,
-            scan_start_time=peak_properties[f"{molecule}"]["scan_start_time"],
+            sigma=0.12 * (rt - scan_start_time) + 2,
+            scan_start_time=scan_start_time,
         )
     elif scale_func is None:
         dist_scale_factor = 1
     # TODO use ionization_effiency here
-    i *= (
+    return (
         dist_scale_factor
-        * peak_properties[f"{molecule}"].get("peak_scaling_factor", 1e3)
-        * peak_properties[f"{molecule}"].get("ionization_effiency", 1)
+        * properties.get("peak_scaling_factor", 1e3)
+        * properties.get("ionization_effiency", 1)
     )
+
+
+# @profile
+def rescale_intensity(
+    i: float, rt: float, molecule: str, peak_properties: dict, isotopologue_lib: dict
+):
+    """Rescale intensity value for a given molecule according to scale factor and distribution function.
+
+    Args:
+        i (TYPE): Description
+        rt (TYPE): Description
+        molecule (TYPE): Description
+        peak_properties (TYPE): Description
+        isotopologue_lib (TYPE): Description
+
+    Returns:
+        TYPE: Description
+    """
+    i *= elution_profile(rt, peak_properties[f"{molecule}"])
     return i
 
 
+def generate_time_grid(gradient_length: float, ms_rt_diff: float) -> np.ndarray:
+    """Generate the retention times of all scans of the gradient.
+
+    A new scan is started every ms_rt_diff seconds. Times are accumulated the
+    same way the scan loop advances, the grid ends with the first time past
+    gradient_length.
+
+    Args:
+        gradient_length (float): length of the gradient in seconds
+        ms_rt_diff (float): time between two scans in seconds
+
+    Returns:
+        np.ndarray: retention time of every scan
+    """
+    n = int(gradient_length / ms_rt_diff) + 2
+    time_grid = np.zeros(n + 1)
+    np.cumsum(np.full(n, ms_rt_diff, dtype=float), out=time_grid[1:])
+    return time_grid
+
+
+class ElutionProfiles:
+    """Sparse (molecule x scan) matrix of precomputed intensity scale factors.
+
+    Scale factors of a molecule are only stored for the scans inside its
+    elution window [scan_start_time, scan_start_time + peak_width].
+    """
+
+    def __init__(
+        self,
+        time_grid: np.ndarray,
+        first_scan: np.ndarray,
+        offsets: np.ndarray,
+        values: np.ndarray,
+    ):
+        """Initialize elution profiles.
+
+        Args:
+            time_grid (np.ndarray): retention time of every scan
+            first_scan (np.ndarray): index of the first scan of every molecule
+            offsets (np.ndarray): start of every molecule's profile in values
+            values (np.ndarray): concatenated scale factors of all molecules
+        """
+        self.time_grid = time_grid
+        self.first_scan = first_scan
+        self.offsets = offsets
+        self.values = values
+
+    def scale_factors(self, molecules: np.ndarray, scan_index: int) -> np.ndarray:
+        """Look up the scale factors of several molecules in one scan.
+
+        Args:
+            molecules (np.ndarray): molecule indices
+            scan_index (int): scan index in the time grid
+
+        Returns:
+            np.ndarray: scale factors, 0 for molecules not eluting in this scan
+        """
+        position = self.offsets[molecules] + scan_index - self.first_scan[molecules]
+        in_window = (scan_index >= self.first_scan[molecules]) & (
+            position < self.offsets[molecules + 1]
+        )
+        scale_factors = np.zeros(len(molecules))
+        scale_factors[in_window] = self.values[position[in_window]]
+        return scale_factors
+
+    def scale_factor(self, molecule: int, scan_index: int) -> float:
+        """Look up the scale factor of one molecule in one scan.
+
+        Args:
+            molecule (int): molecule index
+            scan_index (int): scan index in the time grid
+
+        Returns:
+            float: scale factor, 0 if the molecule is not eluting in this scan
+        """
+        return self.scale_factors(np.array([molecule]), scan_index)[0]
+
+
+def generate_elution_profiles(
+    peak_properties: Union[PeakTable, Dict[str, dict]],
+    molecules: List[str],
+    time_grid: np.ndarray,
+) -> ElutionProfiles:
+    """Evaluate the elution profiles of all molecules on the scan time grid.
+
+    Args:
+        peak_properties (Union[PeakTable, Dict[str, dict]]): peak properties of
+            all molecules
+        molecules (List[str]): molecule order of the profile matrix
+        time_grid (np.ndarray): retention time of every scan
+
+    Returns:
+        ElutionProfiles: scale factors of every molecule inside its elution window
+    """
+    peak_table = PeakTable.from_dict(peak_properties)
+    ids = peak_table.ids(molecules)
+    start = peak_table.scan_start_time[ids]
+    width = peak_table.peak_width[ids]
+    first_scan = np.searchsorted(time_grid, start, side="left")
+    last_scan = np.searchsorted(time_grid, start + width, side="right")
+    lengths = np.maximum(last_scan - first_scan, 0)
+    offsets = np.zeros(len(molecules) + 1, dtype=np.int64)
+    np.cumsum(lengths, out=offsets[1:])
+
+    # one entry per (molecule, scan) pair inside the elution windows
+    owner = np.repeat(np.arange(len(molecules)), lengths)
+    rt = time_grid[
+        np.arange(offsets[-1]) - np.repeat(offsets[:-1] - first_scan, lengths)
+    ]
+    functions = peak_table.peak_function[ids]
+    values = np.ones(offsets[-1])
+    for code in np.unique(functions):
+        scale_func = PEAK_FUNCTIONS[code]
+        if scale_func is None:
+            continue
+        points = (functions == code)[owner]
+        point_owner = owner[points]
+        if scale_func == "gauss":
+            sigma = peak_table.sigma[ids]
+            sigma = np.where(np.isnan(sigma), width / 10, sigma)
+            kwargs = {
+                "mu": (start + 0.5 * width)[point_owner],
+                "sigma": sigma[point_owner],
+            }
+        elif scale_func == "gamma":
+            kwargs = {
+                "a": peak_table.a[ids][point_owner],
+                "scale": peak_table.scale[ids][point_owner],
+            }
+        elif scale_func == "gauss_tail":
+            kwargs = {
+                "mu": (start + 0.3 * width)[point_owner],
+                "sigma": 0.12 * (rt[points] - start[point_owner]) + 2,
+                "scan_start_time": start[point_owner],
+            }
+        values[points] = vectorized_distributions[scale_func](rt[points], **kwargs)
+    peak_scaling_factor = peak_table.peak_scaling_factor[ids]
+    ionization_effiency = peak_table.ionization_effiency[ids]
+    values = values * peak_scaling_factor[owner] * ionization_effiency[owner]
+    return ElutionProfiles(time_grid, first_scan, offsets, values)
+
+
+def stack_isotopologue_lib(isotopologue_lib: dict, molecules: List[str] = None):
+    """Stack the isotope envelopes of all molecules into contiguous arrays.
+
+    Args:
+        isotopologue_lib (dict): isotope envelopes, see generate_molecule_isotopologue_lib
+        molecules (List[str], optional): molecule order, defaults to library order
+
+    Returns:
+        dict: concatenated mz, i and charge arrays, envelope offsets and mono mz
+            per molecule. Charges are 0 for library entries without charges.
+            For generate_ms1_summaries, every envelope is also stored as
+            running maximum of i (running_max) and as i sorted in descending
+            order (sorted_i) with its cumulative sum (sorted_cumsum), plus the
+            index of its first highest peak (highest_index).
+    """
+    if molecules is None:
+        molecules = list(isotopologue_lib.keys())
+    lengths = np.array(
+        [len(isotopologue_lib[mol]["mz"]) for mol in molecules], dtype=np.int64
+    )
+    offsets = np.zeros(len(molecules) + 1, dtype=np.int64)
+    np.cumsum(lengths, out=offsets[1:])
+    if len(molecules) > 0:
+        mz = np.concatenate(
+            [np.asarray(isotopologue_lib[mol]["mz"], dtype=float) for mol in molecules]
+        )
+        intensities = [
+            np.asarray(isotopologue_lib[mol]["i"], dtype=float) for mol in molecules
+        ]
+        i = np.concatenate(intensities)
+        charge = np.concatenate(
+            [
+                isotopologue_lib[mol].get("charge", np.zeros(length, dtype=np.int64))
+                for mol, length in zip(molecules, lengths)
+            ]
+        ).astype(np.int64)
+        running_max = np.concatenate([np.maximum.accumulate(e) for e in intensities])
+        descending = [np.sort(e)[::-1] for e in intensities]
+        sorted_i = np.concatenate(descending)
+        sorted_cumsum = np.concatenate([np.cumsum(e) for e in descending])
+        highest_index = offsets[:-1] + np.array(
+            [np.argmax(e) if len(e) > 0 else 0 for e in intensities], dtype=np.int64
+        )
+    else:
+        mz = np.array([], dtype=float)
+        i = np.array([], dtype=float)
+        charge = np.array([], dtype=np.int64)
+        running_max = sorted_i = sorted_cumsum = i
+        highest_index = np.array([], dtype=np.int64)
+    return {
+        "molecules": molecules,
+        "index": {mol: n for n, mol in enumerate(molecules)},
+        "mz": mz,
+        "i": i,
+        "charge": charge,
+        "offsets": offsets,
+        "mono_mz": mz[offsets[:-1]],
+        "running_max": running_max,
+        "sorted_i": sorted_i,
+        "sorted_cumsum": sorted_cumsum,
+        "highest_index": highest_index,
+    }
+
+
+def _count_leading(
+    values: np.ndarray,
+    starts: np.ndarray,
+    lengths: np.ndarray,
+    scale_factors: np.ndarray,
+    threshold: Union[float, np.ndarray],
+    compare: Callable[[np.ndarray, np.ndarray], np.ndarray],
+) -> np.ndarray:
+    """Count the leading values of every envelope passing compare, by bisection.
+
+    compare(values * scale_factor, threshold) has to be True for a prefix of
+    every envelope and False for the rest, e.g. np.greater on sorted_i.
+
+    Args:
+        values (np.ndarray): stacked envelope values, e.g. sorted_i
+        starts (np.ndarray): first index of every envelope in values
+        lengths (np.ndarray): envelope lengths
+        scale_factors (np.ndarray): scale factor of every envelope
+        threshold (Union[float, np.ndarray]): threshold of every envelope
+        compare (Callable[[np.ndarray, np.ndarray], np.ndarray]): comparison
+
+    Returns:
+        np.ndarray: length of the passing prefix of every envelope
+    """
+    count = np.zeros_like(lengths)
+    if len(lengths) == 0 or lengths.max() == 0:
+        return count
+    step = 1 << (int(lengths.max()).bit_length() - 1)
+    while step > 0:
+        longer = np.minimum(count + step, lengths)
+        passing = compare(values[starts + longer - 1] * scale_factors, threshold)
+        count = np.where(passing & (longer > count), longer, count)
+        step >>= 1
+    return count
+
+
+def generate_ms1_summaries(
+    stacked_lib: dict,
+    candidates: np.ndarray,
+    scale_factors: np.ndarray,
+    min_intensity: float,
+    max_intensity: float,
+) -> dict:
+    """Summarize the MS1 peaks of the eluting molecules without generating them.
+
+    The summaries are all the scheduling of MS2 scans needs. Since all peaks
+    of a molecule are scaled by one factor, they are derived from per
+    molecule constants of stack_isotopologue_lib. Only molecules with peaks
+    below min_intensity or above max_intensity are searched in their
+    envelope tables. Summed intensities are taken from cumulative sums and
+    may differ from summing up the peaks in the last bits.
+
+    Args:
+        stacked_lib (dict): stacked isotopologue library, see stack_isotopologue_lib
+        candidates (np.ndarray): indices of the eluting molecules in stacked_lib
+        scale_factors (np.ndarray): intensity scale factor for every candidate
+        min_intensity (float): peaks below or equal this intensity are removed
+        max_intensity (float): peak intensities are clipped to this value
+
+    Returns:
+        dict: index, mono mz (first peak above min_intensity), summed intensity
+            and highest peak with its charge of all molecules with peaks
+    """
+    candidates = np.asarray(candidates, dtype=np.int64)
+    offsets = stacked_lib["offsets"]
+    starts = offsets[candidates]
+    lengths = offsets[candidates + 1] - starts
+    last = np.maximum(starts + lengths - 1, 0)
+    # the highest peak of an envelope is its last running maximum
+    scaled_max = stacked_lib["running_max"][last] * scale_factors
+    with_peaks = (lengths > 0) & (scaled_max > min_intensity)
+    candidates = candidates[with_peaks]
+    starts = starts[with_peaks]
+    lengths = lengths[with_peaks]
+    last = last[with_peaks]
+    scale_factors = scale_factors[with_peaks]
+    scaled_max = scaled_max[with_peaks]
+    precursor_i = np.minimum(scaled_max, max_intensity)
+
+    running_max = stacked_lib["running_max"]
+    sorted_i = stacked_lib["sorted_i"]
+    sorted_cumsum = stacked_lib["sorted_cumsum"]
+    # first highest peak, or first clipped peak
+    highest = stacked_lib["highest_index"][candidates]
+    clipped = np.flatnonzero(scaled_max > max_intensity)
+    if len(clipped) > 0:
+        highest[clipped] = starts[clipped] + _count_leading(
+            running_max,
+            starts[clipped],
+            lengths[clipped],
+            scale_factors[clipped],
+            max_intensity,
+            np.less,
+        )
+    # mono mz is the first peak above min_intensity
+    first = starts.copy()
+    late = np.flatnonzero(stacked_lib["i"][starts] * scale_factors <= min_intensity)
+    if len(late) > 0:
+        first[late] += _count_leading(
+            running_max,
+            starts[late],
+            lengths[late],
+            scale_factors[late],
+            min_intensity,
+            np.less_equal,
+        )
+    # summed intensity of all peaks above min_intensity, clipped to max_intensity
+    intensity_sum = sorted_cumsum[last] * scale_factors
+    partial = np.flatnonzero(
+        (sorted_i[last] * scale_factors <= min_intensity) | (scaled_max > max_intensity)
+    )
+    if len(partial) > 0:
+        n_peaks = _count_leading(
+            sorted_i,
+            starts[partial],
+            lengths[partial],
+            scale_factors[partial],
+            min_intensity,
+            np.greater,
+        )
+        n_clipped = _count_leading(
+            sorted_i,
+            starts[partial],
+            lengths[partial],
+            scale_factors[partial],
+            max_intensity,
+            np.greater,
+        )
+        # cumulative sums restart in every envelope, all molecules have peaks
+        peaks_sum = sorted_cumsum[starts[partial] + n_peaks - 1]
+        clipped_sum = np.where(
+            n_clipped > 0, sorted_cumsum[starts[partial] + n_clipped - 1], 0
+        )
+        intensity_sum[partial] = (
+            n_clipped * max_intensity
+            + (peaks_sum - clipped_sum) * scale_factors[partial]
+        )
+    return {
+        "molecules": candidates,
+        "mono_mz": stacked_lib["mz"][first],
+        "intensity_sum": intensity_sum,
+        "precursor_mz": np.round(stacked_lib["mz"][highest], 6),
+        "precursor_i": precursor_i,
+        "precursor_charge": stacked_lib["charge"][highest],
+    }
+
+
+def merge_ms1_peaks(
+    stacked_lib: dict,
+    candidates: np.ndarray,
+    scale_factors: np.ndarray,
+    min_intensity: float,
+    max_intensity: float,
+) -> Tuple[np.ndarray, np.ndarray]:
+    """Synthesize the merged MS1 peaks of all eluting molecules in one pass.
+
+    The isotope envelopes of all candidates are gathered into one array,
+    rescaled, filtered and clipped. Peaks sharing the same (rounded) m/z are
+    merged by summing up their intensities.
+
+    Args:
+        stacked_lib (dict): stacked isotopologue library, see stack_isotopologue_lib
+        candidates (np.ndarray): indices of the eluting molecules in stacked_lib
+        scale_factors (np.ndarray): intensity scale factor for every candidate
+        min_intensity (float): peaks below or equal this intensity are removed
+        max_intensity (float): peak intensities are clipped to this value
+
+    Returns:
+        Tuple[np.ndarray, np.ndarray]: merged mz and i arrays
+    """
+    offsets = stacked_lib["offsets"]
+    starts = offsets[candidates]
+    lengths = offsets[candidates + 1] - starts
+    owner = np.repeat(np.arange(len(candidates)), lengths)
+    peak_index = np.arange(lengths.sum()) - np.repeat(
+        np.cumsum(lengths) - lengths - starts, lengths
+    )
+    intensity = stacked_lib["i"][peak_index] * scale_factors[owner]
+
+    mask = intensity > min_intensity
+    intensity = np.clip(intensity[mask], a_min=None, a_max=max_intensity)
+    rounded_mz = np.round(stacked_lib["mz"][peak_index[mask]], 6)
+    if len(rounded_mz) == 0:
+        return rounded_mz, intensity
+    # merge peaks with shared mz
+    order = np.argsort(rounded_mz, kind="stable")
+    sorted_mz = rounded_mz[order]
+    unique_start = np.flatnonzero(np.r_[True, sorted_mz[1:] != sorted_mz[:-1]])
+    return sorted_mz[unique_start], np.add.reduceat(intensity[order], unique_start)
+
+
+def generate_ms1_peaks(
+    stacked_lib: dict,
+    candidates: np.ndarray,
+    scale_factors: np.ndarray,
+    min_intensity: float,
+    max_intensity: float,
+) -> dict:
+    """Synthesize the MS1 peaks of all eluting molecules and summarize them.
+
+    Args:
+        stacked_lib (dict): stacked isotopologue library, see stack_isotopologue_lib
+        candidates (np.ndarray): indices of the eluting molecules in stacked_lib
+        scale_factors (np.ndarray): intensity scale factor for every candidate
+        min_intensity (float): peaks below or equal this intensity are removed
+        max_intensity (float): peak intensities are clipped to this value
+
+    Returns:
+        dict: merged mz and i arrays (see merge_ms1_peaks) plus per molecule
+            summaries (see generate_ms1_summaries)
+    """
+    ms1_peaks = generate_ms1_summaries(
+        stacked_lib, candidates, scale_factors, min_intensity, max_intensity
+    )
+    ms1_peaks["mz"], ms1_peaks["i"] = merge_ms1_peaks(
+        stacked_lib, candidates, scale_factors, min_intensity, max_intensity
+    )
+    return ms1_peaks
+
+
 def generate_scans(
     isotopologue_lib: dict,
     peak_properties: dict,
-    interval_tree: IntervalTree,
+    interval_tree: "IntervalTree",
     fragmentor: AbstractFragmentor,
     noise_injector: AbstractNoiseInjector,
     mzml_params: dict,
-):
-    """Summary.
+) -> Tuple[List[Tuple[Scan, List[Scan]]], Dict[str, Dict[str, list]]]:
+    """Generate all scans of the gradient, see iter_scans.
 
     Args:
         isotopologue_lib (TYPE): Description
         peak_properties (TYPE): Description
+        interval_tree (IntervalTree): elution windows, if None the windows are
+            taken from peak_properties
+        fragmentation_function (A): Description
+        mzml_params (TYPE): Description
+
+    Returns:
+        Tuple[List[Tuple[Scan, List[Scan]]], Dict[str, Dict[str, list]]]: MS1 scans
+            with their MS2 scans and the scan ids per molecule
+    """
+    mol_scan_dict: Dict[str, Dict[str, list]] = {}
+    scans = list(
+        iter_scans(
+            isotopologue_lib,
+            peak_properties,
+            interval_tree,
+            fragmentor,
+            noise_injector,
+            mzml_params,
+            mol_scan_dict=mol_scan_dict,
+        )
+    )
+    return scans, mol_scan_dict
+
+
+def iter_scans(
+    isotopologue_lib: dict,
+    peak_properties: Union[PeakTable, Dict[str, dict]],
+    interval_tree: "IntervalTree",
+    fragmentor: AbstractFragmentor,
+    noise_injector: AbstractNoiseInjector,
+    mzml_params: dict,
+    mol_scan_dict: Dict[str, Dict[str, list]] = None,
+) -> Iterator[Tuple[Scan, List[Scan]]]:
+    """Generate scans cycle by cycle.
+
+    A new scan starts every ms_rt_diff seconds, every scan starting before
+    the end of the gradient is generated. Each MS1 scan is yielded together
+    with its MS2 scans as soon as the cycle is complete, so only one cycle
+    is held in memory.
+
+    Args:
+        isotopologue_lib (TYPE): Description
+        peak_properties (Union[PeakTable, Dict[str, dict]]): peak properties,
+            converted to a PeakTable
+        interval_tree (IntervalTree): elution windows, if None the windows are
+            taken from peak_properties
         fragmentation_function (A): Description
         mzml_params (TYPE): Description
+        mol_scan_dict (Dict[str, Dict[str, list]], optional): filled with the
+            MS1 and MS2 scan ids of every molecule
+
+    Yields:
+        Tuple[Scan, List[Scan]]: MS1 scan and its MS2 scans
+    """
+    gradient_length = mzml_params["gradient_length"]
+    ms_rt_diff = mzml_params.get("ms_rt_diff", 0.03)
+    n_processes = int(mzml_params.get("n_processes", 1))
+    time_grid = generate_time_grid(gradient_length, ms_rt_diff)
+    peak_properties = PeakTable.from_dict(peak_properties)
+
+    if mol_scan_dict is None:
+        mol_scan_dict = {}
+    mol_scan_dict.update(
+        {mol: {"ms1_scans": [], "ms2_scans": []} for mol in isotopologue_lib}
+    )
+    stacked_lib = stack_isotopologue_lib(isotopologue_lib)
+    molecules = stacked_lib["molecules"]
+    elution_profiles = generate_elution_profiles(peak_properties, molecules, time_grid)
+    if interval_tree is None:
+        scheduler = generate_elution_scheduler(peak_properties, molecules, time_grid)
+    else:
+        scheduler = ElutionScheduler.from_interval_tree(
+            interval_tree, stacked_lib["index"], time_grid
+        )
+    cycles = _generate_scan_cycles(
+        peak_properties,
+        fragmentor,
+        mzml_params,
+        time_grid,
+        stacked_lib,
+        elution_profiles,
+        scheduler,
+        mol_scan_dict,
+        merge_ms1=n_processes <= 1,
+    )
+    if n_processes <= 1:
+        for ms1_scan, ms2_scans, _, _ in cycles:
+            yield _inject_cycle_noise(ms1_scan, ms2_scans, noise_injector)
+    else:
+        yield from _generate_scans_parallel(
+            cycles, stacked_lib, elution_profiles, noise_injector, mzml_params
+        )
+
+
+def _generate_scan_cycles(
+    peak_properties: PeakTable,
+    fragmentor: AbstractFragmentor,
+    mzml_params: dict,
+    time_grid: np.ndarray,
+    stacked_lib: dict,
+    elution_profiles: ElutionProfiles,
+    scheduler: ElutionScheduler,
+    mol_scan_dict: Dict[str, Dict[str, list]],
+    merge_ms1: bool = True,
+) -> Iterator[Tuple[Scan, List[Scan], int, np.ndarray]]:
+    """Schedule the duty cycles of the run, see iter_scans.
+
+    The scheduling (precursor selection and dynamic exclusion) only depends on
+    the per molecule MS1 summaries (see generate_ms1_summaries), so the merged
+    MS1 peaks can be left out and generated later, e.g. in a process pool. No
+    noise is added here.
+
+    Args:
+        peak_properties (PeakTable): peak properties of all molecules
+        fragmentor (AbstractFragmentor): Description
+        mzml_params (dict): Description
+        time_grid (np.ndarray): scan start times, see generate_time_grid
+        stacked_lib (dict): stacked isotopologue library, see stack_isotopologue_lib
+        elution_profiles (ElutionProfiles): elution profiles on time_grid
+        scheduler (ElutionScheduler): elution windows on time_grid
+        mol_scan_dict (Dict[str, Dict[str, list]]): filled with the MS1 and MS2
+            scan ids of every molecule
+        merge_ms1 (bool, optional): if False, MS1 scans have no peaks yet
+
+    Yields:
+        Tuple[Scan, List[Scan], int, np.ndarray]: MS1 scan, its MS2 scans, the
+            scan index of the MS1 scan and the eluting molecules
     """
     logger.info("Initialize chimeric spectra counter")
     chimeric_count = 0
     chimeric = Counter()
+    fragment_cache_hits = fragmentor.fragment_cache_hits
+    fragment_cache_misses = fragmentor.fragment_cache_misses
     logger.info("Start generating scans")
     t0 = time.time()
     gradient_length = mzml_params["gradient_length"]
     ms_rt_diff = mzml_params.get("ms_rt_diff", 0.03)
+    scan_index: int = 0
     t: float = 0
 
-    mol_scan_dict: Dict[str, Dict[str, list]] = {}
-    scans: List[Tuple[Scan, List[Scan]]] = []
     # i: int = 0
     spec_id: int = 1
-    de_tracker: Dict[str, int] = {}
     de_stats: dict = {}
 
-    mol_scan_dict = {
-        mol: {"ms1_scans": [], "ms2_scans": []} for mol in isotopologue_lib
-    }
-    molecules = list(isotopologue_lib.keys())
+    molecules = stacked_lib["molecules"]
+    # time of the last fragmentation of every molecule, nan if never fragmented
+    de_tracker = np.full(len(molecules), np.nan)
+    ms1_scan_ids = [mol_scan_dict[mol]["ms1_scans"] for mol in molecules]
+    min_intensity = mzml_params["min_intensity"]
+    max_intensity = mzml_params.get("max_intensity", 1e10)
+    # peak properties in stacked_lib molecule order
+    peak_ids = peak_properties.ids(molecules)
+    peak_start = peak_properties.scan_start_time[peak_ids]
+    peak_end = peak_start + peak_properties.peak_width[peak_ids]
+    peak_charge = peak_properties.charge[peak_ids]
 
     progress_bar = tqdm(
         total=gradient_length,
@@ -292,58 +1218,24 @@ def generate_scans(
         bar_format="{desc}: {percentage:3.0f}%|{bar}| {n:.2f}/{total_fmt} [{elapsed}<{remaining}",
     )
     while t < gradient_length:
-        scan_peaks: List[Tuple[float, float]] = []
-        scan_peaks = {}
-        mol_i = []
-        mol_monoisotopic = {}
-        candidates = interval_tree.at(t)
-        # print(len(candidates))
-        for mol in candidates:
-            # if len(candidates) > 1:
-            mol = mol.data
-            mol_plus = f"{mol}"
-            mz = np.array(isotopologue_lib[mol]["mz"])
-            intensity = np.array(isotopologue_lib[mol]["i"])
-            intensity = rescale_intensity(
-                intensity, t, mol, peak_properties, isotopologue_lib
-            )
-
-            mask = intensity > mzml_params["min_intensity"]
-            intensity = intensity[mask]
-
-            # clip max intensity
-            intensity = np.clip(
-                intensity, a_min=None, a_max=mzml_params.get("max_intensity", 1e10)
+        candidates = scheduler.advance(scan_index)
+        scale_factors = elution_profiles.scale_factors(candidates, scan_index)
+        if merge_ms1:
+            ms1_peaks = generate_ms1_peaks(
+                stacked_lib, candidates, scale_factors, min_intensity, max_intensity
             )
-
-            mz = mz[mask]
-            mol_peaks = list(zip(mz, intensity))
-            mol_peaks = {round(mz, 6): _i for mz, _i in list(zip(mz, intensity))}
-            # !FIXED! multiple molecules which share mz should have summed up intensityies for that shared mzs
-            if len(mol_peaks) > 0:
-                mol_i.append((mol, mz[0], sum(intensity)))
-                # scan_peaks.extend(mol_peaks)
-                for mz, intensity in mol_peaks.items():
-                    if mz in scan_peaks:
-                        scan_peaks[mz] += intensity
-                    else:
-                        scan_peaks[mz] = intensity
-                mol_scan_dict[mol]["ms1_scans"].append(spec_id)
-                highest_peak = max(mol_peaks.items(), key=lambda x: x[1])
-                mol_monoisotopic[mol] = {
-                    "mz": highest_peak[0],
-                    "i": highest_peak[1],
-                }
-        scan_peaks = sorted(list(scan_peaks.items()), key=lambda x: x[1])
-        if len(scan_peaks) > 0:
-            mz, inten = zip(*scan_peaks)
         else:
-            mz, inten = [], []
+            ms1_peaks = generate_ms1_summaries(
+                stacked_lib, candidates, scale_factors, min_intensity, max_intensity
+            )
+        eluting = ms1_peaks["molecules"]
+        for c in eluting.tolist():
+            ms1_scan_ids[c].append(spec_id)
 
         s = Scan(
             {
-                "mz": np.array(mz),
-                "i": np.array(inten),
+                "mz": ms1_peaks.get("mz"),
+                "i": ms1_peaks.get("i"),
                 "id": spec_id,
                 "rt": t,
                 "ms_level": 1,
@@ -352,56 +1244,53 @@ def generate_scans(
         prec_scan_id = spec_id
         spec_id += 1
 
-        sorting = s.mz.argsort()
-        s.mz = s.mz[sorting]
-        s.i = s.i[sorting]
-
-        # add noise
-        s = noise_injector.inject_noise(s)
-
         # i += 1
-        scans.append((s, []))
-        t += ms_rt_diff
+        ms2_scans: List[Scan] = []
+        ms1_scan_index = scan_index
+        scan_index += 1
+        t = float(time_grid[scan_index])
         progress_bar.update(ms_rt_diff)
 
-        if t > gradient_length:
+        if t >= gradient_length:
+            yield s, ms2_scans, ms1_scan_index, candidates
             break
 
         fragment_spec_index = 0
         max_ms2_spectra = mzml_params.get("max_ms2_spectra", 10)
-        if len(mol_i) < max_ms2_spectra:
-            max_ms2_spectra = len(mol_i)
+        if len(eluting) < max_ms2_spectra:
+            max_ms2_spectra = len(eluting)
         ms2_scan = None
-        mol_i = sorted(mol_i, key=lambda x: x[2], reverse=True)
-        logger.debug(f"All molecules eluting: {len(mol_i)}")
-        logger.debug(f"currently # fragment spectra {len(scans[-1][1])}")
-
-        mol_i = [
-            mol
-            for mol in mol_i
-            if (de_tracker.get(mol[0], None) is None)
-            or (t - de_tracker[mol[0]]) > mzml_params["dynamic_exclusion"]
-        ]
-        logger.debug(f"All molecules eluting after DE filtering: {len(mol_i)}")
-        while len(scans[-1][1]) != max_ms2_spectra:
+        # positions in ms1_peaks by descending summed intensity, stable on ties
+        ranked = np.argsort(-ms1_peaks["intensity_sum"], kind="stable")
+        logger.debug(f"All molecules eluting: {len(ranked)}")
+        logger.debug(f"currently # fragment spectra {len(ms2_scans)}")
+
+        last_fragmented = de_tracker[eluting[ranked]]
+        if not np.isnan(last_fragmented).all():
+            ranked = ranked[
+                np.isnan(last_fragmented)
+                | ((t - last_fragmented) > mzml_params["dynamic_exclusion"])
+            ]
+        logger.debug(f"All molecules eluting after DE filtering: {len(ranked)}")
+        while len(ms2_scans) != max_ms2_spectra:
             logger.debug(f"Frag spec index {fragment_spec_index}")
-            if fragment_spec_index > len(mol_i) - 1:
+            if fragment_spec_index > len(ranked) - 1:
                 # we evaluated fragmentation for every potential mol
                 # and all will be skipped
                 logger.debug(f"All possible mol are skipped due to DE")
                 break
-            mol = mol_i[fragment_spec_index][0]
-            _mz = mol_i[fragment_spec_index][1]
-            _intensity = mol_i[fragment_spec_index][2]
+            position = ranked[fragment_spec_index]
+            mol_index = eluting[position]
+            mol = molecules[mol_index]
+            _mz = ms1_peaks["mono_mz"][position]
+            _intensity = ms1_peaks["intensity_sum"][position]
             fragment_spec_index += 1
-            mol_plus = f"{mol}"
             all_mols_in_mz_and_rt_window = [
-                mol.data
-                for mol in candidates
-                if (
-                    abs(isotopologue_lib[mol.data]["mz"][0] - _mz)
+                molecules[c]
+                for c in candidates[
+                    np.abs(stacked_lib["mono_mz"][candidates] - _mz)
                     < mzml_params["isolation_window_width"]
-                )
+                ]
             ]
             if len(all_mols_in_mz_and_rt_window) > 1:
                 chimeric_count += 1
@@ -423,31 +1312,26 @@ def generate_scans(
                     }
                 )
                 spec_id += 1
-                t += ms_rt_diff
+                scan_index += 1
+                t = float(time_grid[scan_index])
                 progress_bar.update(ms_rt_diff)
 
                 if t > gradient_length:
                     break
-            elif (peak_properties[mol_plus]["scan_start_time"] <= t) and (
-                (
-                    peak_properties[mol_plus]["scan_start_time"]
-                    + peak_properties[mol_plus]["peak_width"]
-                )
-                >= t
-            ):
+            elif (peak_start[mol_index] <= t) and (peak_end[mol_index] >= t):
                 # fragment all molecules in isolation and rt window
                 # check if molecule needs to be fragmented according to dynamic_exclusion rule
                 if (
-                    de_tracker.get(mol, None) is None
-                    or (t - de_tracker[mol]) > mzml_params["dynamic_exclusion"]
+                    np.isnan(de_tracker[mol_index])
+                    or (t - de_tracker[mol_index]) > mzml_params["dynamic_exclusion"]
                 ):
                     logger.debug("Generate Fragment spec")
-                    de_tracker[mol] = t
+                    de_tracker[mol_index] = t
                     if mol not in de_stats:
                         de_stats[mol] = {"frag_events": 0, "frag_spec_ids": []}
                     de_stats[mol]["frag_events"] += 1
                     de_stats[mol]["frag_spec_ids"].append(spec_id)
-                    peaks = fragmentor.fragment(all_mols_in_mz_and_rt_window)
+                    peaks = fragmentor.fragment_cached(all_mols_in_mz_and_rt_window)
                     frag_mz = peaks[:, 0]
                     frag_i = peaks[:, 1]
                     ms2_scan = Scan(
@@ -456,33 +1340,33 @@ def generate_scans(
                             "i": frag_i,
                             "rt": t,
                             "id": spec_id,
-                            "precursor_mz": mol_monoisotopic[mol]["mz"],
-                            "precursor_i": mol_monoisotopic[mol]["i"],
-                            "precursor_charge": peak_properties[mol]["charge"],
+                            "precursor_mz": ms1_peaks["precursor_mz"][position],
+                            "precursor_i": ms1_peaks["precursor_i"][position],
+                            "precursor_charge": int(
+                                ms1_peaks["precursor_charge"][position]
+                                or peak_charge[mol_index]
+                            ),
                             "precursor_scan_id": prec_scan_id,
                             "ms_level": 2,
                         }
                     )
                     spec_id += 1
-                    ms2_scan.i = rescale_intensity(
-                        ms2_scan.i, t, mol, peak_properties, isotopologue_lib
+                    ms2_scan.i = ms2_scan.i * elution_profiles.scale_factor(
+                        mol_index, scan_index
                     )
-                    ms2_scan = noise_injector.inject_noise(ms2_scan)
-                    ms2_scan.i *= 0.5
                 else:
                     logger.debug(f"Skip {mol} due to dynamic exclusion")
                     continue
-                t += ms_rt_diff
+                scan_index += 1
+                t = float(time_grid[scan_index])
                 progress_bar.update(ms_rt_diff)
-                if t > gradient_length:
-                    break
             else:
                 logger.debug(f"Skip {mol} since not in RT window")
                 continue
             if mol is not None:
                 mol_scan_dict[mol]["ms2_scans"].append(spec_id)
             if ms2_scan is None:
-                # there are molecules in mol_i
+                # there are molecules in ranked
                 # however all molecules are excluded from fragmentation_function
                 # => Don't do a scan and break the while loop
                 # => We should rather continue and try to fragment the next mol!
@@ -491,107 +1375,745 @@ def generate_scans(
             if (
                 len(ms2_scan.mz) > -1
             ):  # TODO -1 to also add empty ms2 specs; 0 breaks tests currently ....
-                sorting = ms2_scan.mz.argsort()
-                ms2_scan.mz = ms2_scan.mz[sorting]
-                ms2_scan.i = ms2_scan.i[sorting]
                 logger.debug(f"Append MS2 scan with {mol}")
-                scans[-1][1].append(ms2_scan)
+                ms2_scans.append(ms2_scan)
+            if t >= gradient_length:
+                break
+        yield s, ms2_scans, ms1_scan_index, candidates
     progress_bar.close()
     t1 = time.time()
     logger.info("Finished generating scans")
     logger.info(f"Generating scans took {t1-t0:.2f} seconds")
     logger.info(f"Found {chimeric_count} chimeric scans")
+    logger.info(
+        "Fragment cache: "
+        f"{fragmentor.fragment_cache_hits - fragment_cache_hits} hits, "
+        f"{fragmentor.fragment_cache_misses - fragment_cache_misses} misses"
+    )
 
-    return scans, mol_scan_dict
+
+def _inject_cycle_noise(
+    ms1_scan: Scan, ms2_scans: List[Scan], noise_injector: AbstractNoiseInjector
+) -> Tuple[Scan, List[Scan]]:
+    """Add noise to all scans of a duty cycle in scan order.
+
+    Args:
+        ms1_scan (Scan): MS1 scan
+        ms2_scans (List[Scan]): MS2 scans of ms1_scan
+        noise_injector (AbstractNoiseInjector): Description
+
+    Returns:
+        Tuple[Scan, List[Scan]]: noisy MS1 scan and its noisy MS2 scans
+    """
+    ms1_scan = noise_injector.inject_noise(ms1_scan)
+    for n, ms2_scan in enumerate(ms2_scans):
+        ms2_scan = noise_injector.inject_noise(ms2_scan)
+        ms2_scan.i *= 0.5
+        sorting = ms2_scan.mz.argsort()
+        ms2_scan.mz = ms2_scan.mz[sorting]
+        ms2_scan.i = ms2_scan.i[sorting]
+        ms2_scans[n] = ms2_scan
+    return ms1_scan, ms2_scans
+
+
+_ms1_worker_state: dict = {}
+
+
+def _init_ms1_worker(
+    stacked_lib: dict,
+    elution_profiles: ElutionProfiles,
+    min_intensity: float,
+    max_intensity: float,
+):
+    """Store the data shared by all MS1 chunks in the worker process."""
+    _ms1_worker_state["stacked_lib"] = stacked_lib
+    _ms1_worker_state["elution_profiles"] = elution_profiles
+    _ms1_worker_state["min_intensity"] = min_intensity
+    _ms1_worker_state["max_intensity"] = max_intensity
+
+
+def _generate_ms1_chunk(
+    slots: List[Tuple[int, np.ndarray]],
+) -> List[Tuple[np.ndarray, np.ndarray]]:
+    """Generate the merged MS1 peaks of all given scan slots.
+
+    Args:
+        slots (List[Tuple[int, np.ndarray]]): scan index and eluting molecules
+            of every MS1 scan
+
+    Returns:
+        List[Tuple[np.ndarray, np.ndarray]]: mz and i array of every MS1 scan
+    """
+    stacked_lib = _ms1_worker_state["stacked_lib"]
+    elution_profiles = _ms1_worker_state["elution_profiles"]
+    return [
+        merge_ms1_peaks(
+            stacked_lib,
+            candidates,
+            elution_profiles.scale_factors(candidates, scan_index),
+            _ms1_worker_state["min_intensity"],
+            _ms1_worker_state["max_intensity"],
+        )
+        for scan_index, candidates in slots
+    ]
+
+
+def _generate_scans_parallel(
+    cycles: Iterator[Tuple[Scan, List[Scan], int, np.ndarray]],
+    stacked_lib: dict,
+    elution_profiles: ElutionProfiles,
+    noise_injector: AbstractNoiseInjector,
+    mzml_params: dict,
+) -> Iterator[Tuple[Scan, List[Scan]]]:
+    """Generate the MS1 peaks of scheduled duty cycles in a process pool.
+
+    The gradient is split into chunks of rt_chunk_length seconds and the MS1
+    scans of every chunk are generated by one worker. Scheduling and dynamic
+    exclusion stay in the calling process and the chunks are yielded in scan
+    order. Noise is added after the MS1 peaks are known in the same order as
+    in a serial run, so the output is identical to n_processes = 1.
+
+    Args:
+        cycles (Iterator[Tuple[Scan, List[Scan], int, np.ndarray]]): duty cycles
+            without MS1 peaks, see _generate_scan_cycles
+        stacked_lib (dict): stacked isotopologue library, see stack_isotopologue_lib
+        elution_profiles (ElutionProfiles): elution profiles on the time grid
+        noise_injector (AbstractNoiseInjector): Description
+        mzml_params (dict): Description
+
+    Yields:
+        Tuple[Scan, List[Scan]]: MS1 scan and its MS2 scans
+
+    Raises:
+        ValueError: if rt_chunk_length is not positive
+    """
+    n_processes = int(mzml_params["n_processes"])
+    rt_chunk_length = float(mzml_params.get("rt_chunk_length", 60))
+    if rt_chunk_length <= 0:
+        raise ValueError(f"rt_chunk_length must be positive, got {rt_chunk_length}")
+    logger.info(
+        f"Generate MS1 scans with {n_processes} processes "
+        f"in chunks of {rt_chunk_length} seconds"
+    )
+    pending: Deque[Tuple[Future, list]] = deque()
+
+    def finish_chunk():
+        future, chunk = pending.popleft()
+        for (ms1_scan, ms2_scans, _, _), (mz, i) in zip(chunk, future.result()):
+            ms1_scan.mz = mz
+            ms1_scan.i = i
+            yield _inject_cycle_noise(ms1_scan, ms2_scans, noise_injector)
+
+    with ProcessPoolExecutor(
+        max_workers=n_processes,
+        initializer=_init_ms1_worker,
+        initargs=(
+            stacked_lib,
+            elution_profiles,
+            mzml_params["min_intensity"],
+            mzml_params.get("max_intensity", 1e10),
+        ),
+    ) as executor:
+        chunk: list = []
+        chunk_end = rt_chunk_length
+        for cycle in cycles:
+            if cycle[0].retention_time >= chunk_end and len(chunk) > 0:
+                slots = [
+                    (scan_index, candidates) for _, _, scan_index, candidates in chunk
+                ]
+                pending.append((executor.submit(_generate_ms1_chunk, slots), chunk))
+                chunk = []
+                # keep a bounded number of chunks in flight
+                if len(pending) > 2 * n_processes:
+                    yield from finish_chunk()
+            while cycle[0].retention_time >= chunk_end:
+                chunk_end += rt_chunk_length
+            chunk.append(cycle)
+        if len(chunk) > 0:
+            slots = [(scan_index, candidates) for _, _, scan_index, candidates in chunk]
+            pending.append((executor.submit(_generate_ms1_chunk, slots), chunk))
+        while len(pending) > 0:
+            yield from finish_chunk()
+
+
+class IsotopologueCache(object):
+    """Content addressed on-disk cache of isotope envelopes.
+
+    Every envelope (neutral mass and relative abundance of the isotopologues) is
+    stored as 2 x n float64 array in its own npy file, named by the sha1 of
+    chemical formula, pyqms version and pyqms parameters. Changing any of them
+    results in new cache entries, so stale entries are never returned. Envelopes
+    are charge independent, see isotopologue_lib_entry.
+    """
+
+    def __init__(self, cache_dir: Union[str, pathlib.Path]):
+        """Initialize cache.
+
+        Args:
+            cache_dir (Union[str, pathlib.Path]): directory of the cache files,
+                created if it does not exist
+        """
+        self.cache_dir = pathlib.Path(cache_dir)
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        import pyqms
+
+        self.params_key = f"{pyqms.__version__}\n{pformat(pyqms.params)}"
+        self.hits = 0
+        self.misses = 0
+
+    def _path(self, formula: str) -> pathlib.Path:
+        key = hashlib.sha1(f"{formula}\n{self.params_key}".encode()).hexdigest()
+        return self.cache_dir / key[:2] / f"{key[2:]}.npy"
+
+    def get(self, formula: str) -> Union[dict, None]:
+        """Load cached envelope.
+
+        Args:
+            formula (str): chemical formula
+
+        Returns:
+            Union[dict, None]: mass and i of the envelope, None if not cached
+        """
+        path = self._path(formula)
+        try:
+            mass, i = np.load(path)
+            entry = {"mass": mass, "i": i}
+        except FileNotFoundError:
+            self.misses += 1
+            return None
+        except Exception as e:
+            logger.warning(f"Ignore unreadable cache file {path}: {e}")
+            self.misses += 1
+            return None
+        self.hits += 1
+        return entry
+
+    def put(self, formula: str, mass: List[float], i: List[float]):
+        """Store envelope.
+
+        The file is written to a temporary path first and moved into place, so
+        concurrent runs sharing a cache never read partially written files.
+
+        Args:
+            formula (str): chemical formula
+            mass (List[float]): neutral mass of the isotopologues
+            i (List[float]): relative abundance of the isotopologues
+        """
+        path = self._path(formula)
+        path.parent.mkdir(exist_ok=True)
+        tmp_path = path.with_name(f"{path.stem}.{os.getpid()}.tmp")
+        with open(tmp_path, "wb") as fout:
+            np.save(fout, np.array([mass, i], dtype=np.float64))
+        os.replace(tmp_path, path)
+
+
+def calculate_isotope_envelopes(formulas: List[str]) -> Dict[str, dict]:
+    """Calculate the isotope envelopes of formulas with pyqms.
+
+    Args:
+        formulas (List[str]): unique chemical formulas
+
+    Returns:
+        Dict[str, dict]: neutral mass and relative abundance (i) of the
+            isotopologues per formula
+    """
+    import pyqms
+
+    lib = pyqms.IsotopologueLibrary(
+        molecules=formulas,
+        charges=[1],
+        verbose=False,
+    )
+    envelopes = {}
+    for mol in formulas:
+        formula = lib.lookup["molecule to formula"][mol]
+        data = lib[formula]["env"][(("N", "0.000"),)]
+        envelopes[mol] = {
+            "mass": np.asarray(data["mass"], dtype=float),
+            "i": np.asarray(data["relabun"], dtype=float),
+        }
+    return envelopes
+
+
+def get_charge_distribution(properties: dict) -> Dict[int, float]:
+    """Charge states of a molecule and their fraction of the total intensity.
+
+    Molecules can declare a charge state distribution in peak_properties,
+    e.g. {"charge_distribution": {2: 0.6, 3: 0.3, 4: 0.1}}, otherwise all
+    intensity is in charge state "charge".
+
+    Args:
+        properties (dict): peak properties of a molecule
+
+    Returns:
+        Dict[int, float]: fraction per charge, most abundant charge first
+    """
+    distribution = properties.get("charge_distribution", None)
+    if distribution is None:
+        return {int(properties["charge"]): 1.0}
+    return {
+        int(charge): float(fraction)
+        for charge, fraction in sorted(
+            distribution.items(), key=lambda x: x[1], reverse=True
+        )
+    }
+
+
+def isotopologue_lib_entry(
+    envelope: dict, charge_distribution: Dict[int, float]
+) -> dict:
+    """Isotopologue library entry of an envelope in one or more charge states.
+
+    The m/z of every charge state is derived from the neutral masses, so the
+    isotope pattern is only calculated once per formula. The envelopes of all
+    charge states are concatenated and their intensities scaled by the
+    fraction of the charge state.
+
+    Args:
+        envelope (dict): neutral mass and relative abundance (i) of the
+            isotopologues, see calculate_isotope_envelopes
+        charge_distribution (Dict[int, float]): fraction per charge state, see
+            get_charge_distribution
+
+    Returns:
+        dict: mz, i and charge of every peak
+    """
+    mass = envelope["mass"]
+    mz = np.concatenate(
+        [(mass + charge * PROTON) / charge for charge in charge_distribution]
+    )
+    i = np.concatenate(
+        [envelope["i"] * fraction for fraction in charge_distribution.values()]
+    )
+    charges = np.repeat(list(charge_distribution), len(mass))
+    return {"mz": mz.tolist(), "i": i.tolist(), "charge": charges.tolist()}
 
 
 # @profile
 def generate_molecule_isotopologue_lib(
-    peak_properties: Dict[str, dict],
+    peak_properties: Union[PeakTable, Dict[str, dict]],
     charges: List[int] = None,
     trivial_names: Dict[str, str] = None,
+    cache_dir: Union[str, pathlib.Path] = None,
+    n_processes: int = 1,
 ):
     """Summary.
 
+    The isotope pattern of every unique chemical formula is calculated once,
+    the m/z of all charge states of the molecules are derived from it, see
+    isotopologue_lib_entry. With n_processes > 1, the unique formulas are
+    sharded across a process pool.
+
     Args:
         molecules (TYPE): Description
+        charges (List[int], optional): not needed anymore, charges are taken
+            from peak_properties, kept for backwards compatibility
+        trivial_names (Dict[str, str], optional): not needed anymore, kept for
+            backwards compatibility
+        cache_dir (Union[str, pathlib.Path], optional): directory of an
+            IsotopologueCache, only envelopes not found in there are calculated
+        n_processes (int, optional): number of processes to calculate envelopes
     """
     logger.info("Generate Isotopolgue Library")
     start = time.time()
-    duplicate_formulas: Dict[str, List[str]] = {}
-    for key in peak_properties:
-        duplicate_formulas.setdefault(
-            peak_properties[key]["chemical_formula"], []
-        ).append(key)
-    if charges is None:
-        charges = [1]
-    if len(peak_properties) > 0:
-        molecules = [d["chemical_formula"] for d in peak_properties.values()]
-        lib = pyqms.IsotopologueLibrary(
-            molecules=molecules,
-            charges=charges,
-            verbose=False,
-            trivial_names=trivial_names,
+    formulas = list(
+        dict.fromkeys(props["chemical_formula"] for props in peak_properties.values())
+    )
+    envelopes = {}
+    if cache_dir is not None:
+        cache = IsotopologueCache(cache_dir)
+        for formula in formulas:
+            envelope = cache.get(formula)
+            if envelope is not None:
+                envelopes[formula] = envelope
+        formulas = [formula for formula in formulas if formula not in envelopes]
+        logger.info(f"Found {cache.hits} envelopes in cache, calculate {len(formulas)}")
+    if len(formulas) == 0:
+        calculated = {}
+    elif n_processes > 1 and len(formulas) > 1:
+        n_shards = min(len(formulas), 4 * n_processes)
+        shards = [formulas[n::n_shards] for n in range(n_shards)]
+        logger.info(
+            f"Calculate {len(formulas)} unique formulas in {n_shards} shards "
+            f"with {n_processes} processes"
         )
-        reduced_lib = {}
-        # TODO fix to  support multiple charge states
-        for mol in molecules:
-            formula = lib.lookup["molecule to formula"][mol]
-            data = lib[formula]["env"][(("N", "0.000"),)]
-            for triv in lib.lookup["formula to trivial name"][formula]:
-                reduced_lib[triv] = {
-                    "mz": data[peak_properties[triv]["charge"]]["mz"],
-                    "i": data["relabun"],
-                }
+        calculated = {}
+        with ProcessPoolExecutor(max_workers=n_processes) as executor:
+            for shard_envelopes in executor.map(calculate_isotope_envelopes, shards):
+                calculated.update(shard_envelopes)
     else:
-        reduced_lib = {}
-    tmp = {}
-    for mol in reduced_lib:
-        cc = peak_properties[mol]["chemical_formula"]
-        for triv in duplicate_formulas[cc]:
-            if triv not in reduced_lib:
-                tmp[triv] = reduced_lib[mol]
-    reduced_lib.update(tmp)
+        calculated = calculate_isotope_envelopes(formulas)
+    if cache_dir is not None:
+        for formula, envelope in calculated.items():
+            cache.put(formula, envelope["mass"], envelope["i"])
+    envelopes.update(calculated)
+    reduced_lib = {
+        mol: isotopologue_lib_entry(
+            envelopes[props["chemical_formula"]], get_charge_distribution(props)
+        )
+        for mol, props in peak_properties.items()
+    }
     logger.info(
         f"Generating IsotopologueLibrary took {(time.time() - start)/60} minutes"
     )
     return reduced_lib
 
 
+# compression name: (numpress codec, zlib after numpress, cv term)
+NUMPRESS_COMPRESSIONS = {
+    "numpress_linear": ("linear", False, "MS-Numpress linear prediction compression"),
+    "numpress_linear_zlib": (
+        "linear",
+        True,
+        "MS-Numpress linear prediction compression followed by zlib compression",
+    ),
+    "numpress_slof": ("slof", False, "MS-Numpress short logged float compression"),
+    "numpress_slof_zlib": (
+        "slof",
+        True,
+        "MS-Numpress short logged float compression followed by zlib compression",
+    ),
+    "numpress_pic": ("pic", False, "MS-Numpress positive integer compression"),
+    "numpress_pic_zlib": (
+        "pic",
+        True,
+        "MS-Numpress positive integer compression followed by zlib compression",
+    ),
+}
+
+
+class EncodedArray(object):
+    """Binary data array encoded for mzML.
+
+    Encoding is independent of the XML serialisation, so arrays can be
+    encoded in worker processes and passed to the writer instead of the raw
+    arrays.
+    """
+
+    __slots__ = ("data", "length", "params")
+
+    def __init__(self, data: bytes, length: int, params: List[str]):
+        """Initialize encoded array.
+
+        Args:
+            data (bytes): base64 encoded binary data
+            length (int): number of values in the array
+            params (List[str]): compression and data type cv terms
+        """
+        self.data = data
+        self.length = length
+        self.params = params
+
+    def __len__(self) -> int:
+        """Return number of values in the array.
+
+        Returns:
+            int: number of values
+        """
+        return self.length
+
+
+def encode_binary_array(
+    array: np.ndarray, encoding: int = 32, compression: str = "zlib"
+) -> EncodedArray:
+    """Pack, compress and base64 encode an array for mzML.
+
+    Args:
+        array (np.ndarray): array to encode
+        encoding (int, optional): float precision, 32 or 64, numpress
+            compressed arrays are always decoded to 64 bit
+        compression (str, optional): "none", "zlib" or one of
+            NUMPRESS_COMPRESSIONS
+
+    Returns:
+        EncodedArray: encoded array
+
+    Raises:
+        ValueError: if compression is unknown
+    """
+    from smiter.numpress import NUMPRESS_CODECS
+
+    if compression in NUMPRESS_COMPRESSIONS:
+        codec, use_zlib, compression_term = NUMPRESS_COMPRESSIONS[compression]
+        array = np.asarray(array, dtype=np.float64)
+        data = NUMPRESS_CODECS[codec](array)
+        encoding = 64
+    elif compression in ("none", "zlib"):
+        use_zlib = compression == "zlib"
+        compression_term = "zlib compression" if use_zlib else "no compression"
+        array = np.asarray(array, dtype=np.float32 if encoding == 32 else np.float64)
+        data = array.tobytes()
+    else:
+        raise ValueError(f"Unknown compression: {compression}")
+    if use_zlib:
+        data = zlib.compress(data)
+    return EncodedArray(
+        base64.standard_b64encode(data),
+        len(array),
+        [compression_term, f"{encoding}-bit float"],
+    )
+
+
+def _encode_cycles(
+    cycles: List[List[Tuple[np.ndarray, np.ndarray]]],
+    encoding: Dict[str, int],
+    compression: Dict[str, str],
+) -> List[List[Tuple[EncodedArray, EncodedArray]]]:
+    """Encode m/z and intensity arrays of all scans of duty cycles.
+
+    Args:
+        cycles (List[List[Tuple[np.ndarray, np.ndarray]]]): m/z and intensity
+            arrays of the MS1 and MS2 scans of every cycle
+        encoding (Dict[str, int]): float precision per array type
+        compression (Dict[str, str]): compression per array type
+
+    Returns:
+        List[List[Tuple[EncodedArray, EncodedArray]]]: encoded arrays
+    """
+    return [
+        [
+            (
+                encode_binary_array(
+                    mz, encoding["m/z array"], compression["m/z array"]
+                ),
+                encode_binary_array(
+                    i, encoding["intensity array"], compression["intensity array"]
+                ),
+            )
+            for mz, i in cycle
+        ]
+        for cycle in cycles
+    ]
+
+
+def _iter_encoded_cycles(
+    scans: Iterable[Tuple[Scan, List[Scan]]],
+    encoding: Dict[str, int],
+    compression: Dict[str, str],
+    n_processes: int = 1,
+    chunk_size: int = 64,
+) -> Iterator[Tuple[Scan, List[Scan], List[Tuple[EncodedArray, EncodedArray]]]]:
+    """Encode the arrays of scans ahead of the XML serialisation.
+
+    With n_processes > 1, chunks of chunk_size duty cycles are encoded in a
+    process pool while the previous chunks are written. Cycles are yielded in
+    input order, so the output does not depend on n_processes.
+
+    Args:
+        scans (Iterable[Tuple[Scan, List[Scan]]]): MS1 scans and their MS2 scans
+        encoding (Dict[str, int]): float precision per array type
+        compression (Dict[str, str]): compression per array type
+        n_processes (int, optional): number of encoding processes
+        chunk_size (int, optional): number of duty cycles per worker task
+
+    Yields:
+        Tuple[Scan, List[Scan], List[Tuple[EncodedArray, EncodedArray]]]: MS1
+            scan, its MS2 scans and the encoded arrays of all of them
+    """
+
+    def arrays(chunk):
+        return [[(s.mz, s.i) for s in [scan] + products] for scan, products in chunk]
+
+    if n_processes <= 1:
+        for scan, products in scans:
+            encoded = _encode_cycles(arrays([(scan, products)]), encoding, compression)
+            yield scan, products, encoded[0]
+        return
+
+    pending: Deque[Tuple[Future, list]] = deque()
+
+    def finish_chunk():
+        future, chunk = pending.popleft()
+        for (scan, products), encoded in zip(chunk, future.result()):
+            yield scan, products, encoded
+
+    with ProcessPoolExecutor(max_workers=n_processes) as executor:
+        chunk: list = []
+        for cycle in scans:
+            chunk.append(cycle)
+            if len(chunk) == chunk_size:
+                pending.append(
+                    (
+                        executor.submit(
+                            _encode_cycles, arrays(chunk), encoding, compression
+                        ),
+                        chunk,
+                    )
+                )
+                chunk = []
+                # keep a bounded number of chunks in flight
+                if len(pending) > 2 * n_processes:
+                    yield from finish_chunk()
+        if len(chunk) > 0:
+            pending.append(
+                (
+                    executor.submit(
+                        _encode_cycles, arrays(chunk), encoding, compression
+                    ),
+                    chunk,
+                )
+            )
+        while len(pending) > 0:
+            yield from finish_chunk()
+
+
+@functools.lru_cache(maxsize=None)
+def _mzml_writer_class(indexed: bool) -> type:
+    """Create a psims mzML writer supporting per array compression.
+
+    psims only knows zlib compression, so the writer is extended to accept a
+    dict mapping array type to compression, the MS-Numpress compressions in
+    NUMPRESS_COMPRESSIONS and arrays encoded beforehand as EncodedArray.
+
+    Args:
+        indexed (bool): subclass the indexed instead of the plain writer
+
+    Returns:
+        type: mzML writer class
+    """
+    from psims.mzml.writer import IndexedMzMLWriter, PlainMzMLWriter
+
+    class MzMLWriter(IndexedMzMLWriter if indexed else PlainMzMLWriter):
+        def _prepare_array(
+            self,
+            array,
+            encoding=32,
+            compression="zlib",
+            array_type=None,
+            default_array_length=None,
+        ):
+            if not isinstance(array, EncodedArray):
+                if isinstance(compression, dict):
+                    # intensity arrays come with their unit as dict
+                    name = (
+                        array_type["name"]
+                        if isinstance(array_type, dict)
+                        else array_type
+                    )
+                    compression = compression.get(name, "zlib")
+                if compression not in NUMPRESS_COMPRESSIONS:
+                    return super()._prepare_array(
+                        array,
+                        encoding=encoding,
+                        compression=compression,
+                        array_type=array_type,
+                        default_array_length=default_array_length,
+                    )
+                array = encode_binary_array(array, encoding, compression)
+            override_length = (
+                default_array_length is not None and len(array) != default_array_length
+            )
+            return self.BinaryDataArray(
+                self.Binary(array.data),
+                len(array.data),
+                array_length=len(array) if override_length else None,
+                params=[array_type] + array.params,
+            )
+
+    return MzMLWriter
+
+
 # @profile
 def write_scans(
-    file: Union[str, io.TextIOWrapper], scans: List[Tuple[Scan, List[Scan]]]
+    file: Union[str, io.TextIOWrapper],
+    scans: Iterable[Tuple[Scan, List[Scan]]],
+    spectrum_count: int = None,
+    indexed: bool = True,
+    mz_encoding: int = 64,
+    intensity_encoding: int = 32,
+    mz_compression: str = "zlib",
+    intensity_compression: str = "zlib",
+    n_processes: int = 1,
+    parquet_row_group_size: int = 1024,
 ) -> None:
     """Generate given scans to mzML file.
 
+    Scans are written as they are consumed, so scans can be streamed from a
+    generator like iter_scans. Since the spectrum count is part of the mzML
+    header, it needs to be passed if scans is not a list. Binary arrays are
+    encoded ahead of the XML serialisation, in a process pool if n_processes
+    is larger than 1.
+
+    Indexed mzML contains the byte offsets of all spectra and chromatograms,
+    recorded while streaming, so readers can seek to a spectrum by id.
+
+    If file is a path ending with .mzMLb, mzMLb is written instead, see
+    smiter.mzmlb. Data arrays are then stored in HDF5 datasets and compressed
+    by HDF5, MS-Numpress and n_processes are not supported. Paths ending with
+    .parquet are written as Parquet table with one row per spectrum, see
+    smiter.parquet, only the encodings are used then.
+
     Args:
         file (Union[str, io.TextIOWrapper]): Description
-        scans (List[Tuple[Scan, List[Scan]]]): Description
+        scans (Iterable[Tuple[Scan, List[Scan]]]): MS1 scans and their MS2 scans
+        spectrum_count (int, optional): total number of spectra in scans,
+            counted if not given
+        indexed (bool, optional): write indexedmzML instead of plain mzML
+        mz_encoding (int, optional): float precision of m/z arrays, 32 or 64
+        intensity_encoding (int, optional): float precision of intensity
+            arrays, 32 or 64
+        mz_compression (str, optional): "none", "zlib" or one of
+            NUMPRESS_COMPRESSIONS, numpress_linear is recommended for m/z
+        intensity_compression (str, optional): "none", "zlib" or one of
+            NUMPRESS_COMPRESSIONS, numpress_slof or numpress_pic are
+            recommended for intensities
+        n_processes (int, optional): number of processes encoding arrays
+        parquet_row_group_size (int, optional): number of spectra per row
+            group if Parquet is written
 
     Returns:
         None: Description
     """
     t0 = time.time()
     logger.info("Start writing Scans")
-    ms1_scans = len(scans)
+    if isinstance(file, str) and file.lower().endswith(".parquet"):
+        from smiter.parquet import write_scans_parquet
+
+        write_scans_parquet(
+            file,
+            scans,
+            row_group_size=parquet_row_group_size,
+            mz_encoding=mz_encoding,
+            intensity_encoding=intensity_encoding,
+        )
+        t1 = time.time()
+        logger.info(f"Writing Parquet took {(t1-t0)/60:.2f} minutes")
+        return
+    if spectrum_count is None:
+        scans = list(scans)
+        spectrum_count = len(scans) + sum([len(products) for _, products in scans])
+    ms1_scans = 0
     ms2_scans = 0
-    ms2_scan_list = []
-    for s in scans:
-        ms2_scans += len(s[1])
-        ms2_scan_list.append(len(s[1]))
-    logger.info("Write {0} MS1 and {1} MS2 scans".format(ms1_scans, ms2_scans))
     id_format_str = "controllerType=0 controllerNumber=1 scan={i}"
-    with MzMLWriter(file) as writer:
+    encoding = {"m/z array": mz_encoding, "intensity array": intensity_encoding}
+    compression = {
+        "m/z array": mz_compression,
+        "intensity array": intensity_compression,
+    }
+    if isinstance(file, str) and file.lower().endswith(".mzmlb"):
+        from smiter.mzmlb import MzMLbWriter
+
+        writer_class = MzMLbWriter
+        cycles = (
+            (scan, products, [(s.mz, s.i) for s in [scan] + products])
+            for scan, products in scans
+        )
+    else:
+        writer_class = _mzml_writer_class(indexed)
+        cycles = _iter_encoded_cycles(
+            scans, encoding, compression, n_processes=n_processes
+        )
+    with writer_class(file) as writer:
         # Add default controlled vocabularies
         writer.controlled_vocabularies()
-        writer.format()
         # Open the run and spectrum list sections
         time_array = []
         intensity_array = []
         with writer.run(id="Simulated Run"):
-            spectrum_count = len(scans) + sum([len(products) for _, products in scans])
             with writer.spectrum_list(count=spectrum_count):
-                for scan, products in scans:
+                for scan, products, encoded in cycles:
+                    ms1_scans += 1
+                    ms2_scans += len(products)
                     # Write Precursor scan
                     try:
                         index_of_max_i = np.argmax(scan.i)
@@ -602,9 +2124,10 @@ def write_scans(
                         max_i = 0
                     spec_tic = sum(scan.i)
                     writer.write_spectrum(
-                        scan.mz,
-                        scan.i,
+                        *encoded[0],
                         id=id_format_str.format(i=scan.id),
+                        encoding=encoding,
+                        compression=compression,
                         params=[
                             "MS1 Spectrum",
                             {"ms level": 1},
@@ -623,11 +2146,12 @@ def write_scans(
                     time_array.append(scan.retention_time)
                     intensity_array.append(spec_tic)
                     # Write MSn scans
-                    for prod in products:
+                    for prod, prod_encoded in zip(products, encoded[1:]):
                         writer.write_spectrum(
-                            prod.mz,
-                            prod.i,
+                            *prod_encoded,
                             id=id_format_str.format(i=prod.id),
+                            encoding=encoding,
+                            compression=compression,
                             params=[
                                 "MSn Spectrum",
                                 {"ms level": 2},
@@ -653,6 +2177,11 @@ def write_scans(
                     id="TIC",
                     chromatogram_type="total ion current",
                 )
+    if ms1_scans + ms2_scans != spectrum_count:
+        logger.warning(
+            f"Wrote {ms1_scans + ms2_scans} spectra, but expected {spectrum_count}"
+        )
+    logger.info("Wrote {0} MS1 and {1} MS2 scans".format(ms1_scans, ms2_scans))
     t1 = time.time()
     logger.info(f"Writing mzML took {(t1-t0)/60:.2f} minutes")
     return
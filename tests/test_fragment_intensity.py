@@ -0,0 +1,71 @@
+"""Summary."""
+import numpy as np
+import pytest
+
+from smiter.fragment_intensity import (
+    FlatIntensityModel,
+    IntensityTableModel,
+    PeptideIntensityModel,
+)
+from smiter.fragmentation_functions import (
+    NucleosideFragmentor,
+    PeptideFragmentorPyteomics,
+)
+
+
+def test_flat_intensity_model():
+    """Summary."""
+    fragger = PeptideFragmentorPyteomics(intensity_model=FlatIntensityModel(10))
+    peaks = fragger.fragment("PEPTIDEK")
+    assert (peaks[:, 1] == 10).all()
+
+
+def test_peptide_intensity_model():
+    """Summary."""
+    fragger = PeptideFragmentorPyteomics(
+        types=("b", "y"), maxcharge=2, intensity_model=PeptideIntensityModel()
+    )
+    peaks = fragger.fragment(["PEPTIDEK", "ELVISK"])
+    fragments = fragger._fragments(["PEPTIDEK", "ELVISK"])
+    assert np.array_equal(peaks[:, 0], fragments["mz"])
+    for peptide in ["PEPTIDEK", "ELVISK"]:
+        assert peaks[fragments["molecule"] == peptide, 1].max() == 100
+    # y6 of PEPTIDEK is cleaved N-terminal of proline
+    is_y = (fragments["ion_type"] == "y") & (fragments["charge"] == 1)
+    y_ions = peaks[is_y & (fragments["molecule"] == "PEPTIDEK"), 1]
+    assert y_ions[1] == y_ions.max()
+    # doubly charged fragments are weaker
+    assert (
+        peaks[fragments["charge"] == 2, 1] < peaks[fragments["charge"] == 1, 1]
+    ).all()
+
+    fragger.precompute(["PEPTIDEK", "ELVISK"])
+    assert np.array_equal(fragger.fragment(["PEPTIDEK", "ELVISK"]), peaks)
+
+    with pytest.raises(Exception):
+        NucleosideFragmentor(intensity_model=PeptideIntensityModel()).fragment(
+            "adenosine"
+        )
+
+
+def test_intensity_table_model(tmp_path):
+    """Summary."""
+    csv_file = tmp_path / "intensities.csv"
+    csv_file.write_text(
+        "molecule,mz,intensity\n"
+        "adenosine,136.0618,50\n"
+        "adenosine,119.0352,10\n"
+        "guanosine,152.0567,80\n"
+    )
+    model = IntensityTableModel.from_csv(str(csv_file), default_intensity=1)
+    fragger = NucleosideFragmentor(intensity_model=model)
+    peaks = fragger.fragment("adenosine")
+    expected_mzs = np.array([119.03522254717, 136.0617716478])
+    assert np.allclose(peaks[:, 0], expected_mzs)
+    assert np.array_equal(peaks[:, 1], [10, 50])
+    # fragments of molecules without table entries get the default intensity
+    peaks = fragger.fragment(["adenosine", "cytidine"])
+    assert np.isin([10, 50, 1], peaks[:, 1]).all()
+    peaks = fragger.fragment("guanosine")
+    assert peaks[np.argmin(np.abs(peaks[:, 0] - 152.0567)), 1] == 80
+    assert (np.sort(peaks[:, 1])[:-1] == 1).all()
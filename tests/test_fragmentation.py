@@ -1,14 +1,19 @@
 """Summary."""
 import os
+import sys
 import numpy as np
 import pytest
 
 import smiter
+import smiter.fragmentation_functions
 from smiter.fragmentation_functions import (
+    AbstractFragmentor,
     NucleosideFragmentor,
     PeptideFragmentor,
+    PeptideFragmentorPyteomics,
     LipidFragmentor,
 )
+from pyteomics import mass
 
 
 def test_fragment_peptide():
@@ -19,6 +24,40 @@ def test_fragment_peptide():
     assert ((peaks[:, 0] - expected_mzs) < 0.001).all()
 
 
+def test_fragment_peptide_precompute():
+    """Summary."""
+    fragger = PeptideFragmentor(charges=1, ions=["y"])
+    expected = fragger.fragment(["LL", "L"])
+    fragger.precompute(["L", "LL", "L"])
+    assert np.array_equal(fragger._precomputed_offsets, [0, 1, len(expected)])
+    assert np.array_equal(fragger.fragment(["LL", "L"]), expected)
+
+
+@pytest.mark.parametrize("types,maxcharge", [(("b", "y"), 1), (("a", "c", "z"), 2)])
+def test_fragment_peptide_pyteomics(types, maxcharge):
+    """Summary."""
+    peptide = "PEPTIDEK"
+    expected_mzs = []
+    for i in range(1, len(peptide) - 1):
+        for ion_type in types:
+            for charge in range(1, maxcharge + 1):
+                fragment = peptide[:i] if ion_type in "abc" else peptide[i:]
+                expected_mzs.append(
+                    mass.fast_mass(fragment, ion_type=ion_type, charge=charge)
+                )
+    fragger = PeptideFragmentorPyteomics(types=types, maxcharge=maxcharge)
+    peaks = fragger.fragment(peptide)
+    assert np.allclose(peaks[:, 0], expected_mzs, rtol=1e-12)
+    assert (peaks[:, 1] == 100).all()
+
+    fragger.precompute([peptide, "ELVISK", peptide])
+    assert np.array_equal(
+        fragger._precomputed_offsets,
+        [0, len(peaks), len(peaks) + 4 * len(types) * maxcharge],
+    )
+    assert np.array_equal(fragger.fragment([peptide, "SAM"])[: len(peaks)], peaks)
+
+
 def test_fragment_nucleotide():
     """Summary."""
     fragger = NucleosideFragmentor()
@@ -27,6 +66,71 @@ def test_fragment_nucleotide():
     assert ((peaks[:, 0] - expected_mzs) < 0.001).all()
 
 
+def test_fragment_cached():
+    """Summary."""
+
+    class CountingFragmentor(AbstractFragmentor):
+        def __init__(self):
+            self.calls = 0
+
+        def fragment(self, entities):
+            self.calls += 1
+            return np.array([(100.0 + len(e), 1.0) for e in entities])
+
+    fragger = CountingFragmentor()
+    fragger.fragment_cache_size = 2
+    peaks = fragger.fragment_cached(["ab", "c"])
+    peaks[:, 1] *= 10
+    # same molecules in a different order are a cache hit and return a copy
+    assert np.array_equal(fragger.fragment_cached(["c", "ab"]), [(102, 1), (101, 1)])
+    assert fragger.calls == 1
+    fragger.fragment_cached("d")
+    fragger.fragment_cached("e")
+    # ["ab", "c"] was evicted
+    fragger.fragment_cached(["ab", "c"])
+    assert fragger.calls == 4
+    assert fragger.fragment_cache_hits == 1
+    assert fragger.fragment_cache_misses == 4
+
+    fragger.fragment_cache_size = 0
+    fragger.fragment_cached("e")
+    assert fragger.calls == 5
+
+
+def test_nucleoside_fragment_table(tmp_path, monkeypatch):
+    """Summary."""
+    from smiter.ext.nucleoside_fragment_kb import KB_FRAGMENTATION_INFO
+
+    expected = smiter.fragmentation_functions.compile_nucleoside_fragment_kb(
+        KB_FRAGMENTATION_INFO
+    )
+    cache_dir = tmp_path / "cache"
+    monkeypatch.setenv("SMITER_CACHE_DIR", str(tmp_path / "user_cache"))
+    assert smiter.fragmentation_functions.user_cache_dir() == tmp_path / "user_cache"
+    monkeypatch.setattr(
+        smiter.fragmentation_functions, "_nucleoside_fragment_tables", {}
+    )
+    table = smiter.fragmentation_functions.load_nucleoside_fragment_table(cache_dir)
+    assert len(list(cache_dir.iterdir())) == 1
+    assert cache_dir.stat().st_mode & 0o077 == 0
+
+    # later loads use the compiled table
+    def fail(kb):
+        raise AssertionError("knowledge base compiled again")
+
+    monkeypatch.setattr(
+        smiter.fragmentation_functions, "compile_nucleoside_fragment_kb", fail
+    )
+    assert NucleosideFragmentor().nuc_to_fragments is table
+    monkeypatch.setattr(
+        smiter.fragmentation_functions, "_nucleoside_fragment_tables", {}
+    )
+    table = NucleosideFragmentor(cache_dir=cache_dir).nuc_to_fragments
+    assert list(table) == list(expected)
+    for nucleoside, mz in expected.items():
+        assert np.array_equal(table[nucleoside], mz)
+
+
 @pytest.mark.skip()
 def test_fragment_lipid():
     test_lipid_file = "test_lipids.txt"
@@ -37,3 +141,49 @@ def test_fragment_lipid():
     fragger = LipidFragmentor(test_lipid_file)
     masses = fragger.fragment("PC 18:0/12:0")
     assert np.allclose(masses, np.array([184.0733]))
+
+
+LIPID_CREATOR_STUB = """
+import sys
+
+_, mode, input_csv, output_csv = sys.argv
+with open(__file__ + ".calls", "a") as fout:
+    fout.write(mode + "\\n")
+with open(input_csv) as fin, open(output_csv, "w") as fout:
+    fout.write("PrecursorName,ProductMz\\n")
+    for lipid in fin.read().splitlines():
+        fout.write(f"{lipid},184.0733\\n{lipid},{100 + len(lipid)}\\n")
+"""
+
+
+def test_fragment_lipid_stub(tmp_path):
+    stub = tmp_path / "lipid_creator_stub.py"
+    stub.write_text(LIPID_CREATOR_STUB)
+    lipid_file = tmp_path / "lipids.txt"
+    lipid_file.write_text("PC 18:0/12:0\nPE 18:3;1-16:2")
+    kwargs = {
+        "cache_dir": tmp_path / "cache",
+        "lipid_creator_command": [sys.executable, str(stub)],
+    }
+
+    fragger = LipidFragmentor(str(lipid_file), **kwargs)
+    masses = fragger.fragment("PC 18:0/12:0")
+    assert np.allclose(masses, [(112, 1), (184.0733, 1)])
+    # second run is loaded from the cache
+    fragger = LipidFragmentor(str(lipid_file), **kwargs)
+    assert np.allclose(fragger.fragment("PE 18:3;1-16:2"), [(114, 1), (184.0733, 1)])
+    assert (tmp_path / "lipid_creator_stub.py.calls").read_text() == "transitionlist\n"
+    # cache files are transition tables
+    (cache_file,) = (tmp_path / "cache").iterdir()
+    fragger = LipidFragmentor(transition_table=str(cache_file))
+    assert np.allclose(fragger.fragment("PC 18:0/12:0"), masses)
+    # unknown lipids are calculated in one batch
+    fragger.lipid_creator_command = [sys.executable, str(stub)]
+    fragger.precompute(["PC 18:0/12:0", "PS 16:0/18:1", "PG 16:0/18:1"])
+    assert set(fragger.lip_to_fragments) == {
+        "PC 18:0/12:0",
+        "PE 18:3;1-16:2",
+        "PS 16:0/18:1",
+        "PG 16:0/18:1",
+    }
+    assert (tmp_path / "lipid_creator_stub.py.calls").read_text().count("\n") == 2
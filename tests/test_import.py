@@ -0,0 +1,59 @@
+"""Summary."""
+import subprocess
+import sys
+
+import pytest
+
+HEAVY_MODULES = ["pyqms", "psims", "scipy.stats", "pandas", "pyteomics"]
+
+IMPORT_BENCHMARK = """
+import sys
+import time
+
+t0 = time.perf_counter()
+import {module}
+t1 = time.perf_counter()
+print(t1 - t0)
+print(",".join(m for m in {heavy_modules!r} if m in sys.modules))
+"""
+
+
+def _import_in_subprocess(module):
+    result = subprocess.run(
+        [
+            sys.executable,
+            "-c",
+            IMPORT_BENCHMARK.format(module=module, heavy_modules=HEAVY_MODULES),
+        ],
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    duration, loaded = result.stdout.splitlines()[-2:]
+    return float(duration), [m for m in loaded.split(",") if m != ""]
+
+
+@pytest.mark.parametrize(
+    "module",
+    [
+        "smiter",
+        "smiter.synthetic_mzml",
+        "smiter.fragmentation_functions",
+        "smiter.noise_functions",
+    ],
+)
+def test_import_time(module):
+    """Importing smiter must not load the heavy dependencies."""
+    duration, loaded = _import_in_subprocess(module)
+    print(f"import {module} took {duration:.3f} seconds")
+    assert loaded == []
+
+
+def test_lazy_submodules():
+    """Summary."""
+    import smiter
+
+    assert "synthetic_mzml" in dir(smiter)
+    assert smiter.synthetic_mzml.write_mzml is not None
+    with pytest.raises(AttributeError):
+        smiter.does_not_exist
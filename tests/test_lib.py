@@ -4,9 +4,11 @@ import csv
 import os
 from tempfile import NamedTemporaryFile
 
+import numpy as np
 import pytest
 
 from smiter.lib import (
+    PeakTable,
     check_mzml_params,
     check_peak_properties,
     csv_to_peak_properties,
@@ -143,3 +145,49 @@ def test_peak_properties_to_csv():
     assert lines[1]["peak_width"] == "30"
     # default
     assert lines[0]["charge"] == "2"
+
+
+def test_peak_table_round_trip():
+    peak_properties = {
+        "uridine": {
+            "trivial_name": "uridine",
+            "chemical_formula": "+C(9)H(11)N(2)O(6)",
+            "charge": 2,
+            "scan_start_time": 10.0,
+            "peak_width": 30.0,
+            "peak_function": "gauss",
+            "peak_params": {"sigma": 2.0},
+            "peak_scaling_factor": 1e6,
+            "ionization_effiency": 1.0,
+        },
+        "adenosine": {
+            "trivial_name": "adenosine",
+            "chemical_formula": "+C(10)H(13)N(5)O(4)",
+            "charge": 1,
+            "scan_start_time": 12.0,
+            "peak_width": 20.0,
+            "peak_function": "gamma",
+            "peak_params": {"a": 3.0, "scale": 20.0},
+            "peak_scaling_factor": 1e3,
+            "ionization_effiency": 0.5,
+            "charge_distribution": {1: 0.8, 2: 0.2},
+        },
+    }
+    table = PeakTable.from_dict(peak_properties)
+    assert len(table) == 2
+    assert list(table) == ["uridine", "adenosine"]
+    assert "adenosine" in table
+    assert np.array_equal(table.ids(["adenosine", "uridine"]), [1, 0])
+    assert np.array_equal(table.scan_start_time, [10.0, 12.0])
+    assert np.array_equal(table.charge, [2, 1])
+    assert np.isnan(table.sigma[1])
+    assert table.to_dict() == peak_properties
+    assert table["adenosine"] == peak_properties["adenosine"]
+    assert check_peak_properties(table) is table
+
+
+def test_peak_table_missing_required():
+    with pytest.raises(Exception):
+        PeakTable.from_dict(
+            {"uridine": {"chemical_formula": "+C(9)H(11)N(2)O(6)", "peak_width": 30}}
+        )
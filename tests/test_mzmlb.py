@@ -0,0 +1,99 @@
+"""Summary."""
+from xml.etree import ElementTree
+
+import numpy as np
+import pytest
+
+from smiter.synthetic_mzml import Scan, write_scans
+
+h5py = pytest.importorskip("h5py")
+
+NS = {"mzml": "http://psi.hupo.org/ms/mzml"}
+
+
+def _scans():
+    rng = np.random.default_rng(42)
+    return [
+        (
+            Scan(
+                {
+                    "mz": np.sort(rng.uniform(100, 1600, 100)),
+                    "i": rng.uniform(100, 1e7, 100),
+                    "id": 2 * n + 1,
+                    "rt": n * 0.06,
+                    "ms_level": 1,
+                }
+            ),
+            [
+                Scan(
+                    {
+                        "mz": np.sort(rng.uniform(100, 1600, 10)),
+                        "i": rng.uniform(100, 1e5, 10),
+                        "id": 2 * n + 2,
+                        "rt": n * 0.06 + 0.03,
+                        "ms_level": 2,
+                        "precursor_mz": 500.0,
+                        "precursor_i": 1e5,
+                        "precursor_charge": 2,
+                    }
+                )
+            ],
+        )
+        for n in range(10)
+    ]
+
+
+def _read_arrays(h5, element):
+    arrays = {}
+    for array in element.iterfind(".//mzml:binaryDataArray", NS):
+        params = {
+            p.get("name"): p.get("value") for p in array.iterfind("mzml:cvParam", NS)
+        }
+        name = "m/z array" if "m/z array" in params else "intensity array"
+        offset = int(params["external offset"])
+        length = int(params["external array length"])
+        dataset = h5[params["external HDF5 dataset"]]
+        arrays[name] = dataset[offset : offset + length]
+    return arrays
+
+
+def test_write_scans_mzmlb(tmp_path):
+    """Summary."""
+    scans = _scans()
+    path = str(tmp_path / "test.mzMLb")
+    write_scans(path, scans)
+    with h5py.File(path, "r") as h5:
+        assert h5["mzML"].attrs["version"] == "mzMLb 1.0"
+        xml = h5["mzML"][:].tobytes()
+        offsets = h5["mzML_spectrumIndex"][:]
+        ids = h5["mzML_spectrumIndex_idRef"][:].tobytes().split(b"\x00")[:-1]
+        assert h5["mzML_chromatogramIndex_idRef"][:].tobytes() == b"TIC\x00"
+        spectra = [scan for cycle in scans for scan in [cycle[0]] + cycle[1]]
+        assert len(offsets) == len(ids) + 1 == len(spectra) + 1
+        for n, scan in enumerate(spectra):
+            assert xml[offsets[n] :].startswith(b"<spectrum ")
+            assert (
+                ids[n] == f"controllerType=0 controllerNumber=1 scan={scan.id}".encode()
+            )
+        # the last offset is the end of the last spectrum
+        assert xml[: offsets[-1]].endswith(b"</spectrum>")
+
+        elements = ElementTree.fromstring(xml).iterfind(".//mzml:spectrum", NS)
+        for scan, element in zip(spectra, elements):
+            arrays = _read_arrays(h5, element)
+            assert arrays["m/z array"].dtype == np.float64
+            assert np.array_equal(arrays["m/z array"], scan.mz)
+            assert arrays["intensity array"].dtype == np.float32
+            assert np.allclose(arrays["intensity array"], scan.i, rtol=1e-6)
+
+
+def test_write_scans_mzmlb_compression(tmp_path):
+    """Summary."""
+    scans = _scans()
+    path = str(tmp_path / "test.mzMLb")
+    write_scans(path, scans, mz_encoding=32, mz_compression="none")
+    with h5py.File(path, "r") as h5:
+        assert h5["spectrum_MS_1000514_float32"].compression is None
+        assert h5["spectrum_MS_1000515_float32"].compression == "gzip"
+    with pytest.raises(ValueError):
+        write_scans(path, scans, mz_compression="numpress_linear")
@@ -7,6 +7,7 @@ from smiter.noise_functions import (
     GaussNoiseInjector,
     UniformNoiseInjector,
     JamssNoiseInjector,
+    PPMShiftInjector,
 )
 from smiter.synthetic_mzml import Scan
 
@@ -234,3 +235,80 @@ def test_JamssNoiseInjector_intensity_noise_ms1():
     )
     noise_injector = JamssNoiseInjector(ppm_noise=5e-6, intensity_noise=0.4)
     scan = noise_injector.inject_noise(scan)
+
+
+@pytest.mark.parametrize(
+    "injector",
+    [
+        GaussNoiseInjector(variance=0.2, seed=1312),
+        UniformNoiseInjector(seed=1312),
+        PPMShiftInjector(offset=0, sigma=5e-6, seed=1312),
+        JamssNoiseInjector(seed=1312),
+    ],
+)
+def test_seeded_noise_per_scan_id(injector):
+    def make_scan(scan_id, ms_level):
+        return Scan(
+            {
+                "mz": np.array([100, 200, 300], dtype="float64"),
+                "i": np.array([1e6, 2e6, 3e6], dtype="float64"),
+                "id": scan_id,
+                "ms_level": ms_level,
+            }
+        )
+
+    forward = [injector.inject_noise(make_scan(n, 1 + n % 2)) for n in range(1, 5)]
+    np.random.seed(1)
+    backward = [
+        injector.inject_noise(make_scan(n, 1 + n % 2)) for n in reversed(range(1, 5))
+    ]
+    for a, b in zip(forward, reversed(backward)):
+        assert np.array_equal(a.mz, b.mz)
+        assert np.array_equal(a.i, b.i)
+    assert not np.array_equal(forward[0].mz, forward[2].mz)
+
+
+@pytest.mark.parametrize(
+    "injector_class, kwargs",
+    [
+        (GaussNoiseInjector, {"variance": 0.2}),
+        (UniformNoiseInjector, {}),
+        (PPMShiftInjector, {"offset": 0, "sigma": 5e-6}),
+        (JamssNoiseInjector, {}),
+    ],
+)
+def test_inject_noise_batch(injector_class, kwargs):
+    lengths = [3, 0, 4, 2]
+    ms_levels = np.array([1, 2, 2, 1])
+    scan_ids = np.array([1, 2, 3, 4])
+    offsets = np.r_[0, np.cumsum(lengths)]
+    mz = np.array([100, 200, 300, 150, 250, 350, 450, 500, 600], dtype="float64")
+    i = np.array([1e6, 2e6, 3e6, 4e5, 5e5, 6e5, 7e5, 8e4, 9e4], dtype="float64")
+
+    injector = injector_class(seed=1312, **kwargs)
+    batch_mz, batch_i, batch_offsets = injector.inject_noise_batch(
+        mz, i, offsets, ms_levels, scan_ids
+    )
+    for k in range(len(lengths)):
+        scan = injector.inject_noise(
+            Scan(
+                {
+                    "mz": mz[offsets[k] : offsets[k + 1]].copy(),
+                    "i": i[offsets[k] : offsets[k + 1]].copy(),
+                    "id": scan_ids[k],
+                    "ms_level": ms_levels[k],
+                }
+            )
+        )
+        start, end = batch_offsets[k], batch_offsets[k + 1]
+        assert np.array_equal(batch_mz[start:end], scan.mz)
+        assert np.array_equal(batch_i[start:end], scan.i)
+
+    # unseeded, drop all MSn peaks
+    injector = injector_class(**kwargs)
+    batch_mz, batch_i, batch_offsets = injector.inject_noise_batch(
+        mz, i, offsets, ms_levels, dropout=1.0
+    )
+    assert len(batch_mz) == len(batch_i) == batch_offsets[-1]
+    if injector_class is not JamssNoiseInjector:
+        assert list(np.diff(batch_offsets)) == [3, 0, 0, 2]
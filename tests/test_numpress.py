@@ -0,0 +1,65 @@
+"""Summary."""
+import numpy as np
+import pytest
+
+from smiter import numpress
+
+
+@pytest.mark.parametrize(
+    "values",
+    [
+        [0, 1, -1, 15, -16, -17, 2**31 - 1, -(2**31)],
+        [0x10000000, 0x0FFFFFFF, -0x10000001, 8, 0, 0],
+    ],
+)
+def test_encode_ints(values):
+    """Summary."""
+    half_bytes = numpress._encode_ints(np.array(values))
+    assert numpress._decode_ints(numpress._pack_half_bytes(half_bytes)) == values
+
+
+def test_encode_ints_reference():
+    """Summary."""
+    assert numpress._encode_ints(np.array([0])).tolist() == [8]
+    assert numpress._encode_ints(np.array([-1])).tolist() == [15, 15]
+    # no truncation if the leading half byte is neither 0 nor f
+    assert numpress._encode_ints(np.array([0x120CBC3A])).tolist() == [
+        0,
+        10,
+        3,
+        12,
+        11,
+        12,
+        0,
+        2,
+        1,
+    ]
+
+
+def test_linear():
+    """Summary."""
+    rng = np.random.default_rng(1)
+    mz = np.sort(rng.uniform(100, 1600, 1000))
+    encoded = numpress.encode_linear(mz)
+    assert len(encoded) < mz.nbytes / 2
+    assert np.allclose(numpress.decode_linear(encoded), mz, rtol=1e-9, atol=0)
+    for mz in [[], [500.0], [500.0, 501.0]]:
+        assert np.allclose(
+            numpress.decode_linear(numpress.encode_linear(mz)), mz, rtol=1e-9
+        )
+
+
+def test_slof():
+    """Summary."""
+    rng = np.random.default_rng(1)
+    i = np.append(rng.uniform(0, 1e9, 1000), 0)
+    decoded = numpress.decode_slof(numpress.encode_slof(i))
+    assert np.allclose(decoded, i, rtol=5e-4)
+    assert decoded[-1] == 0
+
+
+def test_pic():
+    """Summary."""
+    i = np.array([0, 0.4, 0.5, 1.5, 1e3, 1e9])
+    decoded = numpress.decode_pic(numpress.encode_pic(i))
+    assert np.array_equal(decoded, [0, 0, 1, 2, 1e3, 1e9])
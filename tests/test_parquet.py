@@ -0,0 +1,167 @@
+"""Summary."""
+import numpy as np
+import pytest
+
+from smiter.fragmentation_functions import AbstractFragmentor
+from smiter.noise_functions import GaussNoiseInjector
+from smiter.synthetic_mzml import Scan, write_mzml, write_scans
+
+pa = pytest.importorskip("pyarrow")
+pq = pytest.importorskip("pyarrow.parquet")
+
+
+class TestFragmentor(AbstractFragmentor):
+    def __init__(self):
+        pass
+
+    def fragment(self, mol):
+        return np.array([(200, 1e5)])
+
+
+def _scans():
+    rng = np.random.default_rng(42)
+    return [
+        (
+            Scan(
+                {
+                    "mz": np.sort(rng.uniform(100, 1600, 100)),
+                    "i": rng.uniform(100, 1e7, 100),
+                    "id": 2 * n + 1,
+                    "rt": n * 0.06,
+                    "ms_level": 1,
+                }
+            ),
+            [
+                Scan(
+                    {
+                        "mz": np.sort(rng.uniform(100, 1600, 10)),
+                        "i": rng.uniform(100, 1e5, 10),
+                        "id": 2 * n + 2,
+                        "rt": n * 0.06 + 0.03,
+                        "ms_level": 2,
+                        "precursor_mz": 500.0,
+                        "precursor_i": 1e5,
+                        "precursor_charge": 2,
+                        "precursor_scan_id": 2 * n + 1,
+                    }
+                )
+            ],
+        )
+        for n in range(10)
+    ]
+
+
+def test_write_scans_parquet(tmp_path):
+    """Summary."""
+    scans = _scans()
+    path = str(tmp_path / "test.parquet")
+    write_scans(path, scans)
+    table = pq.read_table(path)
+    spectra = [scan for cycle in scans for scan in [cycle[0]] + cycle[1]]
+    assert table.num_rows == len(spectra)
+    assert table.schema.field("mz").type == pa.list_(pa.float64())
+    assert table.schema.field("i").type == pa.list_(pa.float32())
+    rows = table.to_pylist()
+    for scan, row in zip(spectra, rows):
+        assert row["id"] == scan.id
+        assert row["rt"] == scan.rt
+        assert row["ms_level"] == scan.ms_level
+        assert np.array_equal(row["mz"], scan.mz)
+        assert np.allclose(row["i"], scan.i, rtol=1e-6)
+        assert row["precursor_mz"] == scan.precursor_mz
+        assert row["precursor_charge"] == scan.precursor_charge
+        assert row["precursor_scan_id"] == scan.precursor_scan_id
+    # MS1 spectra have no precursor
+    assert rows[0]["precursor_mz"] is None
+
+
+def test_parquet_row_groups(tmp_path):
+    """Summary."""
+    from smiter.parquet import ParquetScanWriter
+
+    scans = _scans()
+    path = str(tmp_path / "test.parquet")
+    with ParquetScanWriter(path, row_group_size=6, mz_encoding=32) as writer:
+        passed = list(writer.iter_write(scans))
+    assert passed == scans
+    metadata = pq.ParquetFile(path).metadata
+    assert metadata.num_rows == 20
+    assert metadata.num_row_groups == 4
+    assert pq.read_table(path).schema.field("mz").type == pa.list_(pa.float32())
+
+
+def test_write_mzml_parquet(tmp_path):
+    """Summary."""
+    peak_props = {
+        "inosine": {
+            "chemical_formula": "+C(10)H(12)N(4)O(5)",
+            "trivial_name": "inosine",
+            "charge": 2,
+            "scan_start_time": 0,
+            "peak_width": 30,  # seconds
+            "peak_function": "gauss",
+            "peak_params": {"sigma": 3},
+        }
+    }
+    mzml_params = {
+        "gradient_length": 5,
+        "parquet_file": str(tmp_path / "spectra.parquet"),
+        "parquet_row_group_size": 50,
+    }
+    write_mzml(
+        str(tmp_path / "test.mzML"),
+        peak_props,
+        TestFragmentor(),
+        GaussNoiseInjector(variance=0.05),
+        mzml_params,
+    )
+    metadata = pq.ParquetFile(tmp_path / "spectra.parquet").metadata
+    assert metadata.num_rows == 167
+    assert metadata.num_row_groups == 4
+    summary = pq.read_table(tmp_path / "molecule_summary.parquet").to_pylist()
+    assert summary[0]["trivial_name"] == "inosine"
+    assert summary[0]["peak_function"] == "gauss"
+    assert summary[0]["sigma"] == 3
+    assert summary[0]["a"] is None
+
+
+def test_write_mzml_parquet_only(tmp_path):
+    """Summary."""
+    mzml_params = {"gradient_length": 5, "parquet_row_group_size": 50}
+    write_mzml(
+        str(tmp_path / "test.parquet"),
+        {},
+        TestFragmentor(),
+        GaussNoiseInjector(variance=0.05),
+        mzml_params,
+    )
+    metadata = pq.ParquetFile(tmp_path / "test.parquet").metadata
+    assert metadata.num_rows == 167
+    assert metadata.num_row_groups == 4
+    assert (tmp_path / "molecule_summary.parquet").exists()
+
+
+class FailingNoiseInjector(GaussNoiseInjector):
+    def inject_noise(self, scan, *args, **kwargs):
+        if scan.id > 4:
+            raise RuntimeError("noise injection failed")
+        return super().inject_noise(scan, *args, **kwargs)
+
+
+def test_write_mzml_parquet_closed_on_error(tmp_path):
+    """The Parquet file is closed and readable if generating scans fails."""
+    mzml_params = {
+        "gradient_length": 5,
+        "parquet_file": str(tmp_path / "spectra.parquet"),
+        "parquet_row_group_size": 3,
+    }
+    with pytest.raises(RuntimeError):
+        write_mzml(
+            str(tmp_path / "test.mzML"),
+            {},
+            TestFragmentor(),
+            FailingNoiseInjector(variance=0.05),
+            mzml_params,
+        )
+    table = pq.read_table(tmp_path / "spectra.parquet")
+    assert table.column("id").to_pylist() == [1, 2, 3, 4]
@@ -1,4 +1,8 @@
 """Summary."""
+import numpy as np
+import pytest
+
+from smiter.peak_distribution import distributions, vectorized_distributions
 
 
 def test_gauss_dist():
@@ -9,3 +13,34 @@ def test_gauss_dist():
 def test_gamma_dist():
     """Summary."""
     pass
+
+
+@pytest.mark.parametrize(
+    "name, params",
+    [
+        ("gauss", {"mu": np.array([5.0, 15.0]), "sigma": np.array([1.0, 3.0])}),
+        ("gamma", {"a": np.array([3.0, 1.0]), "scale": np.array([2.0, 20.0])}),
+        (
+            "gauss_tail",
+            {
+                "mu": np.array([5.0, 15.0]),
+                "sigma": np.array([2.0, 2.0]),
+                "scan_start_time": np.array([2.0, 10.0]),
+            },
+        ),
+    ],
+)
+def test_vectorized_distribution_parity(name, params):
+    """Vectorized distributions match the scalar ones for every x and molecule."""
+    x = np.linspace(0, 30, 301)
+    n_mols = len(next(iter(params.values())))
+    # evaluate all molecules in one call
+    x_all = np.tile(x, n_mols)
+    params_all = {key: np.repeat(val, len(x)) for key, val in params.items()}
+    y_all = vectorized_distributions[name](x_all, **params_all)
+    expected = [
+        distributions[name](_x, **{key: val[m] for key, val in params.items()})
+        for m in range(n_mols)
+        for _x in x
+    ]
+    assert y_all == pytest.approx(np.array(expected, dtype=float), rel=1e-9, abs=1e-12)
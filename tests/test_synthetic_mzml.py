@@ -1,23 +1,40 @@
+import base64
+import re
+import zlib
 from tempfile import NamedTemporaryFile
+from xml.etree import ElementTree
 
 import numpy as np
 import pymzml
+import pyqms
 import pytest
 from scipy.signal import find_peaks
 from scipy.stats import kstest, normaltest
 
 import smiter
+from smiter import numpress
 from smiter.fragmentation_functions import (
     AbstractFragmentor,
     NucleosideFragmentor,
     PeptideFragmentor,
 )
+from smiter.lib import PROTON, PeakTable
 from smiter.noise_functions import GaussNoiseInjector, UniformNoiseInjector
 from smiter.synthetic_mzml import (
+    Scan,
+    ScanBlock,
+    generate_elution_profiles,
+    generate_elution_scheduler,
     generate_interval_tree,
     generate_molecule_isotopologue_lib,
+    generate_ms1_peaks,
+    generate_ms1_summaries,
     generate_scans,
+    generate_time_grid,
+    iter_scans,
+    stack_isotopologue_lib,
     write_mzml,
+    write_scans,
 )
 
 
@@ -619,3 +636,654 @@ def test_dynacmic_exclusion():
     assert number_fragment_specs == 1
 
     # breakpoint()
+
+
+def test_generate_ms1_peaks_merges_shared_mz():
+    iso_lib = {
+        "uridine": {"mz": [245.07, 246.07], "i": [1.0, 0.1]},
+        "pseudouridine": {"mz": [245.07, 246.07], "i": [1.0, 0.1]},
+        "inosine": {"mz": [269.09, 270.09], "i": [1.0, 0.01]},
+    }
+    stacked_lib = stack_isotopologue_lib(iso_lib)
+    peaks = generate_ms1_peaks(
+        stacked_lib,
+        np.array([0, 1, 2]),
+        np.array([2e3, 2e3, 1e4]),
+        min_intensity=100,
+        max_intensity=1e10,
+    )
+    # shared mz are summed up, inosine M+1 is below min_intensity
+    assert np.allclose(peaks["mz"], [245.07, 246.07, 269.09])
+    assert np.allclose(peaks["i"], [4e3, 4e2, 1e4])
+    assert list(peaks["molecules"]) == [0, 1, 2]
+    assert np.allclose(peaks["intensity_sum"], [2.2e3, 2.2e3, 1e4])
+    assert np.allclose(peaks["precursor_mz"], [245.07, 245.07, 269.09])
+
+
+def test_generate_ms1_peaks_no_candidates():
+    stacked_lib = stack_isotopologue_lib({})
+    peaks = generate_ms1_peaks(
+        stacked_lib,
+        np.array([], dtype=int),
+        np.array([]),
+        min_intensity=100,
+        max_intensity=1e10,
+    )
+    assert len(peaks["mz"]) == 0
+    assert len(peaks["i"]) == 0
+
+
+def test_generate_ms1_summaries():
+    """Summaries match the gathered, filtered and clipped peaks."""
+    rng = np.random.default_rng(5)
+    iso_lib = {}
+    for n in range(50):
+        n_peaks = int(rng.integers(1, 12))
+        i = rng.uniform(0, 1, n_peaks)
+        if n % 5 == 0:
+            # repeated highest peak
+            i[-1] = i.max()
+        iso_lib[f"mol_{n}"] = {
+            "mz": list(np.sort(rng.uniform(100, 1600, n_peaks))),
+            "i": list(i),
+            "charge": list(rng.integers(1, 4, n_peaks)),
+        }
+    stacked_lib = stack_isotopologue_lib(iso_lib)
+    candidates = np.arange(0, 50, 2)
+    scale_factors = rng.lognormal(7, 3, len(candidates))
+    summaries = generate_ms1_summaries(
+        stacked_lib, candidates, scale_factors, min_intensity=100, max_intensity=1e4
+    )
+    n = 0
+    for c, scale in zip(candidates, scale_factors):
+        envelope = iso_lib[f"mol_{c}"]
+        intensity = np.array(envelope["i"]) * scale
+        peaks = np.flatnonzero(intensity > 100)
+        if len(peaks) == 0:
+            assert c not in summaries["molecules"]
+            continue
+        clipped = np.minimum(intensity[peaks], 1e4)
+        highest = peaks[np.argmax(clipped)]
+        assert summaries["molecules"][n] == c
+        assert summaries["mono_mz"][n] == envelope["mz"][peaks[0]]
+        assert np.isclose(summaries["intensity_sum"][n], clipped.sum(), rtol=1e-12)
+        assert summaries["precursor_mz"][n] == np.round(envelope["mz"][highest], 6)
+        assert summaries["precursor_i"][n] == clipped.max()
+        assert summaries["precursor_charge"][n] == envelope["charge"][highest]
+        n += 1
+    assert len(summaries["molecules"]) == n
+
+
+def test_generate_elution_profiles():
+    peak_props = {
+        "uridine": {
+            "charge": 2,
+            "chemical_formula": "+C(9)H(11)N(2)O(6)",
+            "trivial_name": "uridine",
+            "scan_start_time": 1,
+            "peak_width": 5,  # seconds
+            "peak_function": "gauss",
+            "peak_params": {"sigma": 1},  # 10% of peak width,
+            "peak_scaling_factor": 1e3,
+        },
+        "inosine": {
+            "charge": 2,
+            "chemical_formula": "+C(10)H(12)N(4)O(5)",
+            "trivial_name": "inosine",
+            "scan_start_time": 3,
+            "peak_width": 5,  # seconds
+            "peak_function": "gamma",
+            "peak_params": {"a": 3, "scale": 1},
+            "peak_scaling_factor": 1e3,
+        },
+    }
+    time_grid = generate_time_grid(10, 0.03)
+    profiles = generate_elution_profiles(peak_props, ["uridine", "inosine"], time_grid)
+    # uridine elutes from 1 to 6 seconds, inosine from 3 to 8 seconds
+    for scan_index, eluting in [(20, []), (90, [0]), (180, [0, 1]), (250, [1])]:
+        rt = time_grid[scan_index]
+        expected = np.zeros(2)
+        for n in eluting:
+            mol = ["uridine", "inosine"][n]
+            expected[n] = smiter.synthetic_mzml.rescale_intensity(
+                1.0, rt, mol, peak_props, {}
+            )
+        assert np.allclose(
+            profiles.scale_factors(np.array([0, 1]), scan_index), expected
+        )
+
+
+def test_elution_scheduler():
+    peak_props = {
+        "uridine": {
+            "charge": 2,
+            "chemical_formula": "+C(9)H(11)N(2)O(6)",
+            "trivial_name": "uridine",
+            "scan_start_time": 0,
+            "peak_width": 5,  # seconds
+            "peak_function": "gauss",
+            "peak_params": {"sigma": 1},  # 10% of peak width,
+            "peak_scaling_factor": 1,
+        },
+        "pseudouridine": {
+            "charge": 2,
+            "chemical_formula": "+C(9)H(11)N(2)O(6)",
+            "trivial_name": "uridine",
+            "scan_start_time": 4,
+            "peak_width": 5,  # seconds
+            "peak_function": "gauss",
+            "peak_params": {"sigma": 1},  # 10% of peak width,
+            "peak_scaling_factor": 1,
+        },
+    }
+    molecules = ["uridine", "pseudouridine"]
+    time_grid = generate_time_grid(10, 0.5)
+    scheduler = generate_elution_scheduler(peak_props, molecules, time_grid)
+    tree = generate_interval_tree(peak_props)
+    for scan_index, t in enumerate(time_grid):
+        expected = sorted(molecules.index(entry.data) for entry in tree.at(t))
+        assert list(scheduler.advance(scan_index)) == expected
+    # time only moves forward
+    with pytest.raises(ValueError):
+        scheduler.advance(0)
+
+
+def test_scan_dict_access():
+    scan = Scan({"mz": np.array([100.0]), "i": np.array([1e5]), "id": 3, "rt": 1.5})
+    assert scan["rt"] == scan.retention_time == 1.5
+    assert scan.get("precursor_mz") is None
+    assert "precursor_mz" not in scan
+    assert sorted(scan.keys()) == ["i", "id", "mz", "rt"]
+    scan["ms_level"] = 2
+    assert scan.ms_level == 2
+    with pytest.raises(KeyError):
+        scan["precursor_mz"]
+    with pytest.raises(KeyError):
+        scan["unknown"] = 1
+    with pytest.raises(AttributeError):
+        scan.unknown = 1
+
+
+def test_scan_block():
+    scans = [
+        Scan(
+            {
+                "mz": np.array([100.0, 200.0, 300.0]),
+                "i": np.array([1e5, 2e5, 3e5]),
+                "id": 1,
+                "rt": 0.0,
+                "ms_level": 1,
+            }
+        ),
+        Scan(
+            {
+                "mz": np.array([150.0]),
+                "i": np.array([1e4]),
+                "id": 2,
+                "rt": 0.03,
+                "ms_level": 2,
+                "precursor_mz": 200.0,
+                "precursor_i": 2e5,
+                "precursor_charge": 2,
+                "precursor_scan_id": 1,
+            }
+        ),
+        Scan({"mz": np.array([]), "i": np.array([]), "id": 3, "ms_level": 1}),
+    ]
+    block = ScanBlock.from_scans(scans)
+    assert len(block) == 3
+    assert np.array_equal(block.offsets, [0, 3, 4, 4])
+    for scan, unpacked in zip(scans, block):
+        assert dict(scan.items()).keys() == dict(unpacked.items()).keys()
+        assert np.array_equal(scan.mz, unpacked.mz)
+        assert np.array_equal(scan.i, unpacked.i)
+        assert scan.precursor_charge == unpacked.precursor_charge
+        assert scan.retention_time == unpacked.retention_time
+
+    injector = GaussNoiseInjector(variance=0.05, seed=1)
+    noisy = block.inject_noise(injector)
+    for scan, noisy_scan in zip(scans, noisy):
+        expected = injector.inject_noise(
+            Scan(
+                {
+                    "mz": scan.mz.copy(),
+                    "i": scan.i.copy(),
+                    "id": scan.id,
+                    "ms_level": scan.ms_level,
+                }
+            )
+        )
+        assert np.array_equal(expected.mz, noisy_scan.mz)
+        assert np.array_equal(expected.i, noisy_scan.i)
+        assert noisy_scan.precursor_mz == scan.precursor_mz
+
+
+def test_write_scans_streaming():
+    tempfile = NamedTemporaryFile("wb")
+    peak_props = {
+        "uridine": {
+            "charge": 2,
+            "chemical_formula": "+C(9)H(11)N(2)O(6)",
+            "trivial_name": "uridine",
+            "scan_start_time": 0,
+            "peak_width": 5,
+            "peak_function": "gauss",
+            "peak_params": {"sigma": 1},
+            "peak_scaling_factor": 1e5,
+        }
+    }
+    mzml_params = {
+        "gradient_length": 5,
+        "min_intensity": 100,
+        "isolation_window_width": 0.5,
+        "ion_target": 3e6,
+        "ms_rt_diff": 0.03,
+        "dynamic_exclusion": 0.5,
+    }
+    trivial_names = {"+C(9)H(11)N(2)O(6)": "uridine"}
+    isotopologue_lib = generate_molecule_isotopologue_lib(
+        peak_props, [2], trivial_names
+    )
+    scans, mol_scan_dict = generate_scans(
+        isotopologue_lib, peak_props, None, fragmentor, noise_injector, mzml_params
+    )
+    time_grid = generate_time_grid(5, 0.03)
+    spectrum_count = int((time_grid < 5).sum())
+    assert len(scans) + sum(len(ms2) for _, ms2 in scans) == spectrum_count
+
+    write_scans(
+        tempfile.name,
+        iter_scans(
+            isotopologue_lib, peak_props, None, fragmentor, noise_injector, mzml_params
+        ),
+        spectrum_count=spectrum_count,
+    )
+    reader = pymzml.run.Reader(tempfile.name)
+    assert reader.get_spectrum_count() == spectrum_count
+    ms_levels = [spec.ms_level for spec in reader]
+    assert len(ms_levels) == spectrum_count
+    assert ms_levels == [scan.ms_level for ms1, ms2 in scans for scan in [ms1] + ms2]
+
+
+@pytest.mark.parametrize("indexed", [True, False])
+def test_write_scans_index(tmp_path, indexed):
+    scans = [
+        (
+            Scan(
+                {
+                    "mz": np.array([100.0, 200.0]),
+                    "i": np.array([1e5, 2e5]),
+                    "id": 2 * n + 1,
+                    "rt": n * 0.06,
+                    "ms_level": 1,
+                }
+            ),
+            [
+                Scan(
+                    {
+                        "mz": np.array([50.0]),
+                        "i": np.array([1e3]),
+                        "id": 2 * n + 2,
+                        "rt": n * 0.06 + 0.03,
+                        "ms_level": 2,
+                        "precursor_mz": 200.0,
+                        "precursor_i": 2e5,
+                        "precursor_charge": 2,
+                    }
+                )
+            ],
+        )
+        for n in range(5)
+    ]
+    path = tmp_path / "index.mzML"
+    write_scans(str(path), scans, indexed=indexed)
+    content = path.read_bytes()
+    offsets = re.findall(rb'<offset idRef="([^"]+)">(\d+)</offset>', content)
+    if not indexed:
+        assert b"<indexedmzML" not in content
+        assert offsets == []
+        return
+    assert len(offsets) == 10 + 1
+    for id_ref, offset in offsets:
+        element = content[int(offset) :].split(b">", 1)[0]
+        assert element.startswith((b"<spectrum ", b"<chromatogram "))
+        assert b'id="' + id_ref + b'"' in element
+    reader = pymzml.run.Reader(str(path))
+    assert reader[8].ms_level == 2
+
+
+@pytest.mark.parametrize(
+    "settings",
+    [
+        {},
+        {"mz_compression": "none", "intensity_compression": "none"},
+        {"mz_encoding": 32, "intensity_encoding": 64},
+        {
+            "mz_compression": "numpress_linear",
+            "intensity_compression": "numpress_slof_zlib",
+        },
+        {
+            "mz_compression": "numpress_linear_zlib",
+            "intensity_compression": "numpress_pic",
+        },
+    ],
+)
+def test_write_scans_compression(tmp_path, settings):
+    rng = np.random.default_rng(42)
+    scans = [
+        (
+            Scan(
+                {
+                    "mz": np.sort(rng.uniform(100, 1600, 200)),
+                    "i": rng.uniform(100, 1e7, 200),
+                    "id": n + 1,
+                    "rt": n * 0.06,
+                    "ms_level": 1,
+                }
+            ),
+            [],
+        )
+        for n in range(3)
+    ]
+    path = tmp_path / "compressed.mzML"
+    write_scans(str(path), scans, **settings)
+    ns = {"mzml": "http://psi.hupo.org/ms/mzml"}
+    spectra = ElementTree.parse(path).getroot().iter(f"{{{ns['mzml']}}}spectrum")
+    for (scan, _), spectrum in zip(scans, spectra):
+        arrays = {}
+        for array in spectrum.iterfind(".//mzml:binaryDataArray", ns):
+            names = [p.get("name") for p in array.iterfind("mzml:cvParam", ns)]
+            data = base64.b64decode(array.find("mzml:binary", ns).text)
+            if "zlib" in " ".join(names):
+                data = zlib.decompress(data)
+            if any("Numpress" in name for name in names):
+                codec = names[1].split()[1]
+                decode = {
+                    "linear": numpress.decode_linear,
+                    "short": numpress.decode_slof,
+                    "positive": numpress.decode_pic,
+                }[codec]
+                arrays[names[0]] = decode(data)
+            else:
+                dtype = np.float32 if "32-bit float" in names else np.float64
+                arrays[names[0]] = np.frombuffer(data, dtype=dtype)
+        assert np.allclose(arrays["m/z array"], scan.mz, rtol=1e-6, atol=0)
+        assert np.allclose(arrays["intensity array"], scan.i, rtol=1e-3, atol=0.5)
+    with pytest.raises(ValueError):
+        write_scans(str(path), scans, mz_compression="bz2")
+
+
+def test_write_scans_encoding_pool(tmp_path):
+    rng = np.random.default_rng(42)
+    scans = [
+        (
+            Scan(
+                {
+                    "mz": np.sort(rng.uniform(100, 1600, 100)),
+                    "i": rng.uniform(100, 1e7, 100),
+                    "id": 2 * n + 1,
+                    "rt": n * 0.06,
+                    "ms_level": 1,
+                }
+            ),
+            [
+                Scan(
+                    {
+                        "mz": np.sort(rng.uniform(100, 1600, 10)),
+                        "i": rng.uniform(100, 1e5, 10),
+                        "id": 2 * n + 2,
+                        "rt": n * 0.06 + 0.03,
+                        "ms_level": 2,
+                        "precursor_mz": 500.0,
+                        "precursor_i": 1e5,
+                        "precursor_charge": 2,
+                    }
+                )
+            ],
+        )
+        for n in range(10)
+    ]
+    encoding = {"m/z array": 64, "intensity array": 32}
+    compression = {"m/z array": "numpress_linear", "intensity array": "zlib"}
+    iter_encoded_cycles = smiter.synthetic_mzml._iter_encoded_cycles
+    serial = list(iter_encoded_cycles(scans, encoding, compression))
+    pooled = list(
+        iter_encoded_cycles(
+            iter(scans), encoding, compression, n_processes=2, chunk_size=3
+        )
+    )
+    assert len(pooled) == len(scans)
+    for (scan, products, encoded), (pooled_scan, _, pooled_encoded) in zip(
+        serial, pooled
+    ):
+        assert pooled_scan is scan
+        assert [(mz.data, i.data) for mz, i in encoded] == [
+            (mz.data, i.data) for mz, i in pooled_encoded
+        ]
+    write_scans(str(tmp_path / "serial.mzML"), scans)
+    write_scans(str(tmp_path / "pooled.mzML"), scans, n_processes=2)
+    assert (tmp_path / "serial.mzML").read_bytes() == (
+        tmp_path / "pooled.mzML"
+    ).read_bytes()
+
+
+def test_generate_scans_parallel():
+    peak_props = {
+        f"mol{n}": {
+            "charge": 2,
+            "chemical_formula": formula,
+            "trivial_name": f"mol{n}",
+            "scan_start_time": 2 * n,
+            "peak_width": 6,
+            "peak_function": "gauss",
+            "peak_params": {"sigma": 1},
+            "peak_scaling_factor": 1e5,
+        }
+        for n, formula in enumerate(
+            ["+C(9)H(11)N(2)O(6)", "+C(10)H(12)N(4)O(5)", "+C(10)H(13)N(5)O(4)"]
+        )
+    }
+    trivial_names = {v["chemical_formula"]: k for k, v in peak_props.items()}
+    isotopologue_lib = generate_molecule_isotopologue_lib(
+        peak_props, [2], trivial_names
+    )
+    mzml_params = {
+        "gradient_length": 10,
+        "min_intensity": 100,
+        "isolation_window_width": 0.5,
+        "ion_target": 3e6,
+        "ms_rt_diff": 0.03,
+        "dynamic_exclusion": 1,
+        "rt_chunk_length": 1.5,
+    }
+    np.random.seed(1312)
+    serial, _ = generate_scans(
+        isotopologue_lib,
+        peak_props,
+        None,
+        fragmentor,
+        noise_injector,
+        dict(mzml_params, n_processes=1),
+    )
+    np.random.seed(1312)
+    parallel, _ = generate_scans(
+        isotopologue_lib,
+        peak_props,
+        None,
+        fragmentor,
+        noise_injector,
+        dict(mzml_params, n_processes=2),
+    )
+    assert len(serial) == len(parallel)
+    for (ms1_a, ms2_a), (ms1_b, ms2_b) in zip(serial, parallel):
+        assert ms1_a.id == ms1_b.id
+        assert np.array_equal(ms1_a.mz, ms1_b.mz)
+        assert np.array_equal(ms1_a.i, ms1_b.i)
+        assert [s.id for s in ms2_a] == [s.id for s in ms2_b]
+        for a, b in zip(ms2_a, ms2_b):
+            assert np.array_equal(a.i, b.i)
+    with pytest.raises(ValueError):
+        generate_scans(
+            isotopologue_lib,
+            peak_props,
+            None,
+            fragmentor,
+            noise_injector,
+            dict(mzml_params, n_processes=2, rt_chunk_length=0),
+        )
+
+
+def test_generate_scans_peak_table():
+    peak_props = {
+        f"mol{n}": {
+            "charge": 2,
+            "chemical_formula": formula,
+            "trivial_name": f"mol{n}",
+            "scan_start_time": 2 * n,
+            "peak_width": 6,
+            "peak_function": function,
+            "peak_params": params,
+            "peak_scaling_factor": 1e5,
+        }
+        for n, (formula, function, params) in enumerate(
+            [
+                ("+C(9)H(11)N(2)O(6)", "gauss", {"sigma": 1}),
+                ("+C(10)H(12)N(4)O(5)", "gamma", {"a": 3, "scale": 1}),
+                ("+C(10)H(13)N(5)O(4)", "gauss_tail", {}),
+            ]
+        )
+    }
+    isotopologue_lib = generate_molecule_isotopologue_lib(peak_props)
+    mzml_params = {
+        "gradient_length": 10,
+        "min_intensity": 100,
+        "isolation_window_width": 0.5,
+        "ion_target": 3e6,
+        "ms_rt_diff": 0.03,
+        "dynamic_exclusion": 1,
+    }
+    np.random.seed(1312)
+    from_dict, _ = generate_scans(
+        isotopologue_lib, peak_props, None, fragmentor, noise_injector, mzml_params
+    )
+    np.random.seed(1312)
+    from_table, _ = generate_scans(
+        isotopologue_lib,
+        PeakTable.from_dict(peak_props),
+        None,
+        fragmentor,
+        noise_injector,
+        mzml_params,
+    )
+    assert len(from_dict) == len(from_table)
+    for (ms1_a, ms2_a), (ms1_b, ms2_b) in zip(from_dict, from_table):
+        assert np.array_equal(ms1_a.mz, ms1_b.mz)
+        assert np.array_equal(ms1_a.i, ms1_b.i)
+        assert [s.id for s in ms2_a] == [s.id for s in ms2_b]
+        for a, b in zip(ms2_a, ms2_b):
+            assert np.array_equal(a.i, b.i)
+            assert a.precursor_charge == b.precursor_charge
+
+
+def test_generate_molecule_isotopologue_lib_cache(tmp_path, monkeypatch):
+    peak_props = {
+        "uridine": {
+            "charge": 2,
+            "chemical_formula": "+C(9)H(11)N(2)O(6)",
+            "trivial_name": "uridine",
+            "scan_start_time": 0,
+            "peak_width": 5,
+        },
+        "pseudouridine": {
+            "charge": 2,
+            "chemical_formula": "+C(9)H(11)N(2)O(6)",
+            "trivial_name": "pseudouridine",
+            "scan_start_time": 5,
+            "peak_width": 5,
+        },
+    }
+    trivial_names = {"+C(9)H(11)N(2)O(6)": "uridine"}
+    lib = generate_molecule_isotopologue_lib(peak_props, [2], trivial_names)
+    cached_lib = generate_molecule_isotopologue_lib(
+        peak_props, [2], trivial_names, cache_dir=tmp_path
+    )
+    assert cached_lib == lib
+    # second run is served from the cache without calculating isotopologues
+    monkeypatch.setattr(pyqms, "IsotopologueLibrary", None)
+    cached_lib = generate_molecule_isotopologue_lib(
+        peak_props, [2], trivial_names, cache_dir=tmp_path
+    )
+    assert cached_lib == lib
+
+
+def test_generate_molecule_isotopologue_lib_parallel():
+    formulas = [
+        "+C(9)H(11)N(2)O(6)",
+        "+C(10)H(12)N(4)O(5)",
+        "+C(10)H(13)N(5)O(4)",
+        "+C(9)H(11)N(2)O(6)",
+    ]
+    peak_props = {
+        f"mol{n}": {
+            "charge": 1 + n % 2,
+            "chemical_formula": formula,
+            "trivial_name": f"mol{n}",
+            "scan_start_time": 0,
+            "peak_width": 5,
+        }
+        for n, formula in enumerate(formulas)
+    }
+    lib = generate_molecule_isotopologue_lib(peak_props, [1, 2])
+    parallel_lib = generate_molecule_isotopologue_lib(peak_props, [1, 2], n_processes=2)
+    assert list(lib) == list(peak_props)
+    assert list(parallel_lib) == list(lib)
+    for mol in lib:
+        assert np.allclose(parallel_lib[mol]["mz"], lib[mol]["mz"])
+        assert np.allclose(parallel_lib[mol]["i"], lib[mol]["i"])
+    # same formula, different charges
+    assert lib["mol0"]["i"] == lib["mol3"]["i"]
+    assert np.isclose(lib["mol0"]["mz"][0], lib["mol3"]["mz"][0] * 2 - PROTON)
+
+
+def test_generate_molecule_isotopologue_lib_charge_distribution():
+    peak_props = {
+        "uridine": {
+            "charge": 2,
+            "chemical_formula": "+C(9)H(11)N(2)O(6)",
+            "trivial_name": "uridine",
+            "scan_start_time": 0,
+            "peak_width": 5,
+        },
+        "uridine_z3": {
+            "charge": 3,
+            "chemical_formula": "+C(9)H(11)N(2)O(6)",
+            "trivial_name": "uridine_z3",
+            "scan_start_time": 0,
+            "peak_width": 5,
+        },
+        "uridine_multi": {
+            "charge": 2,
+            "charge_distribution": {2: 0.25, 3: 0.75},
+            "chemical_formula": "+C(9)H(11)N(2)O(6)",
+            "trivial_name": "uridine_multi",
+            "scan_start_time": 0,
+            "peak_width": 5,
+        },
+    }
+    lib = generate_molecule_isotopologue_lib(peak_props)
+    n_peaks = len(lib["uridine"]["mz"])
+    multi = lib["uridine_multi"]
+    # most abundant charge state first
+    assert multi["charge"] == [3] * n_peaks + [2] * n_peaks
+    assert multi["mz"] == lib["uridine_z3"]["mz"] + lib["uridine"]["mz"]
+    assert np.allclose(
+        multi["i"],
+        np.concatenate(
+            (np.array(lib["uridine"]["i"]) * 0.75, np.array(lib["uridine"]["i"]) * 0.25)
+        ),
+    )
+
+    stacked_lib = stack_isotopologue_lib(lib, ["uridine_multi"])
+    ms1_peaks = generate_ms1_peaks(stacked_lib, np.array([0]), np.array([1e6]), 0, 1e10)
+    assert ms1_peaks["precursor_charge"][0] == 3
+    assert np.isclose(ms1_peaks["precursor_mz"][0], lib["uridine_z3"]["mz"][0])